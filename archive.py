@@ -0,0 +1,406 @@
+"""
+archive.py
+
+冷热分层：把超过保留期的帖子 / 评论从 Mongo 移到本地压缩文件，Mongo 只保留近期数据，工作集重新装进 WiredTiger 缓存。
+- 归档按 post_ts / comment_ts（见 backfill_ts.py；没有该字段的文档不会被归档）升序流式读取，
+  按 股票 + 月份 写入 {archive_dir}/{kind}/{symbol}/{YYYY-MM}.{运行时间戳}.{格式}：
+  - jsonl.gz / jsonl.zst（默认 jsonl.gz）：每行一个 Extended JSON 文档，可用 backup.py restore 无损写回 Mongo；
+  - parquet：需要 pyarrow（pip install pyarrow），按固定列写出、_id 转为字符串、嵌套字段存为 JSON 文本，
+    适合直接用 pandas / DuckDB 分析，但不能无损恢复；因此同时写一份同名的 jsonl.gz，读取与恢复都以它为准。
+  每个月份文件先写 *.part，完成后改名（parquet 时两个文件都完成），之后才按 _id 分批删除 Mongo 中已写入的文档
+  （删除条件同时带上时间上限）。
+  中途中断最多留下未改名的 *.part 与尚未删除的文档，重新运行即可；同一月份多次归档会生成多个文件，读取时一并读取。
+- 可选 TTL 索引（--ttl-days）：由 Mongo 后台直接删除超过期限的文档、不写归档，作为归档任务之外的兜底；
+  期限应长于归档保留期，否则数据会在归档前被删除。TTL 按 UTC 解释 naive datetime，与北京时间相差 8 小时，按天计的期限可忽略。
+- 读取：iter_docs() / `python archive.py query` 按时间窗口先读归档文件、再读 Mongo，调用方不需要关心数据在哪一层。
+
+示例：
+    python archive.py archive --older-than-days 180                         # 全部股票的帖子与评论
+    python archive.py archive --kind comment --symbols 000333 --older-than-days 90 --format parquet --dry-run
+    python archive.py query --kind comment --symbol 000333 --start 2024-01-01 --end 2024-02-01 --count
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import datetime
+from typing import Iterator, List, Optional
+
+from bson import json_util
+from pymongo import MongoClient
+
+from mongodb import KIND_COLLECTIONS, clear_change_caches, symbol_collection, storage_layout
+from backup import open_write, read_docs, _JSON_OPTIONS
+from backfill_ts import TS_FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _has_pyarrow = True
+except Exception:
+    _has_pyarrow = False
+
+logger = logging.getLogger("archive")
+
+ARCHIVE_FORMATS = ("jsonl.gz", "jsonl.zst", "parquet")
+ARCHIVE_DIR_ENV = "EM_ARCHIVE_DIR"
+DEFAULT_ARCHIVE_DIR = "archive"
+
+# parquet 的固定列：未列出的字段（symbol 以外的派生字段）不写入；int 列中无法转换的旧文本值写为 null
+_PARQUET_INT_FIELDS = ("post_view", "comment_num", "comment_like")
+_PARQUET_TS_FIELDS = ("post_ts", "comment_ts", "last_crawled")
+_PARQUET_COLUMNS = {
+    "post": ("_id", "symbol", "post_title", "post_view", "comment_num", "post_url", "post_date", "post_time",
+             "post_author", "post_ts", "last_crawled"),
+    "comment": ("_id", "symbol", "post_id", "comment_id", "parent_id", "comment_content", "comment_like",
+                "comment_date", "comment_time", "sub_comment", "comment_ts"),
+}
+
+
+def archive_dir(path: Optional[str] = None) -> str:
+    """返回归档根目录：显式参数 > EM_ARCHIVE_DIR > ./archive。"""
+    return path or os.environ.get(ARCHIVE_DIR_ENV) or DEFAULT_ARCHIVE_DIR
+
+
+def _require_format(fmt):
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"unknown archive format: {fmt} (expected {' / '.join(ARCHIVE_FORMATS)})")
+    if fmt == "parquet" and not _has_pyarrow:
+        raise RuntimeError("parquet 归档需要 pyarrow：pip install pyarrow")
+
+
+def _month_start(ts: datetime.datetime) -> datetime.datetime:
+    return datetime.datetime(ts.year, ts.month, 1)
+
+
+def _next_month(ts: datetime.datetime) -> datetime.datetime:
+    return datetime.datetime(ts.year + ts.month // 12, ts.month % 12 + 1, 1)
+
+
+def _parquet_schema(kind):
+    fields = []
+    for name in _PARQUET_COLUMNS[kind]:
+        if name in _PARQUET_INT_FIELDS:
+            fields.append(pa.field(name, pa.int64()))
+        elif name in _PARQUET_TS_FIELDS:
+            fields.append(pa.field(name, pa.timestamp("ms")))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _parquet_value(name, value):
+    if value is None:
+        return None
+    if name in _PARQUET_INT_FIELDS:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if name in _PARQUET_TS_FIELDS:
+        return value if isinstance(value, datetime.datetime) else None
+    if isinstance(value, (list, dict)):
+        return json_util.dumps(value, json_options=_JSON_OPTIONS, ensure_ascii=False)
+    return str(value)
+
+
+class _MonthWriter(object):
+    """
+    一个 股票 + 月份 的归档文件：写入 *.part，close() 后改名并返回已写入文档的 _id 列表。
+    parquet 有损（只保留固定列），同时写一份同名 jsonl.gz（self.copy），两者都改名完成后才返回 _id 供删除。
+    """
+
+    def __init__(self, path: str, kind: str, fmt: str):
+        self.path = path
+        self.part = path + ".part"
+        self.kind = kind
+        self.fmt = fmt
+        self.ids = []
+        self.copy = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if fmt == "parquet":
+            self._schema = _parquet_schema(kind)
+            self._out = pq.ParquetWriter(self.part, self._schema, compression="zstd")
+            self.copy = _MonthWriter(_lossless_path(path), kind, "jsonl.gz")
+        else:
+            self._out = open_write(self.part)
+
+    @property
+    def paths(self) -> List[str]:
+        return [self.path] + ([self.copy.path] if self.copy is not None else [])
+
+    def write(self, docs: List[dict]):
+        if not docs:
+            return
+        if self.fmt == "parquet":
+            columns = {name: [_parquet_value(name, d.get(name)) for d in docs] for name in self._schema.names}
+            self._out.write_table(pa.table(columns, schema=self._schema))
+        else:
+            lines = [json_util.dumps(d, json_options=_JSON_OPTIONS, ensure_ascii=False) for d in docs]
+            self._out.write(("\n".join(lines) + "\n").encode("utf-8"))
+        if self.copy is not None:
+            self.copy.write(docs)
+        self.ids.extend(d["_id"] for d in docs)
+
+    def close(self) -> List:
+        if self.copy is not None:
+            self.copy.close()
+        self._out.close()
+        os.replace(self.part, self.path)
+        return self.ids
+
+    def abort(self):
+        if self.copy is not None and not os.path.exists(self.copy.path):
+            self.copy.abort()
+        try:
+            self._out.close()
+        except Exception:
+            pass
+
+
+def _lossless_path(parquet_path: str) -> str:
+    """parquet 归档对应的无损 jsonl.gz 文件名（同一月份、同一运行时间戳）。"""
+    return parquet_path[:-len(".parquet")] + ".jsonl.gz"
+
+
+def _delete_archived(coll, ids, ts_field, cutoff, batch_size):
+    """按 _id 分批删除已归档的文档；时间上限防止误删归档期间被改写为新时间的文档。"""
+    deleted = 0
+    for i in range(0, len(ids), batch_size):
+        res = coll.delete_many({"_id": {"$in": ids[i:i + batch_size]}, ts_field: {"$lt": cutoff}})
+        deleted += res.deleted_count
+    return deleted
+
+
+def archive_collection(coll, kind: str, symbol: str, cutoff: datetime.datetime, out_dir: Optional[str] = None,
+                       fmt: str = "jsonl.gz", query: Optional[dict] = None, batch_size: int = 2000,
+                       dry_run: bool = False) -> dict:
+    """
+    把 coll 中（可用 query 限定范围）时间字段早于 cutoff 的文档按月写入归档文件后从 coll 删除，
+    返回 {'archived', 'deleted', 'files'}；dry_run 时只统计 archived。
+    """
+    _require_format(fmt)
+    ts_field = TS_FIELDS[kind][2]
+    flt = dict(query or {}, **{ts_field: {"$lt": cutoff}})
+    summary = {"archived": 0, "deleted": 0, "files": []}
+    label = f"[archive {coll.database.name}.{coll.name} {symbol}]"
+    if dry_run:
+        summary["archived"] = coll.count_documents(flt)
+        logger.info("%s 早于 %s 的文档 %d 条", label, cutoff.date(), summary["archived"])
+        return summary
+
+    run_ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    base = os.path.join(archive_dir(out_dir), kind, symbol)
+    t0 = time.time()
+    writer, month, batch = None, None, []
+
+    def finish():
+        if writer is None:
+            return
+        writer.write(batch)
+        batch.clear()
+        ids = writer.close()
+        summary["files"].extend(writer.paths)
+        summary["deleted"] += _delete_archived(coll, ids, ts_field, cutoff, batch_size)
+        # 同进程内的 PostCrawler 不应再把已删除的帖子当作"未变化"而跳过写入
+        clear_change_caches()
+        logger.info("%s %s: %d 条 -> %s", label, month.strftime("%Y-%m"), len(ids), writer.path)
+
+    try:
+        # 按时间升序读取（走 post_ts / comment_ts 索引），同一时刻只打开一个月份文件
+        for doc in coll.find(flt, batch_size=batch_size).sort(ts_field, 1):
+            doc_month = _month_start(doc[ts_field])
+            if doc_month != month:
+                finish()
+                month = doc_month
+                writer = _MonthWriter(os.path.join(base, f"{month:%Y-%m}.{run_ts}.{fmt}"), kind, fmt)
+            batch.append(doc)
+            summary["archived"] += 1
+            if len(batch) >= batch_size:
+                writer.write(batch)
+                batch.clear()
+        finish()
+    except Exception:
+        if writer is not None and not os.path.exists(writer.path):
+            writer.abort()
+        raise
+    elapsed = time.time() - t0
+    logger.info("%s 完成: 归档 %d 条，删除 %d 条，%d 个文件 (%.1fs, %.0f docs/s)", label, summary["archived"],
+                summary["deleted"], len(summary["files"]), elapsed, summary["archived"] / max(elapsed, 1e-6))
+    return summary
+
+
+def ensure_ttl_index(coll, kind: str, days: int):
+    """在时间字段上创建（或用 collMod 调整）TTL 索引；键为升序，与已有的降序时间索引不冲突。"""
+    ts_field = TS_FIELDS[kind][2]
+    name = f"{ts_field}_ttl"
+    seconds = int(days * 86400)
+    existing = coll.index_information().get(name)
+    if existing is None:
+        coll.create_index([(ts_field, 1)], name=name, expireAfterSeconds=seconds)
+    elif existing.get("expireAfterSeconds") != seconds:
+        coll.database.command("collMod", coll.name, index={"name": name, "expireAfterSeconds": seconds})
+    logger.info("[%s.%s] TTL 索引 %s: %d 天", coll.database.name, coll.name, name, days)
+
+
+# ---- 读取 ----
+
+def archive_files(kind: str, symbol: str, start: Optional[datetime.datetime] = None,
+                  end: Optional[datetime.datetime] = None, out_dir: Optional[str] = None) -> List[str]:
+    """列出与 [start, end) 有交集的归档文件（按月份排序）；有无损 jsonl.gz 副本的 parquet 文件不列出。"""
+    found = []
+    for path in glob.glob(os.path.join(archive_dir(out_dir), kind, symbol, "*.*")):
+        name = os.path.basename(path)
+        fmt = name.split(".", 2)[-1] if name.count(".") >= 2 else ""
+        if fmt not in ARCHIVE_FORMATS:
+            continue
+        try:
+            month = datetime.datetime.strptime(name[:7], "%Y-%m")
+        except ValueError:
+            continue
+        if (end is not None and month >= end) or (start is not None and _next_month(month) <= start):
+            continue
+        if fmt == "parquet" and os.path.exists(_lossless_path(path)):
+            continue
+        found.append(path)
+    return sorted(found)
+
+
+def _read_archive_file(path: str) -> Iterator[dict]:
+    if path.endswith(".parquet"):
+        if not _has_pyarrow:
+            raise RuntimeError("读取 parquet 归档需要 pyarrow：pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+    else:
+        yield from read_docs(path)
+
+
+def _in_window(ts, start, end):
+    if ts is None:
+        return False
+    return (start is None or ts >= start) and (end is None or ts < end)
+
+
+def iter_docs(client, kind: str, symbol: str, start: Optional[datetime.datetime] = None,
+              end: Optional[datetime.datetime] = None, out_dir: Optional[str] = None,
+              layout: Optional[str] = None) -> Iterator[dict]:
+    """
+    按时间窗口 [start, end) 读取某只股票的帖子 / 评论，先读归档文件（按月份），再读 Mongo（按时间升序），每个 _id 只返回一次：
+    归档成功但删除未完成后重跑、或旧帖被重新抓取（_id 固定）后再次归档时，同一文档会出现在多个归档文件或同时存在于两层。
+    """
+    ts_field = TS_FIELDS[kind][2]
+    seen = set()
+    for path in archive_files(kind, symbol, start, end, out_dir):
+        for doc in _read_archive_file(path):
+            if not _in_window(doc.get(ts_field), start, end):
+                continue
+            key = str(doc.get("_id"))
+            if key in seen:
+                continue
+            seen.add(key)
+            yield doc
+
+    db_name, coll_name, scope = symbol_collection(kind, symbol, layout)
+    flt = {"symbol": scope} if scope is not None else {}
+    window = {}
+    if start is not None:
+        window["$gte"] = start
+    if end is not None:
+        window["$lt"] = end
+    flt[ts_field] = window or {"$ne": None}
+    for doc in client[db_name][coll_name].find(flt).sort(ts_field, 1):
+        if seen and str(doc["_id"]) in seen:
+            continue
+        yield doc
+
+
+def _parse_date(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d") if text else None
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="把旧帖子 / 评论归档到压缩文件，并跨 Mongo 与归档查询")
+    ap.add_argument("--uri", default=os.environ.get("MONGO_URI") or "mongodb://localhost:27017")
+    ap.add_argument("--layout", choices=["per_symbol", "unified"], default=None,
+                    help="存储布局（默认取 EM_STORAGE_LAYOUT）")
+    ap.add_argument("--out", default=None, help=f"归档目录（默认取 {ARCHIVE_DIR_ENV} 或 ./{DEFAULT_ARCHIVE_DIR}）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    a = sub.add_parser("archive", help="归档并删除超过保留期的文档")
+    a.add_argument("--kind", choices=["post", "comment", "all"], default="all")
+    a.add_argument("--symbols", nargs="*", default=None, help="只处理这些股票（默认全部）")
+    a.add_argument("--older-than-days", type=int, required=True, help="保留期（天）")
+    a.add_argument("--format", choices=ARCHIVE_FORMATS, default="jsonl.gz",
+                   help="parquet 时另写一份无损的 jsonl.gz，两者都写完才删除 Mongo 中的文档")
+    a.add_argument("--batch-size", type=int, default=2000)
+    a.add_argument("--ttl-days", type=int, default=None, help="同时创建 TTL 索引（天，应大于 --older-than-days）")
+    a.add_argument("--dry-run", action="store_true", help="只统计需要归档的文档数")
+
+    q = sub.add_parser("query", help="跨 Mongo 与归档按时间窗口读取，输出 Extended JSON 行")
+    q.add_argument("--kind", choices=["post", "comment"], required=True)
+    q.add_argument("--symbol", required=True)
+    q.add_argument("--start", default=None, help="YYYY-MM-DD（含）")
+    q.add_argument("--end", default=None, help="YYYY-MM-DD（不含）")
+    q.add_argument("--count", action="store_true", help="只输出条数")
+    args = ap.parse_args(argv)
+
+    from migrate_to_unified import source_collections
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    if args.cmd == "query":
+        n = 0
+        for doc in iter_docs(client, args.kind, args.symbol, _parse_date(args.start), _parse_date(args.end),
+                             out_dir=args.out, layout=args.layout):
+            n += 1
+            if not args.count:
+                print(json_util.dumps(doc, json_options=_JSON_OPTIONS, ensure_ascii=False))
+        if args.count:
+            print(n)
+        client.close()
+        return 0
+
+    if args.ttl_days is not None and args.ttl_days <= args.older_than_days:
+        ap.error("--ttl-days 应大于 --older-than-days，否则文档会在归档前被 TTL 删除")
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=args.older_than_days)
+    kinds = ["post", "comment"] if args.kind == "all" else [args.kind]
+    totals = {"archived": 0, "deleted": 0, "files": 0}
+    failed = 0
+    for kind in kinds:
+        db_name, prefix, unified = KIND_COLLECTIONS[kind]
+        db = client[db_name]
+        if storage_layout(args.layout) == "unified":
+            coll = db[unified]
+            symbols = args.symbols or sorted(s for s in coll.distinct("symbol") if s)
+            targets = [(coll, symbol, {"symbol": symbol}) for symbol in symbols]
+            ttl_colls = [coll]
+        else:
+            targets = [(db[name], symbol, None)
+                       for symbol, name in source_collections(db, prefix, set(args.symbols) if args.symbols else None)]
+            ttl_colls = [coll for coll, _, _ in targets]
+        for coll, symbol, query in targets:
+            try:
+                res = archive_collection(coll, kind, symbol, cutoff, out_dir=args.out, fmt=args.format, query=query,
+                                         batch_size=args.batch_size, dry_run=args.dry_run)
+            except Exception:
+                logger.exception("[archive %s.%s %s] 失败", db_name, coll.name, symbol)
+                failed += 1
+                continue
+            totals["archived"] += res["archived"]
+            totals["deleted"] += res["deleted"]
+            totals["files"] += len(res["files"])
+        if args.ttl_days is not None and not args.dry_run:
+            for coll in ttl_colls:
+                ensure_ttl_index(coll, kind, args.ttl_days)
+    client.close()
+    logger.info("完成: %s", json.dumps(totals))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# 用途：为已有的帖子 / 评论补写 post_ts / comment_ts（由 post_date + post_time 或 comment_date + comment_time 合成的 datetime），
+#       并创建对应索引，之后按时间窗口的查询可以直接走索引范围扫描：
+#       db.post_000333.find({post_ts: {$gte: ISODate("2025-11-01"), $lt: ISODate("2025-11-08")}})
+# 转换在服务端完成（update_many + 管道 $dateFromString），不把文档取回 Python；无法解析的日期写为 null。
+# 可重复执行：只处理还没有该字段的文档。需要 MongoDB 4.2+（管道更新）。
+# 运行：python backfill_ts.py                        # 全部股票的帖子与评论（按 EM_STORAGE_LAYOUT）
+#       python backfill_ts.py --kind post --symbols 000333
+import os
+import time
+import logging
+import argparse
+
+from pymongo import MongoClient
+
+from mongodb import KIND_COLLECTIONS, PER_SYMBOL_INDEXES, UNIFIED_INDEXES, storage_layout
+from migrate_to_unified import source_collections
+
+logger = logging.getLogger("backfill_ts")
+
+# kind -> (日期字段, 时间字段, 目标字段)
+TS_FIELDS = {
+    'post': ('post_date', 'post_time', 'post_ts'),
+    'comment': ('comment_date', 'comment_time', 'comment_ts'),
+}
+
+
+def ts_pipeline(kind):
+    """update_many 用的管道：'YYYY-MM-DD' + 'HH:MM'（缺时间或非字符串按 00:00，秒数被截去）-> datetime，失败为 null。"""
+    date_f, time_f, ts_f = TS_FIELDS[kind]
+    # 历史数据中 post_time 有非字符串类型（见 beifen.py），按缺失处理，避免 $substrCP 报错中断整个 update
+    clock = {'$cond': [{'$eq': [{'$type': f'${time_f}'}, 'string']}, {'$substrCP': [f'${time_f}', 0, 5]}, '00:00']}
+    return [{'$set': {ts_f: {'$dateFromString': {
+        'dateString': {'$concat': [f'${date_f}', ' ', clock]},
+        'format': '%Y-%m-%d %H:%M',
+        'onError': None,
+        'onNull': None,
+    }}}}]
+
+
+def backfill(coll, kind, query=None):
+    """补写 coll（可用 query 限定范围）中缺少时间字段的文档，返回修改条数。"""
+    date_f, _, ts_f = TS_FIELDS[kind]
+    flt = dict(query or {}, **{ts_f: {'$exists': False}, date_f: {'$type': 'string'}})
+    t0 = time.time()
+    res = coll.update_many(flt, ts_pipeline(kind))
+    logger.info("[%s.%s] %s 补写 %d 条 (%.1fs)", coll.database.name, coll.name, ts_f, res.modified_count,
+                time.time() - t0)
+    return res.modified_count
+
+
+def ensure_ts_index(coll, kind):
+    prefix = KIND_COLLECTIONS[kind][1]
+    specs = UNIFIED_INDEXES.get(coll.name) or PER_SYMBOL_INDEXES[prefix]
+    for keys, opts in specs:
+        if any(k == TS_FIELDS[kind][2] for k, _ in keys):
+            coll.create_index(keys, **opts)
+            logger.info("  索引就绪: %s.%s", coll.name, opts.get('name'))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="补写 post_ts / comment_ts 并建立索引")
+    ap.add_argument("--uri", default=os.environ.get("MONGO_URI") or "mongodb://localhost:27017")
+    ap.add_argument("--kind", choices=["post", "comment", "all"], default="all")
+    ap.add_argument("--layout", choices=["per_symbol", "unified"], default=None,
+                    help="存储布局（默认取 EM_STORAGE_LAYOUT）")
+    ap.add_argument("--symbols", nargs="*", default=None, help="只处理这些股票（默认全部）")
+    args = ap.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    kinds = ["post", "comment"] if args.kind == "all" else [args.kind]
+    total = 0
+    for kind in kinds:
+        db_name, prefix, unified = KIND_COLLECTIONS[kind]
+        db = client[db_name]
+        if storage_layout(args.layout) == "unified":
+            targets = [(db[unified], {"symbol": {"$in": args.symbols}} if args.symbols else None)]
+        else:
+            targets = [(db[name], None)
+                       for _, name in source_collections(db, prefix, set(args.symbols) if args.symbols else None)]
+        for coll, query in targets:
+            ensure_ts_index(coll, kind)
+            total += backfill(coll, kind, query)
+    client.close()
+    logger.info("完成，共补写 %d 条", total)
+
+
+if __name__ == "__main__":
+    main()
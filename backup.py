@@ -0,0 +1,363 @@
+"""
+backup.py
+
+流式备份 / 恢复爬虫集合（post_info.post_* / comment_info.comment_*，以及 unified 的 posts / comments）。
+- 备份按批读取游标并直接写文件，内存占用与集合大小无关：
+  - *.bson / *.bson.gz / *.bson.zst：find_raw_batches 取出的原始 BSON 直接落盘，不做解码，速度接近磁盘上限；
+  - *.jsonl.gz / *.jsonl.zst / *.jsonl：每行一个 Extended JSON 文档（ObjectId、datetime 等类型可无损还原）。
+  先写 *.part，完成后改名，并在旁边写一个 *.meta.json（库名、集合名、条数、格式）。
+- 恢复按批做无序 bulk_write（--mode insert 为 InsertOne，已存在的 _id 记为 existing；upsert 为按 _id ReplaceOne），
+  每批后把已处理条数写入 {文件}.restore.json，中断后加 --resume 跳过已写入的部分继续。
+  也可恢复旧版脚本导出的整文件 JSON 数组（*.json，需整体读入内存）。
+.zst 需要 zstandard（pip install zstandard）。
+
+示例：
+    python backup.py backup --collections post_000333 "comment_*" --out backups --format bson.gz
+    python backup.py restore backups/post_info.post_000333.20251106_074716.bson.gz --resume
+    python backup.py restore post_000333_backup_small.json --db post_info --collection post_000333_restored
+"""
+
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import fnmatch
+import logging
+import argparse
+import datetime
+from typing import Iterable, Iterator, List, Optional
+
+from bson import decode_file_iter, json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient, InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from mongodb import KIND_COLLECTIONS
+
+try:
+    import zstandard
+    _has_zstd = True
+except Exception:
+    _has_zstd = False
+
+logger = logging.getLogger("backup")
+
+FORMATS = ("bson", "bson.gz", "bson.zst", "jsonl", "jsonl.gz", "jsonl.zst")
+DEFAULT_DBS = tuple(db for db, _, _ in KIND_COLLECTIONS.values())
+DEFAULT_PATTERNS = ("post_*", "comment_*", "posts", "comments")
+# 与爬虫集合同前缀但不需要备份的派生集合
+SKIP_PATTERNS = ("*_backup*", "post_snapshots*")
+
+_JSON_OPTIONS = json_util.JSONOptions(json_mode=json_util.JSONMode.RELAXED, tz_aware=False)
+_RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def file_format(path: str) -> str:
+    """按扩展名识别格式：FORMATS 之一，或旧版整文件 JSON 数组 'json'。"""
+    name = path[:-5] if path.endswith(".part") else path
+    for fmt in sorted(FORMATS, key=len, reverse=True):
+        if name.endswith("." + fmt):
+            return fmt
+    if name.endswith(".json"):
+        return "json"
+    raise ValueError(f"unknown backup format: {path} (expected .{' / .'.join(FORMATS)} or legacy .json)")
+
+
+def _require_zstd(path):
+    if path.endswith(".zst") and not _has_zstd:
+        raise RuntimeError(".zst 备份需要 zstandard：pip install zstandard")
+
+
+def open_write(path: str, level: Optional[int] = None):
+    _require_zstd(path)
+    name = path[:-5] if path.endswith(".part") else path
+    if name.endswith(".gz"):
+        return gzip.open(path, "wb", compresslevel=6 if level is None else level)
+    if name.endswith(".zst"):
+        return zstandard.ZstdCompressor(level=3 if level is None else level, threads=-1).stream_writer(
+            open(path, "wb"), closefd=True)
+    return open(path, "wb", buffering=1 << 20)
+
+
+def open_read(path: str):
+    _require_zstd(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True),
+                                 buffer_size=1 << 20)
+    return open(path, "rb", buffering=1 << 20)
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def _state_path(path: str) -> str:
+    return path + ".restore.json"
+
+
+def _progress(label, done, total, t0):
+    rate = done / max(time.time() - t0, 1e-6)
+    if total:
+        logger.info("%s %d / %d (%.1f%%, %.0f docs/s)", label, done, total, 100.0 * done / total, rate)
+    else:
+        logger.info("%s %d (%.0f docs/s)", label, done, rate)
+
+
+# ---- 备份 ----
+
+def backup_collection(coll, path: str, query: Optional[dict] = None, batch_size: int = 2000,
+                      level: Optional[int] = None, progress_every: int = 50000) -> dict:
+    """把 coll（可用 query 限定范围）流式写入 path，返回 meta dict。"""
+    fmt = file_format(path)
+    if fmt == "json":
+        raise ValueError("备份只支持 " + " / ".join(FORMATS))
+    total = coll.count_documents(query) if query else coll.estimated_document_count()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    part = path + ".part"
+    t0 = time.time()
+    count = 0
+    label = f"[backup {coll.database.name}.{coll.name}]"
+    next_report = progress_every
+    with open_write(part, level) as out:
+        if fmt.startswith("bson"):
+            for raw in coll.find_raw_batches(query or {}, batch_size=batch_size):
+                out.write(raw)
+                # 原始批次是连续的 BSON 文档，按每个文档开头的 int32 长度计数
+                pos, n = 0, len(raw)
+                while pos < n:
+                    pos += int.from_bytes(raw[pos:pos + 4], "little")
+                    count += 1
+                if count >= next_report:
+                    _progress(label, count, total, t0)
+                    next_report += progress_every
+        else:
+            lines = []
+            for doc in coll.find(query or {}, batch_size=batch_size):
+                lines.append(json_util.dumps(doc, json_options=_JSON_OPTIONS, ensure_ascii=False))
+                if len(lines) >= batch_size:
+                    out.write(("\n".join(lines) + "\n").encode("utf-8"))
+                    count += len(lines)
+                    lines.clear()
+                    if count >= next_report:
+                        _progress(label, count, total, t0)
+                        next_report += progress_every
+            if lines:
+                out.write(("\n".join(lines) + "\n").encode("utf-8"))
+                count += len(lines)
+    os.replace(part, path)
+
+    meta = {
+        "db": coll.database.name,
+        "collection": coll.name,
+        "query": query or {},
+        "count": count,
+        "format": fmt,
+        "bytes": os.path.getsize(path),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(_meta_path(path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2, default=str)
+    elapsed = time.time() - t0
+    logger.info("%s 完成: %d docs -> %s (%.1f MB, %.1fs, %.0f docs/s)", label, count, path,
+                meta["bytes"] / 1e6, elapsed, count / max(elapsed, 1e-6))
+    return meta
+
+
+def matching_collections(client, dbs: Iterable[str] = DEFAULT_DBS,
+                         patterns: Iterable[str] = DEFAULT_PATTERNS) -> List[tuple]:
+    """列出各库中名字匹配 patterns（fnmatch）的集合，跳过备份等派生集合，返回 [(db, coll)]。"""
+    patterns = list(patterns)
+    found = []
+    for db_name in dbs:
+        for name in sorted(client[db_name].list_collection_names()):
+            if any(fnmatch.fnmatchcase(name, p) for p in SKIP_PATTERNS):
+                continue
+            if any(fnmatch.fnmatchcase(name, p) for p in patterns):
+                found.append((db_name, name))
+    return found
+
+
+def backup_path(out_dir: str, db_name: str, coll_name: str, fmt: str, ts: Optional[str] = None) -> str:
+    ts = ts or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(out_dir, f"{db_name}.{coll_name}.{ts}.{fmt}")
+
+
+# ---- 恢复 ----
+
+def read_docs(path: str) -> Iterator:
+    """按文件格式逐条产出文档；BSON 产出 RawBSONDocument（写回时不需要重新编码字段）。"""
+    fmt = file_format(path)
+    if fmt == "json":
+        with open(path, encoding="utf-8-sig") as f:
+            yield from json_util.loads(f.read(), json_options=_JSON_OPTIONS)
+        return
+    with open_read(path) as f:
+        if fmt.startswith("bson"):
+            yield from decode_file_iter(f, codec_options=_RAW_OPTIONS)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json_util.loads(line, json_options=_JSON_OPTIONS)
+
+
+def _target_from_name(path: str):
+    """从 {db}.{collection}.{ts}.{fmt} 文件名或 meta 文件推断目标集合。"""
+    try:
+        with open(_meta_path(path), encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta["db"], meta["collection"], meta.get("count")
+    except (OSError, ValueError, KeyError):
+        pass
+    parts = os.path.basename(path).split(".")
+    if len(parts) >= 4:
+        return parts[0], parts[1], None
+    return None, None, None
+
+
+def _load_state(path: str, target: str) -> int:
+    try:
+        with open(_state_path(path), encoding="utf-8") as f:
+            state = json.load(f)
+        return int(state["done"]) if state.get("target") == target else 0
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def _save_state(path: str, target: str, done: int):
+    tmp = _state_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"target": target, "done": done,
+                   "updated_at": datetime.datetime.now().isoformat(timespec="seconds")}, f)
+    os.replace(tmp, _state_path(path))
+
+
+def restore_file(path: str, coll, mode: str = "insert", batch_size: int = 1000, resume: bool = False,
+                 total: Optional[int] = None, progress_every: int = 50000) -> dict:
+    """
+    把备份文件恢复到 coll，返回 {'read', 'inserted', 'existing', 'upserted', 'modified', 'errors', 'skipped'}。
+    resume=True 时从 {path}.restore.json 记录的位置继续（之前的文档只读取不写入）。
+    """
+    if mode not in ("insert", "upsert"):
+        raise ValueError(f"unknown restore mode: {mode}")
+    target = f"{coll.database.name}.{coll.name}"
+    skip = _load_state(path, target) if resume else 0
+    summary = {"read": 0, "skipped": skip, "inserted": 0, "existing": 0, "upserted": 0, "modified": 0,
+               "errors": 0}
+    label = f"[restore {target}]"
+    if skip:
+        logger.info("%s 从第 %d 条继续", label, skip + 1)
+    ops = []
+    t0 = time.time()
+    next_report = skip + progress_every
+
+    def flush():
+        if not ops:
+            return
+        try:
+            res = coll.bulk_write(ops, ordered=False)
+            summary["inserted"] += res.inserted_count
+            summary["upserted"] += res.upserted_count
+            summary["modified"] += res.modified_count
+        except BulkWriteError as bwe:
+            det = bwe.details or {}
+            summary["inserted"] += det.get("nInserted", 0)
+            summary["upserted"] += det.get("nUpserted", 0)
+            summary["modified"] += det.get("nModified", 0)
+            for err in det.get("writeErrors", []):
+                # 11000：_id 已存在（重复恢复或 resume 前最后一批已写入），不算错误
+                summary["existing" if err.get("code") == 11000 else "errors"] += 1
+            if summary["errors"]:
+                logger.warning("%s bulk_write errors: %s", label, det.get("writeErrors", [])[:1])
+        ops.clear()
+        _save_state(path, target, summary["read"])
+
+    for doc in read_docs(path):
+        summary["read"] += 1
+        if summary["read"] <= skip:
+            continue
+        if mode == "insert":
+            ops.append(InsertOne(doc))
+        else:
+            ops.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+        if len(ops) >= batch_size:
+            flush()
+            if summary["read"] >= next_report:
+                _progress(label, summary["read"], total, t0)
+                next_report += progress_every
+    flush()
+    try:
+        os.remove(_state_path(path))
+    except OSError:
+        pass
+    logger.info("%s 完成: %s, 耗时 %.1fs", label, summary, time.time() - t0)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="流式备份 / 恢复爬虫集合")
+    ap.add_argument("--uri", default=os.environ.get("MONGO_URI") or "mongodb://localhost:27017")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("backup", help="备份匹配的集合到文件")
+    b.add_argument("--dbs", nargs="+", default=list(DEFAULT_DBS))
+    b.add_argument("--collections", nargs="+", default=list(DEFAULT_PATTERNS), help="集合名或通配符")
+    b.add_argument("--query", default=None, help='JSON 过滤条件，例如 \'{"symbol": "000333"}\'')
+    b.add_argument("--out", default="backups", help="输出目录")
+    b.add_argument("--format", choices=FORMATS, default="bson.gz")
+    b.add_argument("--level", type=int, default=None, help="压缩级别（gzip 1-9 / zstd 1-22）")
+    b.add_argument("--batch-size", type=int, default=2000)
+
+    r = sub.add_parser("restore", help="从备份文件恢复")
+    r.add_argument("files", nargs="+")
+    r.add_argument("--db", default=None, help="目标库（默认取 meta 或文件名）")
+    r.add_argument("--collection", default=None, help="目标集合（默认取 meta 或文件名）")
+    r.add_argument("--mode", choices=["insert", "upsert"], default="insert")
+    r.add_argument("--batch-size", type=int, default=1000)
+    r.add_argument("--resume", action="store_true", help="从上次中断的位置继续")
+    r.add_argument("--drop", action="store_true", help="恢复前删除目标集合（与 --resume 互斥）")
+    args = ap.parse_args(argv)
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    failed = 0
+    if args.cmd == "backup":
+        query = json_util.loads(args.query) if args.query else None
+        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        targets = matching_collections(client, args.dbs, args.collections)
+        logger.info("备份 %d 个集合 -> %s", len(targets), args.out)
+        for db_name, name in targets:
+            path = backup_path(args.out, db_name, name, args.format, ts)
+            try:
+                backup_collection(client[db_name][name], path, query=query, batch_size=args.batch_size,
+                                  level=args.level)
+            except Exception:
+                logger.exception("[backup %s.%s] 失败", db_name, name)
+                failed += 1
+    else:
+        if args.drop and args.resume:
+            ap.error("--drop 与 --resume 不能同时使用")
+        for path in args.files:
+            db_name, coll_name, total = _target_from_name(path)
+            db_name, coll_name = args.db or db_name, args.collection or coll_name
+            if not db_name or not coll_name:
+                logger.error("%s: 无法推断目标集合，请指定 --db / --collection", path)
+                failed += 1
+                continue
+            coll = client[db_name][coll_name]
+            if args.drop:
+                coll.drop()
+            res = restore_file(path, coll, mode=args.mode, batch_size=args.batch_size, resume=args.resume,
+                               total=total)
+            failed += bool(res["errors"])
+    client.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+"""
+cdp_backend.py
+
+直连 Chrome DevTools Protocol 的浏览器后端，绕过 chromedriver：
+Python -> websocket -> Chrome，省掉每条命令经 chromedriver HTTP 转发的一跳与一个常驻进程，
+也不再需要解析/下载匹配版本的 chromedriver。
+
+只提供爬虫实际用到的小接口：navigate、wait_for、evaluate、get_html。
+- AsyncCDPBrowser：asyncio 原生接口，可在同一事件循环里并发驱动多个浏览器。
+- SyncCDPBrowser：在后台线程运行事件循环的同步包装，并提供 get / execute_script / page_source / quit
+  这几个与 Selenium WebDriver 同名的方法，便于 WebDriverManager(backend='cdp') 直接替换。
+依赖 websockets（可选依赖，未安装时仅在使用 cdp 后端时报错）。
+"""
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import logging
+import itertools
+import threading
+import subprocess
+import urllib.request
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Optional
+
+try:
+    import websockets
+    _has_websockets = True
+except Exception:
+    _has_websockets = False
+
+logger = logging.getLogger(__name__)
+
+_CHROME_CANDIDATES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+_WINDOWS_CHROME = (
+    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+)
+
+
+class CDPError(ConnectionError):
+    """CDP 调用失败或连接断开（ConnectionError 子类，retry_on_driver_error 视为可恢复）。"""
+
+
+def find_chrome_binary() -> Optional[str]:
+    """CHROME_BINARY_PATH > PATH 中的 chrome/chromium > Windows 默认安装位置。"""
+    env_bin = os.environ.get("CHROME_BINARY_PATH")
+    if env_bin and os.path.exists(env_bin):
+        return env_bin
+    for name in _CHROME_CANDIDATES:
+        path = shutil.which(name)
+        if path:
+            return path
+    for path in _WINDOWS_CHROME:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _wrap_script(script: str, args) -> str:
+    # 与 Selenium execute_script 语义一致：script 是函数体，可用 arguments[i] 与 return
+    return f"(function() {{ {script} }}).apply(null, {json.dumps(list(args), ensure_ascii=False)})"
+
+
+class AsyncCDPBrowser(object):
+    """单页面（第一个 page target）的异步 CDP 客户端。"""
+
+    def __init__(self, ws_url: str, process: Optional[subprocess.Popen] = None):
+        self.ws_url = ws_url
+        self.process = process
+        self._ws = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._waiters = []
+        self._reader = None
+
+    @classmethod
+    async def launch(cls, user_data_dir: str, port: int, headless: bool = True,
+                     chrome_binary: Optional[str] = None, extra_args=(), startup_timeout: float = 20.0):
+        """启动 Chrome 并连接其第一个页面。"""
+        if not _has_websockets:
+            raise RuntimeError("cdp 后端需要 websockets：pip install websockets")
+        binary = chrome_binary or find_chrome_binary()
+        if not binary:
+            raise RuntimeError("无法找到 Chrome 可执行文件。请设置 CHROME_BINARY_PATH。")
+        args = [binary, f"--remote-debugging-port={port}", f"--user-data-dir={user_data_dir}",
+                "--no-first-run", "--no-default-browser-check", "--disable-extensions",
+                "--disable-blink-features=AutomationControlled", "--no-sandbox", "--disable-dev-shm-usage"]
+        if headless:
+            args += ["--headless=new", "--disable-gpu"]
+        args += list(extra_args) + ["about:blank"]
+        process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        browser = None
+        try:
+            ws_url = None
+            deadline = time.monotonic() + startup_timeout
+            while time.monotonic() < deadline:
+                if process.poll() is not None:
+                    raise CDPError(f"Chrome exited during startup (code={process.returncode})")
+                try:
+                    targets = await asyncio.get_running_loop().run_in_executor(None, cls._list_targets, port)
+                    pages = [t for t in targets if t.get("type") == "page" and t.get("webSocketDebuggerUrl")]
+                    if pages:
+                        ws_url = pages[0]["webSocketDebuggerUrl"]
+                        break
+                except OSError:
+                    pass
+                await asyncio.sleep(0.1)
+            if not ws_url:
+                raise CDPError(f"Chrome DevTools not reachable on port {port}")
+
+            browser = cls(ws_url, process)
+            await browser.connect()
+        except BaseException:
+            # 启动后任何失败（握手超时、端口上是别的服务返回非 JSON、任务被取消）都结束 Chrome，避免进程泄漏
+            if browser is not None and browser._reader is not None:
+                browser._reader.cancel()
+            process.kill()
+            process.wait()
+            raise
+        return browser
+
+    @staticmethod
+    def _list_targets(port: int):
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/list", timeout=2) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    async def connect(self):
+        self._ws = await websockets.connect(self.ws_url, max_size=None, ping_interval=None)
+        self._reader = asyncio.ensure_future(self._read_loop())
+        await self.send("Page.enable")
+        await self.send("Runtime.enable")
+
+    async def _read_loop(self):
+        try:
+            async for raw in self._ws:
+                msg = json.loads(raw)
+                if "id" in msg:
+                    fut = self._pending.pop(msg["id"], None)
+                    if fut is not None and not fut.done():
+                        if "error" in msg:
+                            fut.set_exception(CDPError(f"{msg['error'].get('message')} ({msg['error'].get('code')})"))
+                        else:
+                            fut.set_result(msg.get("result", {}))
+                else:
+                    for method, fut in list(self._waiters):
+                        if method == msg.get("method") and not fut.done():
+                            fut.set_result(msg.get("params", {}))
+        except Exception as e:
+            logger.debug("[CDP] read loop ended: %s", e)
+        finally:
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(CDPError("DevTools connection closed"))
+            self._pending.clear()
+
+    async def send(self, method: str, params: Optional[dict] = None, timeout: float = 30.0) -> dict:
+        if self._ws is None:
+            raise CDPError("not connected")
+        msg_id = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = fut
+        try:
+            await self._ws.send(json.dumps({"id": msg_id, "method": method, "params": params or {}}))
+        except Exception as e:
+            self._pending.pop(msg_id, None)
+            raise CDPError(f"send {method} failed: {e}")
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(msg_id, None)
+            raise CDPError(f"{method} timed out after {timeout}s")
+
+    def _expect(self, method: str) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        entry = (method, fut)
+        self._waiters.append(entry)
+        fut.add_done_callback(lambda _: self._waiters.remove(entry) if entry in self._waiters else None)
+        return fut
+
+    async def navigate(self, url: str, timeout: float = 30.0):
+        """打开 url 并等待 load 事件。"""
+        loaded = self._expect("Page.loadEventFired")
+        res = await self.send("Page.navigate", {"url": url}, timeout=timeout)
+        if res.get("errorText"):
+            loaded.cancel()
+            raise CDPError(f"navigate {url} failed: {res['errorText']}")
+        try:
+            await asyncio.wait_for(loaded, timeout)
+        except asyncio.TimeoutError:
+            raise CDPError(f"load event for {url} not fired within {timeout}s")
+
+    async def evaluate(self, expression: str, await_promise: bool = False, timeout: float = 30.0) -> Any:
+        """执行 JS 表达式并按值返回结果（JSON 可序列化部分）。"""
+        res = await self.send("Runtime.evaluate", {
+            "expression": expression, "returnByValue": True, "awaitPromise": await_promise,
+        }, timeout=timeout)
+        if res.get("exceptionDetails"):
+            detail = res["exceptionDetails"]
+            text = (detail.get("exception") or {}).get("description") or detail.get("text")
+            raise CDPError(f"evaluate failed: {text}")
+        return (res.get("result") or {}).get("value")
+
+    async def wait_for(self, selector: str, timeout: float = 10.0, interval: float = 0.1) -> bool:
+        """轮询直到 selector 出现，超时返回 False。"""
+        expr = f"!!document.querySelector({json.dumps(selector)})"
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if await self.evaluate(expr):
+                return True
+            await asyncio.sleep(interval)
+        return False
+
+    async def get_html(self) -> str:
+        return await self.evaluate("document.documentElement.outerHTML") or ""
+
+    async def close(self):
+        try:
+            if self._ws is not None:
+                try:
+                    await self.send("Browser.close", timeout=5)
+                except CDPError:
+                    pass
+                await self._ws.close()
+        finally:
+            self._ws = None
+            if self._reader is not None:
+                self._reader.cancel()
+            if self.process is not None and self.process.poll() is None:
+                self.process.terminate()
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.process.wait, 10)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+
+
+class SyncCDPBrowser(object):
+    """AsyncCDPBrowser 的同步包装：事件循环跑在独立守护线程中。"""
+
+    def __init__(self, browser: AsyncCDPBrowser, loop: asyncio.AbstractEventLoop, thread: threading.Thread,
+                 command_timeout: float = 60.0):
+        self._browser = browser
+        self._loop = loop
+        self._thread = thread
+        self.command_timeout = command_timeout
+
+    @classmethod
+    def launch(cls, user_data_dir: str, port: int, headless: bool = True, chrome_binary: Optional[str] = None,
+               extra_args=()):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name=f"cdp-loop-{port}", daemon=True)
+        thread.start()
+        fut = asyncio.run_coroutine_threadsafe(
+            AsyncCDPBrowser.launch(user_data_dir, port, headless=headless, chrome_binary=chrome_binary,
+                                   extra_args=extra_args), loop)
+        try:
+            browser = fut.result(60)
+        except Exception:
+            loop.call_soon_threadsafe(loop.stop)
+            raise
+        return cls(browser, loop, thread)
+
+    @property
+    def process(self) -> Optional[subprocess.Popen]:
+        return self._browser.process
+
+    def _run(self, coro, timeout: Optional[float] = None):
+        fut = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return fut.result(timeout or self.command_timeout)
+        except FutureTimeoutError:
+            fut.cancel()
+            raise CDPError("CDP command timed out")
+
+    # ---- 爬虫使用的最小接口 ----
+
+    def navigate(self, url: str, timeout: float = 30.0):
+        return self._run(self._browser.navigate(url, timeout=timeout), timeout + 5)
+
+    def wait_for(self, selector: str, timeout: float = 10.0) -> bool:
+        return self._run(self._browser.wait_for(selector, timeout=timeout), timeout + 5)
+
+    def evaluate(self, expression: str, await_promise: bool = False) -> Any:
+        return self._run(self._browser.evaluate(expression, await_promise=await_promise))
+
+    def get_html(self) -> str:
+        return self._run(self._browser.get_html())
+
+    # ---- 与 Selenium WebDriver 同名的方法 ----
+
+    def get(self, url: str):
+        self.navigate(url)
+
+    def execute_script(self, script: str, *args) -> Any:
+        return self.evaluate(_wrap_script(script, args))
+
+    @property
+    def page_source(self) -> str:
+        return self.get_html()
+
+    def find_elements(self, *args, **kwargs):
+        raise NotImplementedError("cdp 后端不提供 WebElement；请使用 execute_script 在页面内提取数据")
+
+    def quit(self):
+        try:
+            self._run(self._browser.close(), 20)
+        except Exception as e:
+            logger.debug("[CDP] close error: %s", e)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
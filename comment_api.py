@@ -0,0 +1,183 @@
+"""
+comment_api.py
+
+基于 HTTP 的评论数据源：直接请求股吧回复数据接口（JSON），不再渲染整页帖子。
+- 按页遍历全部一级回复（不再只看到帖子页首屏的 div.replyList）。
+- 一并展开子回复（页面上的 ul.replyListL2，接口中的 child_replys），必要时单独翻页拉取。
+- 输出字段与 CommentParser.parse_comment_info 一致，可直接交给 MongoAPI.insert_many。
+
+接口地址可通过 GUBA_REPLY_API 环境变量或构造参数覆盖，便于指向本地 stub（见 comment_api_stub.py）；
+只设置了 GUBA_BASE_URL（本地 mock_guba.py）时使用 {GUBA_BASE_URL}/api/getData。
+"""
+
+import os
+import re
+import time
+import random
+import logging
+from typing import List, Optional
+
+import requests
+
+from records import CommentRecord, to_timestamp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://guba.eastmoney.com/api/getData"
+REPLY_LIST_PATH = "reply/api/Reply/ArticleNewReplyList"
+SUB_REPLY_PATH = "reply/api/Reply/ArticleReplyDetail"
+
+_POST_ID_RE = re.compile(r'news,([^,]+),(\d+)\.html')
+
+
+def parse_post_url(post_url: str):
+    """从帖子 URL（如 https://guba.eastmoney.com/news,000333,1620615744.html）中取出 (symbol, postid)。"""
+    m = _POST_ID_RE.search(post_url or "")
+    if not m:
+        return None, None
+    return m.group(1), m.group(2)
+
+
+class CommentAPIClient:
+    """股吧回复接口客户端：分页拉取一级回复与子回复，并映射为 CommentParser 的输出结构。"""
+
+    def __init__(self, api_url: Optional[str] = None, page_size: int = 30, timeout: float = 10.0,
+                 max_pages: int = 500, max_retries: int = 3, page_sleep: float = 0.2):
+        base = os.environ.get("GUBA_BASE_URL")
+        self.api_url = (api_url or os.environ.get("GUBA_REPLY_API")
+                        or (f"{base.rstrip('/')}/api/getData" if base else DEFAULT_API_URL))
+        self.page_size = page_size
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_retries = max_retries
+        self.page_sleep = page_sleep
+        self.retries = 0  # 累计重试次数（load_test.py 汇总）
+        self.session = requests.Session()
+        self.session.headers.update({
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                          "(KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+            "Referer": "https://guba.eastmoney.com/",
+        })
+
+    def close(self):
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+    def _request(self, symbol: str, path: str, param: str) -> dict:
+        """POST 一次接口，遇网络错误或非 JSON 响应时指数退避重试。"""
+        last_exc = None
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                resp = self.session.post(
+                    self.api_url,
+                    params={"code": symbol, "path": path},
+                    data={"param": param, "path": path, "env": "2"},
+                    timeout=self.timeout,
+                )
+                resp.raise_for_status()
+                return resp.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                last_exc = e
+                if attempt == self.max_retries:
+                    break
+                self.retries += 1
+                wait = 0.5 * (2 ** (attempt - 1)) + random.random() * 0.2
+                logger.warning("[CommentAPIClient] %s attempt %d failed: %s, wait %.1fs", path, attempt, e, wait)
+                time.sleep(wait)
+        raise last_exc
+
+    @staticmethod
+    def _reply_items(payload) -> list:
+        # 一级回复接口返回 {"re": [...]}；子回复接口可能返回 {"re": {"child_replys": [...]}}
+        re_ = (payload or {}).get("re")
+        if isinstance(re_, list):
+            return re_
+        if isinstance(re_, dict):
+            return re_.get("child_replys") or []
+        return []
+
+    def fetch_replies(self, post_url: str, start_page: int = 1, end_page: Optional[int] = None) -> List[dict]:
+        """拉取帖子的一级回复原始数据（含内联 child_replys），按 p=start_page..end_page 翻页直到取空。"""
+        symbol, postid = parse_post_url(post_url)
+        if not postid:
+            raise ValueError(f"无法从 URL 解析 postid: {post_url}")
+
+        last_page = min(end_page or self.max_pages, self.max_pages)
+        items = []
+        total = None
+        for p in range(start_page, last_page + 1):
+            param = f"postid={postid}&sort=1&sorttype=1&p={p}&ps={self.page_size}"
+            payload = self._request(symbol, REPLY_LIST_PATH, param)
+            page_items = self._reply_items(payload)
+            if total is None:
+                try:
+                    total = int(payload.get("count") or 0)
+                except Exception:
+                    total = 0
+            items.extend(page_items)
+            logger.debug("[CommentAPIClient] %s page %d: %d replies", postid, p, len(page_items))
+            if len(page_items) < self.page_size or (total and p * self.page_size >= total):
+                break
+            time.sleep(self.page_sleep)
+        return items
+
+    def fetch_sub_replies(self, post_url: str, reply: dict) -> List[dict]:
+        """返回一级回复下的全部子回复：内联数量不足 reply_count 时调用子回复接口继续翻页。"""
+        inline = reply.get("child_replys") or []
+        try:
+            expected = int(reply.get("reply_count") or 0)
+        except Exception:
+            expected = 0
+        if expected <= len(inline):
+            return inline
+
+        symbol, postid = parse_post_url(post_url)
+        subs = []
+        for p in range(1, self.max_pages + 1):
+            param = (f"postid={postid}&replyid={reply.get('reply_id')}"
+                     f"&sort=1&sorttype=1&p={p}&ps={self.page_size}")
+            page_items = self._reply_items(self._request(symbol, SUB_REPLY_PATH, param))
+            subs.extend(page_items)
+            if len(page_items) < self.page_size or len(subs) >= expected:
+                break
+            time.sleep(self.page_sleep)
+        return subs or inline
+
+    @staticmethod
+    def to_comment_doc(item: dict, post_id: str, sub_bool: bool, parent_id: Optional[str] = None) -> CommentRecord:
+        """把接口中的一条回复映射为 CommentParser.parse_comment_tree 的字段结构（含 comment_id / parent_id）。"""
+        date_str = (item.get("reply_publish_time") or item.get("reply_time") or "").strip()
+        parts = date_str.split(' ')
+        date = parts[0] if parts and parts[0] else None
+        time_val = parts[1][:5] if len(parts) > 1 else None
+        try:
+            like = int(item.get("reply_like_count") or 0)
+        except Exception:
+            like = 0
+        reply_id = item.get("reply_id")
+        return CommentRecord(
+            post_id=post_id,
+            comment_id=str(reply_id) if reply_id is not None else None,
+            parent_id=str(parent_id) if parent_id is not None else None,
+            comment_content=item.get("reply_text") or "",
+            comment_like=like,
+            comment_date=date,
+            comment_time=time_val,
+            sub_comment=int(sub_bool),
+            comment_ts=to_timestamp(date, parts[1] if len(parts) > 1 else None),
+        )
+
+    def fetch_comments(self, post_url: str, start_page: int = 1, end_page: Optional[int] = None) -> List[CommentRecord]:
+        """
+        拉取并展开一个帖子的全部评论（一级 + 子回复），post_id 与 DOM 方式一致使用帖子 URL。
+        子回复请求失败（超时、5xx、非 JSON）时异常向上抛出，不返回缺了子回复的结果：
+        调用方（CommentCrawler.crawl_comment_info）把该帖记为失败，run_comments 重试且不记为已处理。
+        """
+        docs = []
+        for reply in self.fetch_replies(post_url, start_page=start_page, end_page=end_page):
+            docs.append(self.to_comment_doc(reply, post_url, sub_bool=False))
+            for sub in self.fetch_sub_replies(post_url, reply):
+                docs.append(self.to_comment_doc(sub, post_url, sub_bool=True, parent_id=reply.get("reply_id")))
+        return docs
@@ -0,0 +1,111 @@
+"""
+comment_api_stub.py
+
+本地回复接口 stub，模拟股吧 /api/getData 的一级回复与子回复分页，用于离线测试 comment_api.CommentAPIClient。
+运行：python comment_api_stub.py --port 8765 --replies 75 --subs 4
+然后：GUBA_REPLY_API=http://127.0.0.1:8765/api/getData python run_comments.py --use-api ...
+"""
+
+import json
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from comment_api import REPLY_LIST_PATH, SUB_REPLY_PATH
+
+
+class StubReplyData:
+    """按 postid 确定性生成回复树：每个 postid 生成固定数量的一级回复，部分回复带子回复。"""
+
+    def __init__(self, replies: int = 75, subs: int = 4, inline_subs: int = 2):
+        self.replies = replies
+        self.subs = subs
+        self.inline_subs = inline_subs
+
+    def _reply(self, postid: str, rid: int, parent: int = 0) -> dict:
+        rnd = random.Random(f"{postid}:{rid}:{parent}")
+        return {
+            'reply_id': rid,
+            'reply_text': f"stub reply {rid}" + (f" to {parent}" if parent else ""),
+            'reply_like_count': rnd.randint(0, 50),
+            'reply_publish_time': f"2025-11-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00",
+        }
+
+    def sub_replies(self, postid: str, rid: int) -> list:
+        n = self.subs if rid % 3 == 0 else 0
+        return [self._reply(postid, rid * 1000 + i, parent=rid) for i in range(1, n + 1)]
+
+    def reply_page(self, postid: str, p: int, ps: int) -> dict:
+        start = (p - 1) * ps
+        items = []
+        for rid in range(start + 1, min(start + ps, self.replies) + 1):
+            item = self._reply(postid, rid)
+            subs = self.sub_replies(postid, rid)
+            item['reply_count'] = len(subs)
+            item['child_replys'] = subs[:self.inline_subs]
+            items.append(item)
+        return {'re': items, 'count': self.replies, 'rc': 1, 'me': ''}
+
+    def sub_reply_page(self, postid: str, rid: int, p: int, ps: int) -> dict:
+        subs = self.sub_replies(postid, rid)
+        return {'re': {'child_replys': subs[(p - 1) * ps:p * ps]}, 'rc': 1, 'me': ''}
+
+
+def make_handler(data: StubReplyData):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, fmt, *args):  # 保持测试输出安静
+            pass
+
+        def _send_json(self, obj, status=200):
+            body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/api/getData':
+                return self._send_json({'rc': 0, 'me': 'not found'}, status=404)
+            length = int(self.headers.get('Content-Length') or 0)
+            form = parse_qs(self.rfile.read(length).decode('utf-8'))
+            path = (form.get('path') or parse_qs(url.query).get('path') or [''])[0]
+            param = {k: v[0] for k, v in parse_qs((form.get('param') or [''])[0]).items()}
+            postid = param.get('postid', '')
+            p = int(param.get('p', 1))
+            ps = int(param.get('ps', 30))
+            if path == REPLY_LIST_PATH:
+                return self._send_json(data.reply_page(postid, p, ps))
+            if path == SUB_REPLY_PATH:
+                return self._send_json(data.sub_reply_page(postid, int(param.get('replyid', 0)), p, ps))
+            return self._send_json({'rc': 0, 'me': f'unknown path {path}'}, status=400)
+
+    return Handler
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0, data: StubReplyData = None):
+    """在后台线程启动 stub，返回 (server, api_url)；port=0 时自动选择空闲端口。"""
+    server = ThreadingHTTPServer((host, port), make_handler(data or StubReplyData()))
+    t = threading.Thread(target=server.serve_forever, name="comment-api-stub", daemon=True)
+    t.start()
+    return server, f"http://{host}:{server.server_address[1]}/api/getData"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local stub for the guba reply JSON API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--replies", type=int, default=75, help="每个帖子的一级回复数")
+    ap.add_argument("--subs", type=int, default=4, help="带子回复的一级回复下的子回复数")
+    args = ap.parse_args()
+    srv = ThreadingHTTPServer((args.host, args.port), make_handler(StubReplyData(args.replies, args.subs)))
+    print(f"stub reply API listening on http://{args.host}:{args.port}/api/getData")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
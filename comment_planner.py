@@ -0,0 +1,243 @@
+"""
+comment_planner.py
+
+评论抓取的按成本分配：帖子之间的成本差别很大（comment_num 为 3 的帖子一次请求，2000 条的需要几十页回复），
+按帖子顺序平均分给多个 worker 时，分到大帖的 worker 会拖到最后。这里
+- 按 comment_num 估算每个帖子的回复页数，用历史实测耗时（CostHistory）拟合 秒 = 固定开销 + 每页耗时 × 页数；
+- 接口模式（--use-api）下把页数超过 split_pages 的帖子拆成若干个页区间子任务（CommentAPIClient.fetch_comments
+  的 start_page / end_page），最后一段不设上限，抓取时评论数已增长也不会遗漏；
+- 用 LPT（按成本从大到小，每次放进当前总成本最小的 worker）把任务装箱成 N 份，各 worker 的总成本接近。
+历史文件会随抓取不断更新，因此计划写入文件（默认 comment_plan_{symbol}.json）后由各 worker 共用：
+run_comments.py --workers N 在文件不存在时生成并保存，之后的 worker 与中断后的重跑都读取同一份计划；
+多个 worker 同时启动时各自算出的计划只有第一个写入成功（硬链接到目标文件名，已存在则失败），其余读取它。
+开始新一轮时加 --replan（或删除该文件），--replan 直接覆盖，只应由一个进程执行，其余 worker 在它写完后再启动；
+也可以先用本脚本生成计划再启动各 worker。
+
+示例：
+    python comment_planner.py --symbol 000333 --workers 4 --use-api --out comment_plan_000333.json
+    python run_comments.py --symbol 000333 --use-api --plan comment_plan_000333.json --worker-index 0
+"""
+
+import os
+import sys
+import json
+import datetime
+import math
+import heapq
+import logging
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("comment_planner")
+
+# 与 CommentAPIClient 默认的 ps 相同
+PAGE_SIZE = 30
+# 没有历史样本时的默认成本（秒）：(固定开销, 每页耗时)；浏览器模式的固定开销包含打开帖子页与随机等待
+DEFAULT_COSTS = {"api": (1.0, 0.6), "browser": (6.0, 0.4)}
+# 超过这么多页的帖子在接口模式下拆成子任务
+DEFAULT_SPLIT_PAGES = 20
+MAX_SAMPLES = 2000
+
+
+def _as_count(value) -> int:
+    if isinstance(value, int):
+        return max(value, 0)
+    try:
+        return max(int(float(str(value).replace(",", "").strip())), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def estimate_pages(comment_num, page_size: int = PAGE_SIZE) -> int:
+    """按评论数估算一级回复的页数（至少 1 页）。"""
+    return max(1, math.ceil(_as_count(comment_num) / page_size))
+
+
+class CostHistory(object):
+    """
+    实测耗时样本 {mode: [[页数, 秒], ...]}，保存在 JSON 文件中（默认 comment_costs_{symbol}.json），
+    每种模式最多保留最近 MAX_SAMPLES 条。fit() 用最小二乘拟合 秒 = a + b × 页数，样本不足时返回默认值。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.samples: Dict[str, List[List[float]]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.samples = json.load(f).get("samples", {})
+            except (OSError, ValueError) as e:
+                logger.warning("[CostHistory] 读取 %s 失败，从空开始: %s", path, e)
+
+    def record(self, mode: str, pages: int, seconds: float):
+        rows = self.samples.setdefault(mode, [])
+        rows.append([int(pages), round(float(seconds), 3)])
+        del rows[:-MAX_SAMPLES]
+
+    def fit(self, mode: str, min_samples: int = 5) -> Tuple[float, float]:
+        default = DEFAULT_COSTS[mode]
+        rows = self.samples.get(mode) or []
+        if len(rows) < min_samples:
+            return default
+        n = len(rows)
+        mx = sum(p for p, _ in rows) / n
+        my = sum(s for _, s in rows) / n
+        var = sum((p - mx) ** 2 for p, _ in rows)
+        if var == 0:
+            # 样本页数都相同时无法区分固定开销与每页耗时，按默认的每页耗时分摊
+            b = default[1]
+        else:
+            b = max(sum((p - mx) * (s - my) for p, s in rows) / var, 0.0)
+        a = max(my - b * mx, 0.1)
+        return a, b
+
+    def save(self):
+        if not self.path:
+            return
+        # 多个 worker 共用同一个历史文件，各自写临时文件后替换（后写入的覆盖先写入的，只丢失少量样本）
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"samples": self.samples}, f)
+        os.replace(tmp, self.path)
+
+
+def make_tasks(posts: Iterable[dict], mode: str = "api", history: Optional[CostHistory] = None,
+               split_pages: int = DEFAULT_SPLIT_PAGES, page_size: int = PAGE_SIZE) -> List[dict]:
+    """
+    把帖子转换为带成本估计的任务：{'post_url', 'comment_num', 'start_page', 'end_page', 'pages', 'cost'}。
+    end_page 为 None 表示抓到最后一页；只有接口模式会拆分大帖（浏览器方式一次打开整个帖子页）。
+    """
+    a, b = history.fit(mode) if history is not None else DEFAULT_COSTS[mode]
+    tasks = []
+    for post in posts:
+        url = post.get("post_url")
+        if not url:
+            continue
+        comment_num = _as_count(post.get("comment_num"))
+        pages = estimate_pages(comment_num, page_size)
+        if mode == "api" and split_pages and pages > split_pages:
+            ranges = [(s, s + split_pages - 1) for s in range(1, pages + 1, split_pages)]
+            ranges[-1] = (ranges[-1][0], None)
+        else:
+            ranges = [(1, None)]
+        for start, end in ranges:
+            n = (end if end is not None else pages) - start + 1
+            tasks.append({"post_url": url, "comment_num": comment_num, "start_page": start, "end_page": end,
+                          "pages": n, "cost": round(a + b * n, 3)})
+    return tasks
+
+
+def pack_tasks(tasks: List[dict], workers: int) -> List[List[dict]]:
+    """LPT 装箱：按成本降序，每个任务放进当前总成本最小的 worker；每个 worker 内按成本降序执行。"""
+    if workers < 1:
+        raise ValueError("workers must be >= 1")
+    bins = [[] for _ in range(workers)]
+    heap = [(0.0, i) for i in range(workers)]
+    # 成本相同时按 URL / 起始页排序，保证每个进程算出的分配一致
+    for task in sorted(tasks, key=lambda t: (-t["cost"], t["post_url"], t["start_page"])):
+        load, i = heapq.heappop(heap)
+        bins[i].append(task)
+        heapq.heappush(heap, (load + task["cost"], i))
+    return bins
+
+
+def plan_summary(bins: List[List[dict]]) -> dict:
+    loads = [sum(t["cost"] for t in b) for b in bins]
+    total = sum(loads)
+    return {
+        "workers": len(bins),
+        "tasks": sum(len(b) for b in bins),
+        "loads": [round(x, 1) for x in loads],
+        "makespan": round(max(loads) if loads else 0.0, 1),
+        "ideal": round(total / len(bins), 1) if bins else 0.0,
+    }
+
+
+def naive_makespan(tasks: List[dict], workers: int) -> float:
+    """按帖子顺序平均切分（原来的分配方式）时最慢 worker 的估计耗时，用于对比。"""
+    posts = {}
+    for t in tasks:
+        posts[t["post_url"]] = posts.get(t["post_url"], 0.0) + t["cost"]
+    costs = list(posts.values())
+    size = math.ceil(len(costs) / workers) if costs else 0
+    return max((sum(costs[i:i + size]) for i in range(0, len(costs), size)), default=0.0) if size else 0.0
+
+
+def save_plan(path: str, bins: List[List[dict]], meta: Optional[dict] = None,
+              exclusive: bool = False) -> Optional[dict]:
+    """
+    写出计划文件，返回写入的 meta（带 plan_id，run_comments 用它区分不同计划的进度）。
+    exclusive=True 时只在文件不存在时写入（写完临时文件后硬链接到目标名，读者不会看到写了一半的文件），
+    已存在则不写并返回 None，由调用方改为 load_plan。
+    """
+    meta = dict(meta or {}, plan_id=datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "summary": plan_summary(bins), "workers": bins}, f, ensure_ascii=False)
+    if not exclusive:
+        os.replace(tmp, path)
+        return meta
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        return None
+    finally:
+        os.remove(tmp)
+    return meta
+
+
+def load_plan(path: str) -> Tuple[List[List[dict]], dict]:
+    """返回 (各 worker 的任务列表, meta)。"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data["workers"], data.get("meta", {})
+
+
+def plan_path(symbol: str) -> str:
+    return f"comment_plan_{symbol}.json"
+
+
+def cost_history_path(symbol: str) -> str:
+    return f"comment_costs_{symbol}.json"
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="按估计成本把评论抓取任务分配给多个 worker")
+    ap.add_argument("--symbol", required=True)
+    ap.add_argument("--workers", type=int, required=True)
+    ap.add_argument("--use-api", action="store_true", help="按接口模式估算（可拆分大帖）")
+    ap.add_argument("--split-pages", type=int, default=DEFAULT_SPLIT_PAGES, help="超过此页数的帖子拆分为子任务")
+    ap.add_argument("--history", default=None, help="历史耗时文件（默认 comment_costs_{symbol}.json）")
+    ap.add_argument("--skip-done", action="store_true", help="排除已抓过评论的帖子（含确认没有评论的帖子）")
+    ap.add_argument("--out", default=None, help="写出计划文件（如 comment_plan_{symbol}.json；默认只打印汇总）")
+    args = ap.parse_args()
+
+    from mongodb import MongoAPI
+
+    m_posts = MongoAPI.for_symbol("post", args.symbol)
+    posts = m_posts.find({}, {"_id": 0, "post_url": 1, "comment_num": 1})
+    if args.skip_done:
+        from seen_urls import load_comment_done
+        m_comments = MongoAPI.for_symbol("comment", args.symbol)
+        done = load_comment_done(m_comments, args.symbol, path=f"seen_comment_{args.symbol}.bin")
+        posts = [p for p in posts if p.get("post_url") not in done]
+
+    mode = "api" if args.use_api else "browser"
+    history = CostHistory(args.history or cost_history_path(args.symbol))
+    a, b = history.fit(mode)
+    tasks = make_tasks(posts, mode, history, split_pages=args.split_pages)
+    bins = pack_tasks(tasks, args.workers)
+    summary = plan_summary(bins)
+    logger.info("%d 个帖子 -> %d 个任务，成本模型 %.2fs + %.2fs/页", len(posts), len(tasks), a, b)
+    logger.info("各 worker 估计耗时: %s", summary["loads"])
+    logger.info("最慢 worker %.0fs（理想 %.0fs），按顺序平均切分为 %.0fs", summary["makespan"], summary["ideal"],
+                naive_makespan(tasks, args.workers))
+    if args.out:
+        save_plan(args.out, bins, {"symbol": args.symbol, "mode": mode, "cost_model": [a, b]})
+        logger.info("计划已写入 %s", args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,7 @@ crawler.py
 
 包含稳健的 WebDriver 管理与重连策略，以及 PostCrawler / CommentCrawler 的实现骨架。
 - 自动在可用时使用 webdriver-manager 下载 chromedriver，失败则回退到 CHROME_DRIVER_PATH 或 PATH.
-- 每个 driver 使用独立的临时 user-data-dir，避免 profile 冲突。
+- 每个 driver 使用独立的临时 user-data-dir，避免 profile 冲突；HTTP 磁盘缓存可放在跨重启共享的缓存槽位中。
 - 对关键的浏览器操作使用重试装饰器：遇到可恢复错误时自动重启 driver 并重试（指数退避）。
 - 与仓库中的 parser.py、mongodb.py 协同工作。
 """
@@ -15,8 +15,9 @@ import random
 import tempfile
 import shutil
 import logging
-import traceback
-import hashlib
+import math
+import threading
+import collections
 from typing import Tuple, Optional
 
 from selenium import webdriver
@@ -37,21 +38,215 @@ try:
 except Exception:
     _has_requests = False
 
+try:
+    import psutil
+    _has_psutil = True
+except Exception:
+    _has_psutil = False
+
+# 缓存槽位的进程间锁：POSIX 用 fcntl.flock，Windows 用 msvcrt.locking
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 # project modules
-from parser import PostParser, CommentParser
-from mongodb import MongoAPI
+from parser import PostParser, CommentParser, LIST_ROWS_JS, guba_base_url
+from mongodb import MongoAPI, post_doc_id
+from comment_api import CommentAPIClient
+from seen_urls import SeenURLSet, load_seen_urls
+from daily_stats import daily_stats_enabled, get_daily_stats
 
 logger = logging.getLogger(__name__)
 
+PROFILE_PREFIX = "em_crawler_profile_"
+
+# 共享磁盘缓存：缓存根目录下的 slot_{n} 子目录，同一时刻每个槽位只给一个浏览器使用（Chrome 的磁盘缓存不支持多进程共用），
+# 占用者对 slot_{n}.lock 加操作系统文件锁（内容为 pid，仅供排查）；浏览器退出后释放，下一个浏览器复用同一槽位中已缓存的 JS/CSS/字体
+CACHE_SLOT_PREFIX = "slot_"
+DEFAULT_DISK_CACHE_MB = 256
+DEFAULT_CACHE_SLOTS = 8
+# 复制模板 profile 时跳过的运行期锁文件
+_TEMPLATE_IGNORE = shutil.ignore_patterns("Singleton*", "lockfile", "DevToolsActivePort", "*.tmp")
+# profile -> 该浏览器占用的缓存槽位锁（打开的锁文件；_dispose 为静态方法，通过这里找到要释放的槽位）
+_cache_slot_locks = {}
+_cache_slot_mutex = threading.Lock()
+
+# 列表页回退选择器：div.table_list 中第 3 列带链接的 tr（在页面内过滤，返回 WebElement 列表）
+FALLBACK_ROWS_JS = """
+return Array.from(document.querySelectorAll('div.table_list tr'))
+    .filter(function (tr) { return tr.querySelector('td:nth-child(3) a'); });
+"""
+
+# 列表页分页信息：优先 article_list.count（帖子总数），其次旧版 span.pagernums 的 data-pager，
+# 最后取分页器链接里的最大页码
+PAGER_INFO_JS = """
+var info = {count: 0, page_size: 0, max_page: 0};
+try {
+    if (window.article_list && article_list.count) {
+        info.count = parseInt(article_list.count, 10) || 0;
+    }
+} catch (e) {}
+var pn = document.querySelector('span.pagernums');
+if (!info.count && pn && pn.getAttribute('data-pager')) {
+    var parts = pn.getAttribute('data-pager').split('|');
+    info.count = parseInt(parts[1], 10) || 0;
+    info.page_size = parseInt(parts[2], 10) || 0;
+}
+document.querySelectorAll('.paging a, .pager a, ul.paging li, span.pagernums a').forEach(function (a) {
+    var n = parseInt((a.textContent || '').trim(), 10);
+    if (n > info.max_page) { info.max_page = n; }
+});
+return info;
+"""
+
+
+
+def _try_lock(f) -> bool:
+    """对打开的文件加非阻塞排他锁；同一进程内另一次 open 得到的句柄同样互斥。"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def acquire_cache_slot(cache_root: str, max_slots: int = DEFAULT_CACHE_SLOTS):
+    """
+    在 cache_root 下占用一个空闲的缓存槽位，返回 (缓存目录, 锁)；全部被占用时返回 None。
+    锁为对 slot_{n}.lock 持有的操作系统文件锁，占用进程退出（包括被强杀）时由系统释放，不需要判断遗留锁，
+    也就不存在两个进程同时接管同一个遗留锁的竞争。锁文件本身保留，只在释放时解锁。
+    """
+    os.makedirs(cache_root, exist_ok=True)
+    for n in range(max_slots):
+        slot_dir = os.path.join(cache_root, f"{CACHE_SLOT_PREFIX}{n}")
+        try:
+            f = open(slot_dir + ".lock", "a+", encoding="ascii")
+        except OSError as e:
+            logger.debug("[WebDriverManager] open cache slot lock %s failed: %s", slot_dir, e)
+            continue
+        if not _try_lock(f):
+            f.close()
+            continue
+        try:
+            f.seek(0)
+            f.truncate()
+            f.write(str(os.getpid()))
+            f.flush()
+            os.makedirs(slot_dir, exist_ok=True)
+        except OSError:
+            release_cache_slot(f)
+            raise
+        return slot_dir, f
+    return None
+
+
+def release_cache_slot(lock):
+    """释放 acquire_cache_slot 返回的锁（关闭文件即解锁）。"""
+    if lock is None:
+        return
+    try:
+        if fcntl is None:
+            # Windows 要求关闭前显式解锁，否则锁的释放时间不确定
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+        lock.close()
+    except OSError as e:
+        logger.debug("[WebDriverManager] release cache slot error: %s", e)
+
 
 class WebDriverManager:
-    """创建/销毁 Chrome WebDriver，使用独立临时 profile，支持多种 driver 路径回退策略。"""
+    """创建/销毁 Chrome WebDriver，使用独立临时 profile，支持多种 driver 路径回退策略。
+
+    max_rss_mb（或环境变量 CHROME_MAX_RSS_MB）设置后，over_memory_limit() 会统计 chromedriver
+    整个进程树（含 Chrome 渲染进程）的 RSS，供爬虫在两页之间主动回收 driver。需要 psutil。
+
+    backend（或环境变量 BROWSER_BACKEND）：
+    - 'selenium'（默认）：chromedriver + Selenium WebDriver。
+    - 'cdp'：直接启动 Chrome 并通过 DevTools websocket 通信（cdp_backend.SyncCDPBrowser），
+      不需要 chromedriver；只支持 get / execute_script / page_source / quit，不提供 WebElement。
+
+    standby=True（或环境变量 CHROME_STANDBY=1）时，在当前 driver 工作期间于后台线程预先启动一个备用 driver；
+    restart_driver() 直接换上备用 driver，旧 driver 在后台线程退出并清理 profile，重启几乎不占用抓取时间。
+    代价是同一时刻多一个 Chrome 进程树的内存。
+
+    disk_cache_dir（或环境变量 CHROME_DISK_CACHE_DIR）设置后，HTTP 磁盘缓存不再放在每次新建的临时 profile 中，
+    而是放在该目录下的一个槽位里（见 acquire_cache_slot），重启后的浏览器复用已缓存的 JS/CSS/字体，只重新请求页面本身；
+    cookie、localStorage 与 profile 锁仍在各自的临时 profile 中。disk_cache_size_mb（CHROME_DISK_CACHE_MB）为每个槽位的上限。
+    profile_template（CHROME_PROFILE_TEMPLATE）给出时，每个新 profile 先复制该模板目录（跳过运行期锁文件）再启动。
+    """
 
-    def __init__(self, headless: bool = False):
+    def __init__(self, headless: bool = False, max_rss_mb: Optional[float] = None, backend: Optional[str] = None,
+                 standby: Optional[bool] = None, disk_cache_dir: Optional[str] = None,
+                 disk_cache_size_mb: Optional[float] = None, profile_template: Optional[str] = None):
         self.headless = headless
+        self.backend = (backend or os.environ.get("BROWSER_BACKEND") or "selenium").lower()
+        if self.backend not in ("selenium", "cdp"):
+            raise ValueError(f"unknown browser backend: {self.backend}")
         self.driver = None
         self.user_data_dir = None
         self.service = None
+        if max_rss_mb is None:
+            try:
+                max_rss_mb = float(os.environ.get("CHROME_MAX_RSS_MB") or 0) or None
+            except ValueError:
+                max_rss_mb = None
+        self.max_rss_mb = max_rss_mb
+        if standby is None:
+            standby = os.environ.get("CHROME_STANDBY") == "1"
+        self.standby = standby
+        self._standby_lock = threading.Lock()
+        self._standby_thread = None
+        self._standby_result = None  # (driver, profile, service) 或 Exception
+        self._disposers = []
+        self.disk_cache_dir = disk_cache_dir or os.environ.get("CHROME_DISK_CACHE_DIR") or None
+        if disk_cache_size_mb is None:
+            try:
+                disk_cache_size_mb = float(os.environ.get("CHROME_DISK_CACHE_MB") or 0) or None
+            except ValueError:
+                disk_cache_size_mb = None
+        self.disk_cache_size_mb = disk_cache_size_mb
+        self.profile_template = profile_template or os.environ.get("CHROME_PROFILE_TEMPLATE") or None
+
+    def _new_profile(self) -> Tuple[str, list]:
+        """创建临时 profile（按需从模板复制）并占用缓存槽位，返回 (profile, 额外的 Chrome 参数)。"""
+        user_data_dir = tempfile.mkdtemp(prefix=PROFILE_PREFIX)
+        args = []
+        try:
+            if self.profile_template:
+                shutil.copytree(self.profile_template, user_data_dir, dirs_exist_ok=True, ignore=_TEMPLATE_IGNORE)
+            if self.disk_cache_dir:
+                slot = acquire_cache_slot(self.disk_cache_dir)
+                if slot is None:
+                    logger.warning("[WebDriverManager] no free cache slot under %s, using profile-local cache",
+                                   self.disk_cache_dir)
+                else:
+                    with _cache_slot_mutex:
+                        _cache_slot_locks[user_data_dir] = slot[1]
+                    args.append(f"--disk-cache-dir={os.path.abspath(slot[0])}")
+            if self.disk_cache_dir or self.disk_cache_size_mb:
+                size_mb = self.disk_cache_size_mb or DEFAULT_DISK_CACHE_MB
+                args.append(f"--disk-cache-size={int(size_mb * 1024 * 1024)}")
+        except Exception:
+            self._release_profile(user_data_dir, ignore_errors=True)
+            raise
+        return user_data_dir, args
+
+    @staticmethod
+    def _release_profile(user_data_dir, ignore_errors: bool = False):
+        """释放 profile 占用的缓存槽位并删除 profile 目录。"""
+        if not user_data_dir:
+            return
+        with _cache_slot_mutex:
+            lock = _cache_slot_locks.pop(user_data_dir, None)
+        release_cache_slot(lock)
+        if os.path.exists(user_data_dir):
+            shutil.rmtree(user_data_dir, ignore_errors=ignore_errors)
 
     def _find_driver_path(self) -> Optional[str]:
         # 尝试 webdriver-manager
@@ -79,7 +274,24 @@ class WebDriverManager:
 
         return None
 
-    def create_driver(self) -> Tuple[webdriver.Chrome, str]:
+    def _launch_cdp(self):
+        from cdp_backend import SyncCDPBrowser
+        headless = self.headless or os.environ.get("HEADLESS") == "1"
+        user_data_dir, extra_args = self._new_profile()
+        port = random.randint(20000, 40000)
+        try:
+            driver = SyncCDPBrowser.launch(user_data_dir, port, headless=headless, extra_args=extra_args)
+        except Exception:
+            self._release_profile(user_data_dir, ignore_errors=True)
+            raise
+        logger.info("[WebDriverManager] started Chrome via CDP (port=%s, profile=%s)", port, user_data_dir)
+        return driver, user_data_dir, None
+
+    def _launch(self):
+        """启动一个新的浏览器并返回 (driver, profile, service)，不修改当前 driver。"""
+        if self.backend == "cdp":
+            return self._launch_cdp()
+
         driver_path = self._find_driver_path()
         if not driver_path:
             raise RuntimeError("无法找到 chromedriver。请设置 CHROME_DRIVER_PATH 或把 chromedriver 放入 PATH，或允许联网以使用 webdriver-manager。")
@@ -103,40 +315,271 @@ class WebDriverManager:
             options.binary_location = chrome_bin
             logger.info("[WebDriverManager] Chrome binary: %s", chrome_bin)
 
-        # 使用独立临时 profile
-        self.user_data_dir = tempfile.mkdtemp(prefix="em_crawler_profile_")
-        options.add_argument(f"--user-data-dir={self.user_data_dir}")
+        # 使用独立临时 profile（磁盘缓存可放在共享缓存槽位中）
+        user_data_dir, extra_args = self._new_profile()
+        options.add_argument(f"--user-data-dir={user_data_dir}")
+        for arg in extra_args:
+            options.add_argument(arg)
 
         # 随机 remote debugging 端口，降低冲突概率
         port = random.randint(20000, 40000)
         options.add_argument(f"--remote-debugging-port={port}")
 
         # 启动 driver
-        self.service = Service(driver_path)
-        driver = webdriver.Chrome(service=self.service, options=options)
+        service = Service(driver_path)
+        try:
+            driver = webdriver.Chrome(service=service, options=options)
+        except Exception:
+            self._release_profile(user_data_dir, ignore_errors=True)
+            raise
 
-        self.driver = driver
-        logger.info("[WebDriverManager] started chromedriver (port=%s, profile=%s)", port, self.user_data_dir)
-        return driver, self.user_data_dir
+        logger.info("[WebDriverManager] started chromedriver (port=%s, profile=%s)", port, user_data_dir)
+        return driver, user_data_dir, service
 
-    def quit_driver(self):
+    # ---- 备用 driver ----
+
+    def _standby_main(self):
         try:
-            if self.driver:
+            result = self._launch()
+        except Exception as e:
+            logger.warning("[WebDriverManager] standby driver launch failed: %s", e)
+            result = e
+        with self._standby_lock:
+            self._standby_result = result
+
+    def _start_standby(self):
+        """若启用 standby 且当前没有备用/正在启动的 driver，则在后台线程启动一个。"""
+        if not self.standby:
+            return
+        with self._standby_lock:
+            if self._standby_thread is not None:
+                return
+            self._standby_result = None
+            self._standby_thread = threading.Thread(target=self._standby_main, name="driver-standby", daemon=True)
+            self._standby_thread.start()
+
+    def _take_standby(self):
+        """取出备用 driver（仍在启动中则等待它完成）；没有可用备用时返回 None。"""
+        with self._standby_lock:
+            t = self._standby_thread
+        if t is None:
+            return None
+        t.join()
+        with self._standby_lock:
+            result, self._standby_result, self._standby_thread = self._standby_result, None, None
+        return result if isinstance(result, tuple) else None
+
+    def _install(self, launched):
+        self.driver, self.user_data_dir, self.service = launched
+        return self.driver, self.user_data_dir
+
+    def create_driver(self) -> Tuple[webdriver.Chrome, str]:
+        launched = self._take_standby()
+        if launched is not None:
+            logger.info("[WebDriverManager] using standby driver (profile=%s)", launched[1])
+        else:
+            launched = self._launch()
+        driver, profile = self._install(launched)
+        self._start_standby()
+        return driver, profile
+
+    def restart_driver(self) -> Tuple[webdriver.Chrome, str]:
+        """
+        用新 driver 替换当前 driver：启用 standby 时换上预启动的备用 driver，
+        旧 driver 在后台线程退出，几乎不阻塞调用方；否则同步退出旧 driver 再启动新的。
+        """
+        if not self.standby:
+            self.quit_driver()
+            return self.create_driver()
+        old = (self.driver, self.user_data_dir, self.service)
+        self.driver, self.user_data_dir, self.service = None, None, None
+        if old[0] is not None or old[1] is not None:
+            t = threading.Thread(target=self._dispose, args=old, name="driver-dispose", daemon=True)
+            t.start()
+            self._disposers = [d for d in self._disposers if d.is_alive()] + [t]
+        return self.create_driver()
+
+    recycle = restart_driver
+
+    @staticmethod
+    def _dispose(driver, user_data_dir, service=None):
+        """退出 driver 并删除其临时 profile。"""
+        try:
+            if driver:
                 try:
-                    self.driver.quit()
+                    driver.quit()
                 except Exception as e:
                     logger.debug("[WebDriverManager] driver.quit() error: %s", e)
-                self.driver = None
         finally:
-            # 清理 temp profile
             try:
-                if self.user_data_dir and os.path.exists(self.user_data_dir):
-                    shutil.rmtree(self.user_data_dir)
+                WebDriverManager._release_profile(user_data_dir)
             except Exception as e:
                 logger.debug("[WebDriverManager] remove profile error: %s", e)
+
+    def quit_driver(self, include_standby: bool = True):
+        """退出当前 driver；include_standby 时同时退出备用 driver 并等待后台退出中的旧 driver。"""
+        try:
+            self._dispose(self.driver, self.user_data_dir)
+        finally:
+            self.driver = None
             self.user_data_dir = None
             self.service = None
             logger.info("[WebDriverManager] stopped chromedriver and cleaned profile.")
+        if include_standby:
+            launched = self._take_standby()
+            if launched is not None:
+                self._dispose(*launched)
+                logger.info("[WebDriverManager] stopped standby driver.")
+            for t in self._disposers:
+                t.join(timeout=30)
+            self._disposers = []
+
+    def process_tree_rss(self) -> Optional[int]:
+        """返回 chromedriver 及其全部子进程（Chrome browser/renderer/gpu）的 RSS 之和（字节）；无法统计时返回 None。"""
+        if not _has_psutil:
+            return None
+        # selenium 后端以 chromedriver 为根；cdp 后端以 Chrome 主进程为根
+        owner = self.service if self.service is not None else self.driver
+        proc = getattr(owner, "process", None)
+        if proc is None:
+            return None
+        try:
+            root = psutil.Process(proc.pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        total = 0
+        for p in procs:
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    def over_memory_limit(self) -> bool:
+        if not self.max_rss_mb or self.driver is None:
+            return False
+        rss = self.process_tree_rss()
+        if rss is None:
+            return False
+        rss_mb = rss / (1024 * 1024)
+        logger.debug("[WebDriverManager] driver tree RSS %.0f MB (limit %.0f MB)", rss_mb, self.max_rss_mb)
+        if rss_mb > self.max_rss_mb:
+            logger.warning("[WebDriverManager] driver tree RSS %.0f MB exceeds limit %.0f MB", rss_mb, self.max_rss_mb)
+            return True
+        return False
+
+
+def _profile_dirs_in_use() -> set:
+    """收集正在运行的进程命令行中引用的 --user-data-dir。"""
+    in_use = set()
+    for p in psutil.process_iter(["cmdline"]):
+        try:
+            for arg in p.info.get("cmdline") or []:
+                if arg.startswith("--user-data-dir="):
+                    in_use.add(os.path.normcase(os.path.abspath(arg.split("=", 1)[1])))
+        except Exception:
+            continue
+    return in_use
+
+
+def sweep_orphaned_profiles(min_age_s: float = 600, stale_age_s: float = 86400) -> int:
+    """
+    删除被遗留的 em_crawler_profile_* 临时目录（进程被杀时 quit_driver 来不及清理）。
+    - 有 psutil：不被任何运行中进程引用且修改时间超过 min_age_s 的目录即视为孤儿。
+    - 无 psutil：只删除超过 stale_age_s 未修改的目录，避免误删正在使用的 profile。
+    返回删除的目录数。
+    """
+    tmp_root = tempfile.gettempdir()
+    in_use = _profile_dirs_in_use() if _has_psutil else set()
+    age_limit = min_age_s if _has_psutil else stale_age_s
+    now = time.time()
+    removed = 0
+    try:
+        names = os.listdir(tmp_root)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.startswith(PROFILE_PREFIX):
+            continue
+        path = os.path.join(tmp_root, name)
+        try:
+            if not os.path.isdir(path) or now - os.path.getmtime(path) < age_limit:
+                continue
+            if os.path.normcase(os.path.abspath(path)) in in_use:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        except OSError as e:
+            logger.debug("[sweeper] remove %s error: %s", path, e)
+    if removed:
+        logger.info("[sweeper] removed %d orphaned profile dirs under %s", removed, tmp_root)
+    return removed
+
+
+def _uses_our_profile(cmdline) -> bool:
+    """命令行中的 --user-data-dir 是否为本项目创建的 em_crawler_profile_* 临时 profile。"""
+    for arg in cmdline or []:
+        if arg.startswith("--user-data-dir="):
+            path = arg.split("=", 1)[1].strip('"').rstrip("/\\")
+            if os.path.basename(path).startswith(PROFILE_PREFIX):
+                return True
+    return False
+
+
+def kill_orphaned_chromedrivers() -> int:
+    """
+    结束父进程已退出、且能确认属于本项目的 chromedriver 与 Chrome：
+    Chrome 需使用 em_crawler_profile_* 作为 --user-data-dir；chromedriver 需有这样的 Chrome 子进程。
+    不能确认归属的进程（nohup 启动的 chromedriver、Selenium grid 节点、其它工具的 driver）即使失去父进程也不处理；
+    父进程仍存活的实例属于其它正在运行的爬虫，同样不处理。需要 psutil，返回结束的进程数。
+    """
+    if not _has_psutil:
+        return 0
+    killed = 0
+    for p in psutil.process_iter(["name", "cmdline", "ppid"]):
+        try:
+            name = (p.info.get("name") or "").lower()
+            if "chrome" not in name:
+                continue
+            ppid = p.info.get("ppid")
+            orphaned = ppid in (0, 1) or not psutil.pid_exists(ppid)
+            if not orphaned:
+                continue
+            children = p.children(recursive=True)
+            if name.startswith("chromedriver"):
+                ours = any(_uses_our_profile(c.cmdline()) for c in children if "chrome" in c.name().lower())
+            else:
+                ours = _uses_our_profile(p.info.get("cmdline"))
+            if not ours:
+                continue
+            for child in children:
+                try:
+                    child.kill()
+                except psutil.Error:
+                    pass
+            p.kill()
+            killed += 1
+        except psutil.Error:
+            continue
+    if killed:
+        logger.info("[sweeper] killed %d orphaned chromedriver/chrome processes", killed)
+    return killed
+
+
+def sweep_leaked_resources(min_age_s: float = 600) -> Tuple[int, int]:
+    """启动时调用：先结束孤儿 chromedriver，再清理它们遗留的 profile 目录。"""
+    killed = 0
+    removed = 0
+    try:
+        killed = kill_orphaned_chromedrivers()
+    except Exception as e:
+        logger.debug("[sweeper] kill orphaned chromedriver error: %s", e)
+    try:
+        removed = sweep_orphaned_profiles(min_age_s=min_age_s)
+    except Exception as e:
+        logger.debug("[sweeper] sweep profiles error: %s", e)
+    return killed, removed
 
 
 def _is_recoverable_exception(exc: Exception) -> bool:
@@ -153,6 +596,16 @@ def _is_recoverable_exception(exc: Exception) -> bool:
     return False
 
 
+# retry_on_driver_error 的累计重试次数（按被装饰方法名），供 load_test.py 等汇总
+retry_counts = collections.Counter()
+_retry_counts_lock = threading.Lock()
+
+
+def reset_retry_counts():
+    with _retry_counts_lock:
+        retry_counts.clear()
+
+
 def retry_on_driver_error(max_attempts=3, base_delay=2.0):
     """
     装饰器：对包含 webdriver 操作的方法进行重试。遇可恢复异常时调用对象的 _restart_driver()（若存在）。
@@ -168,9 +621,11 @@ def retry_on_driver_error(max_attempts=3, base_delay=2.0):
                     last_exc = e
                     if _is_recoverable_exception(e):
                         attempts += 1
+                        with _retry_counts_lock:
+                            retry_counts[func.__name__] += 1
                         wait = base_delay * (2 ** (attempts - 1)) + random.random()
                         logger.warning("[retry] attempt %d: recoverable %s, wait %.1fs then restart driver", attempts, type(e).__name__, wait)
-                        logger.debug(traceback.format_exc())
+                        logger.debug("[retry] %s traceback", func.__name__, exc_info=True)
                         try:
                             restart = getattr(self, "_restart_driver", None)
                             if callable(restart):
@@ -192,63 +647,120 @@ def retry_on_driver_error(max_attempts=3, base_delay=2.0):
 
 
 class PostCrawler:
-    """帖子爬虫：使用 WebDriverManager 管理浏览器，解析后批量写入 Mongo。"""
+    """帖子爬虫：使用 WebDriverManager 管理浏览器，解析后批量写入 Mongo。
 
-    def __init__(self, symbol: str, headless: bool = False):
+    可传入已有的 wdm / mongo 以复用同一个浏览器与 Mongo 连接（例如 process_runner 的 worker 进程）；
+    此时 crawl_post_info 结束后不会关闭外部传入的 driver。
+    """
+
+    def __init__(self, symbol: str, headless: bool = False,
+                 wdm: Optional[WebDriverManager] = None, mongo: Optional[MongoAPI] = None,
+                 backend: Optional[str] = None,
+                 change_cache: bool = True, snapshot_mode: Optional[str] = None,
+                 seen_urls: Optional[SeenURLSet] = None, daily_stats: Optional[bool] = None):
         self.symbol = symbol
         self.headless = headless
-        self.wdm = WebDriverManager(headless=headless)
-        self.driver, self.profile = self.wdm.create_driver()
+        self._owns_driver = wdm is None
+        self.wdm = wdm or WebDriverManager(headless=headless, backend=backend)
+        if self.wdm.driver is None:
+            self.driver, self.profile = self.wdm.create_driver()
+        else:
+            self.driver, self.profile = self.wdm.driver, self.wdm.user_data_dir
         self.parser = PostParser()
-        self.mongo = MongoAPI("post_info", f"post_{symbol}")
+        self.mongo = mongo or MongoAPI.for_symbol("post", symbol)
+        if change_cache:
+            # 未变化（post_view/comment_num 相同）的帖子不再重写，只按页记录一次"最后看到"
+            self.mongo.enable_change_cache()
+        # 可选：把 post_view/comment_num 的变化追加到快照集合（'timeseries' 或 'bucket'，也可用 EM_SNAPSHOT_MODE）
+        snapshot_mode = snapshot_mode or os.environ.get("EM_SNAPSHOT_MODE") or None
+        if snapshot_mode:
+            from snapshots import get_snapshot_sink
+            self.mongo.add_change_listener(get_snapshot_sink(self.mongo, symbol, snapshot_mode).record)
+        # 可选：增量维护 daily_stats（也可用 EM_DAILY_STATS=1），每页写入后只重算涉及的日期
+        self.daily_stats = None
+        if daily_stats_enabled(daily_stats):
+            self.daily_stats = get_daily_stats(self.mongo, symbol, 'post')
+            self.mongo.add_change_listener(self.daily_stats.record)
         self._page_sleep = 0.5
+        self._current_page = None
+        # 已见帖子 URL 集合（可外部传入共享；crawl_post_info(incremental=True) 时按需加载）
+        self.seen = seen_urls
+        self.seen_path = f"seen_post_{symbol}.bin"
+        self._page_new = 0
+        self._page_new_times = []
+        self.last_summary = None
+        self.total_pages = None
 
     def _restart_driver(self):
         logger.warning("[PostCrawler %s] restarting WebDriver ...", self.symbol)
-        try:
-            self.wdm.quit_driver()
-        except Exception as e:
-            logger.debug("[PostCrawler %s] quit_driver error: %s", self.symbol, e)
-        time.sleep(1 + random.random())
-        self.driver, self.profile = self.wdm.create_driver()
+        if not self.wdm.standby:
+            time.sleep(1 + random.random())
+        self.driver, self.profile = self.wdm.restart_driver()
         logger.info("[PostCrawler %s] WebDriver restarted.", self.symbol)
 
+    def _check_driver_memory(self):
+        # 两页之间检查 driver 进程树内存，超限则主动回收，避免等到崩溃后再由 retry 处理
+        if self.wdm.over_memory_limit():
+            self._restart_driver()
+
     @retry_on_driver_error(max_attempts=4, base_delay=2.0)
     def _fetch_list_page(self, page_num: int):
-        list_url = f"https://guba.eastmoney.com/list,{self.symbol},{page_num}.html"
+        list_url = f"{guba_base_url()}/list,{self.symbol},{page_num}.html"
         logger.info("[PostCrawler %s] open list page: %s", self.symbol, list_url)
         self.driver.get(list_url)
         time.sleep(self._page_sleep)
 
+        # cdp 后端没有 WebElement：在页面内一次性提取所有行为 dict，交给 PostParser.parse_post_row
+        if self.wdm.backend == "cdp":
+            rows = self.driver.execute_script(LIST_ROWS_JS) or []
+            logger.info("[PostCrawler %s] rows extracted via script: %d", self.symbol, len(rows))
+            return rows
+
         # 优先直接选取 class 为 listitem 的 tr（页面上的真实帖子行）
         posts = self.driver.find_elements("css selector", "tr.listitem")
         logger.info("[PostCrawler %s] selector: tr.listitem, matched: %d", self.symbol, len(posts))
 
         # 如果没有匹配（保守回退），使用原先的 table selector 并仅保留第 3 列包含链接的 tr（排除表头）
+        # 过滤在页面内一次 execute_script 完成，避免对每一行单独 find_elements 往返
         if not posts:
             logger.debug("[PostCrawler %s] tr.listitem 未命中，回退到 div.table_list tr 并过滤第3列带链接的行", self.symbol)
-            all_tr = self.driver.find_elements("css selector", "div.table_list tr")
-            filtered = []
-            for p in all_tr:
-                try:
-                    # 仅把第3列有 a 链接的 tr 视为帖子行
-                    if p.find_elements("css selector", "td:nth-child(3) a"):
-                        filtered.append(p)
-                except Exception:
-                    # 某些元素可能已 stale，跳过
-                    continue
-            posts = filtered
+            posts = self.driver.execute_script(FALLBACK_ROWS_JS) or []
             logger.info("[PostCrawler %s] 回退过滤后匹配到: %d", self.symbol, len(posts))
 
         return posts
 
+    def _discover_total_pages(self) -> Optional[int]:
+        """从当前列表页的分页器/帖子总数推算总页数（一次 execute_script），无法识别时返回 None。"""
+        try:
+            info = self.driver.execute_script(PAGER_INFO_JS) or {}
+        except Exception as e:
+            logger.debug("[PostCrawler %s] read pager error: %s", self.symbol, e)
+            return None
+        count = info.get('count') or 0
+        page_size = info.get('page_size') or 80
+        if count > 0:
+            return max(1, math.ceil(count / page_size))
+        max_page = info.get('max_page') or 0
+        return max_page if max_page > 0 else None
+
+    def load_seen(self) -> SeenURLSet:
+        """加载已见 URL 集合：优先读 seen_path 持久化文件，否则从 Mongo 只投影 post_url 加载。"""
+        if self.seen is None:
+            self.seen = load_seen_urls(self.mongo.coll, self.symbol, path=self.seen_path, query=self.mongo.scope)
+        return self.seen
+
     def _parse_and_store(self, elements):
+        self.last_summary = None
+        self._page_new = 0
         if not elements:
             return 0
         docs = []
         for el in elements:
             try:
-                doc = self.parser.parse_post_info(el)
+                if isinstance(el, dict):
+                    doc = self.parser.parse_post_row(el)
+                else:
+                    doc = self.parser.parse_post_info(el)
                 docs.append(doc)
             except Exception as e:
                 logger.debug("[PostCrawler %s] parse item error: %s", self.symbol, e)
@@ -256,83 +768,166 @@ class PostCrawler:
         if not docs:
             return 0
 
-        # 批内去重：按 post_url 优先，若无 post_url 则按 parser 提供的临时 _id 去重
-        unique_map = {}
+        # 批内去重：按 post_url 优先，若无 post_url 则按 parser 提供的临时 _id 去重；
+        # 同时为具有 post_url 的记录设置稳定 _id（md5 of post_url），没有 URL 的记录去掉临时 _id 让 Mongo 生成 ObjectId
+        seen_keys = set()
         unique_docs = []
         for d in docs:
-            if not isinstance(d, dict):
-                continue
             url = (d.get('post_url') or "").strip()
-            if url:
-                key = ("url", url)
-            else:
-                key = ("id", str(d.get('_id', id(d))))
-            if key in unique_map:
+            key = url or ("id", d.get('_id', id(d)))
+            if key in seen_keys:
                 continue
-            unique_map[key] = True
-            unique_docs.append(d)
-
-        # 为具有 post_url 的文档设置稳定 _id（md5 of post_url），对没有 URL 的文档保留让 Mongo 自行生成 ObjectId
-        for d in unique_docs:
-            url = (d.get('post_url') or "").strip()
+            seen_keys.add(key)
             if url:
-                d['_id'] = hashlib.md5(url.encode('utf-8')).hexdigest()
+                d['_id'] = post_doc_id(url)
             else:
                 d.pop('_id', None)
+            unique_docs.append(d)
+
+        urls = [u for u in ((d.get('post_url') or "").strip() for d in unique_docs) if u]
+        if self.seen is not None:
+            new_docs = [d for d in unique_docs if d.get('post_url') and d['post_url'] not in self.seen]
+            self._page_new = len(new_docs)
+            self._page_new_times = [f"{d['post_date']} {d.get('post_time') or '00:00'}"
+                                    for d in new_docs if d.get('post_date')]
 
         # 使用 upsert_many 进行幂等写入（需要 mongodb.py 中实现 upsert_many）
         try:
-            res_summary = self.mongo.upsert_many(unique_docs, id_field='_id')
+            touch_key = f"page{self._current_page}" if self._current_page is not None else None
+            res_summary = self.mongo.upsert_many(unique_docs, id_field='_id', touch_key=touch_key)
+            self.last_summary = res_summary
             if not res_summary:
                 logger.error("[%s] upsert_many returned None for %d docs", self.symbol, len(unique_docs))
             elif 'error' in res_summary:
                 logger.error("[%s] batch upsert error: %s", self.symbol, res_summary)
             else:
                 logger.info("[%s] batch upserted summary: %s", self.symbol, res_summary)
+                if self.seen is not None:
+                    self.seen.update(urls)
         except Exception as e:
             logger.exception("[PostCrawler %s] upsert_many 错误: %s", self.symbol, e)
 
         return len(unique_docs)
 
-    def crawl_post_info(self, start_page: int = 1, end_page: int = 1):
+    def crawl_page(self, page_num: int) -> dict:
+        """抓取并写入单页，返回本页统计；异常向上抛出由调用方决定是否重试。"""
+        self._check_driver_memory()
+        self._current_page = page_num
+        elements = self._fetch_list_page(page_num)
+        if elements and self.total_pages is None:
+            self.total_pages = self._discover_total_pages()
+            if self.total_pages:
+                logger.info("[PostCrawler %s] total pages: %d", self.symbol, self.total_pages)
+        stored = self._parse_and_store(elements)
+        if self.daily_stats is not None:
+            self.daily_stats.flush()
+        summary = self.last_summary or {}
+        return {
+            'page': page_num,
+            'total_pages': self.total_pages,
+            'rows': len(elements or []),
+            'docs': stored,
+            'upserted': summary.get('upserted_count', 0),
+            'matched': summary.get('matched_count', 0),
+            'modified': summary.get('modified_count', 0),
+            'unchanged': summary.get('skipped_unchanged', 0),
+            'new': self._page_new if self.seen is not None else None,
+            'new_post_times': list(self._page_new_times) if self.seen is not None else [],
+        }
+
+    def crawl_post_info(self, start_page: int = 1, end_page: int = 1, incremental: bool = False) -> dict:
+        """
+        抓取 start_page..end_page。incremental=True 时加载已见 URL 集合，
+        遇到整页都是已见帖子的页即停止（列表按更新时间排序，后面的页只会更旧）。
+        返回汇总：stop 为结束原因（'end' 列表末尾 / 'no_new' 增量停止 / 'depth' 抓满页数），
+        new_post_times 为本次新帖的 "YYYY-MM-DD HH:MM"（仅 incremental 时有值），供 scheduler 估计发帖速率。
+        """
         logger.info("[PostCrawler %s] crawling pages %d -> %d", self.symbol, start_page, end_page)
-        for p in range(start_page, end_page + 1):
+        if incremental:
+            self.load_seen()
+        totals = {'pages': 0, 'errors': 0, 'docs': 0, 'upserted': 0, 'modified': 0, 'new': 0,
+                  'new_post_times': [], 'stop': 'depth'}
+        p = start_page
+        while p <= end_page:
             try:
-                elements = self._fetch_list_page(p)
-                self._parse_and_store(elements)
+                res = self.crawl_page(p)
+                totals['pages'] += 1
+                for k in ('docs', 'upserted', 'modified'):
+                    totals[k] += res[k]
+                totals['new'] += res['new'] or 0
+                totals['new_post_times'].extend(res['new_post_times'])
+                if res['rows'] == 0:
+                    logger.info("[PostCrawler %s] page %d is empty, end of list reached", self.symbol, p)
+                    totals['stop'] = 'end'
+                    break
+                if incremental and res['new'] == 0:
+                    logger.info("[PostCrawler %s] page %d has no new posts, incremental crawl stops", self.symbol, p)
+                    totals['stop'] = 'no_new'
+                    break
+                if self.total_pages and p >= self.total_pages:
+                    totals['stop'] = 'end'
+                if self.total_pages and end_page > self.total_pages:
+                    logger.info("[PostCrawler %s] capping end page %d -> %d", self.symbol, end_page, self.total_pages)
+                    end_page = self.total_pages
             except Exception as e:
+                totals['errors'] += 1
                 logger.error("[PostCrawler %s] page %d error: %s", self.symbol, p, e)
-                logger.debug(traceback.format_exc())
+                logger.debug("[PostCrawler %s] page %d traceback", self.symbol, p, exc_info=True)
                 time.sleep(2 + random.random())
-                continue
-        logger.info("[PostCrawler %s] crawl finished.", self.symbol)
-        try:
-            self.wdm.quit_driver()
-        except Exception:
-            pass
+            p += 1
+        logger.info("[PostCrawler %s] crawl finished: %s", self.symbol,
+                    {k: v for k, v in totals.items() if k != 'new_post_times'})
+        if self.seen is not None:
+            try:
+                self.seen.save(self.seen_path)
+            except OSError as e:
+                logger.warning("[PostCrawler %s] save seen urls error: %s", self.symbol, e)
+        if self._owns_driver:
+            try:
+                self.wdm.quit_driver()
+            except Exception:
+                pass
+        return totals
 
 
 class CommentCrawler:
-    """评论爬虫骨架，逻辑与 PostCrawler 类似。"""
+    """评论爬虫骨架，逻辑与 PostCrawler 类似。
+
+    use_api=True 时改用 CommentAPIClient 通过 HTTP 拉取回复 JSON（含翻页与子回复），不启动浏览器。
+    浏览器方式下每个帖子只调用一次 execute_script（COMMENT_TREE_JS）取回一级回复与子回复，
+    脚本失败时退回逐元素解析。
+    """
 
-    def __init__(self, symbol: str, headless: bool = False):
+    def __init__(self, symbol: str, headless: bool = False, use_api: bool = False, api_url: Optional[str] = None,
+                 backend: Optional[str] = None, daily_stats: Optional[bool] = None):
         self.symbol = symbol
         self.headless = headless
-        self.wdm = WebDriverManager(headless=headless)
-        self.driver, self.profile = self.wdm.create_driver()
+        self.use_api = use_api
+        self.wdm = WebDriverManager(headless=headless, backend=backend)
+        if use_api:
+            self.driver, self.profile = None, None
+            self.api = CommentAPIClient(api_url=api_url)
+        else:
+            self.driver, self.profile = self.wdm.create_driver()
+            self.api = None
         self.parser = CommentParser()
-        self.mongo = MongoAPI("comment_info", f"comment_{symbol}")
+        self.mongo = MongoAPI.for_symbol("comment", symbol)
+        self.daily_stats = None
+        if daily_stats_enabled(daily_stats):
+            self.daily_stats = get_daily_stats(self.mongo, symbol, 'comment')
+            self.mongo.add_change_listener(self.daily_stats.record)
 
     def _restart_driver(self):
         logger.warning("[CommentCrawler %s] restarting WebDriver ...", self.symbol)
-        try:
-            self.wdm.quit_driver()
-        except Exception as e:
-            logger.debug("[CommentCrawler] quit_driver error: %s", e)
-        time.sleep(1 + random.random())
-        self.driver, self.profile = self.wdm.create_driver()
+        if not self.wdm.standby:
+            time.sleep(1 + random.random())
+        self.driver, self.profile = self.wdm.restart_driver()
         logger.info("[CommentCrawler %s] WebDriver restarted.", self.symbol)
 
+    def _check_driver_memory(self):
+        if self.driver is not None and self.wdm.over_memory_limit():
+            self._restart_driver()
+
     @retry_on_driver_error(max_attempts=4, base_delay=2.0)
     def _open_post_and_get_reply_elements(self, post_url: str):
         logger.info("[CommentCrawler %s] open post: %s", self.symbol, post_url)
@@ -341,7 +936,43 @@ class CommentCrawler:
         comments = self.driver.find_elements("css selector", "div.replyList")
         return comments
 
-    def crawl_comment_info(self, post_url_list):
+    @retry_on_driver_error(max_attempts=4, base_delay=2.0)
+    def _open_post_and_get_reply_tree(self, post_url: str):
+        logger.info("[CommentCrawler %s] open post: %s", self.symbol, post_url)
+        self.driver.get(post_url)
+        time.sleep(0.8 + random.random() * 0.5)
+        return self.parser.parse_comment_tree(self.driver, post_id=post_url)
+
+    def _collect_comments(self, post_url: str, start_page: int = 1, end_page: Optional[int] = None):
+        if self.api is not None:
+            logger.info("[CommentCrawler %s] fetch replies via API: %s (pages %d..%s)", self.symbol, post_url,
+                        start_page, end_page or "end")
+            return self.api.fetch_comments(post_url, start_page=start_page, end_page=end_page)
+
+        try:
+            return self._open_post_and_get_reply_tree(post_url)
+        except Exception as e:
+            if self.wdm.backend == "cdp":
+                raise
+            logger.warning("[CommentCrawler %s] reply tree script failed (%s), fallback to element parse",
+                           self.symbol, e)
+
+        els = self._open_post_and_get_reply_elements(post_url)
+        docs = []
+        for el in els:
+            try:
+                doc = self.parser.parse_comment_info(el, post_id=post_url, sub_bool=False)
+                docs.append(doc)
+            except Exception as e:
+                logger.debug("[CommentCrawler %s] single comment parse error: %s", self.symbol, e)
+        return docs
+
+    def crawl_comment_info(self, post_url_list, start_page: int = 1, end_page: Optional[int] = None):
+        """
+        抓取并写入评论；start_page / end_page 只对接口模式有效（comment_planner 拆分出的页区间子任务）。
+        单个帖子出错时记录日志并继续下一个；返回 {url: {'ok', 'fetched', 'inserted'}}，
+        ok 为 False 表示抓取或写入失败（调用方据此决定是否重试、是否记为已处理）。
+        """
         # 标准化入参：支持单个字符串或可迭代列表
         if isinstance(post_url_list, str):
             post_url_list = [post_url_list]
@@ -349,31 +980,40 @@ class CommentCrawler:
             post_url_list = [post_url_list]
 
         logger.info("[CommentCrawler %s] crawl %d posts", self.symbol, len(post_url_list))
+        results = {}
         for url in post_url_list:
+            result = {'ok': False, 'fetched': 0, 'inserted': 0}
+            results[url] = result
             try:
-                els = self._open_post_and_get_reply_elements(url)
-                docs = []
-                for el in els:
-                    try:
-                        doc = self.parser.parse_comment_info(el, post_id=url, sub_bool=False)
-                        docs.append(doc)
-                    except Exception as e:
-                        logger.debug("[CommentCrawler %s] single comment parse error: %s", self.symbol, e)
+                self._check_driver_memory()
+                docs = self._collect_comments(url, start_page, end_page)
+                result['fetched'] = len(docs or [])
                 if docs:
                     res = self.mongo.insert_many(docs)
-                    # MongoAPI.insert_many 返回 summary dict {'inserted_count': N, ...}
-                    inserted = 0
+                    # MongoAPI.insert_many 返回 summary dict {'inserted_count': N, 'errors': N, ...}
+                    inserted, errors = 0, 0
                     if isinstance(res, dict):
-                        inserted = res.get('inserted_count', 0)
+                        inserted, errors = res.get('inserted_count', 0), res.get('errors', 0)
+                    result['inserted'] = inserted
                     logger.info("[CommentCrawler %s] attempted %d comments, inserted %d", self.symbol, len(docs), inserted)
+                    if errors:
+                        logger.error("[CommentCrawler %s] post %s: %d comments failed to insert", self.symbol, url,
+                                     errors)
+                        continue
+                result['ok'] = True
             except Exception as e:
                 logger.error("[CommentCrawler %s] post %s error: %s", self.symbol, url, e)
-                logger.debug(traceback.format_exc())
+                logger.debug("[CommentCrawler %s] post %s traceback", self.symbol, url, exc_info=True)
                 time.sleep(2 + random.random())
                 continue
+        if self.daily_stats is not None:
+            self.daily_stats.flush()
+        if self.api is not None:
+            self.api.close()
         try:
             self.wdm.quit_driver()
         except Exception:
             pass
+        return results
 
 
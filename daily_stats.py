@@ -0,0 +1,195 @@
+"""
+daily_stats.py
+
+按 (symbol, 日期) 预计算的日统计，写入 post_info.daily_stats，看板直接读这里而不必扫描整个帖子/评论集合：
+- 帖子：posts（帖子数）、views（阅读数合计）、comments（评论数合计）、authors（活跃作者数）
+- 评论：replies（回复数）、reply_likes（点赞合计）、replied_posts（被回复的帖子数）
+增量维护：DailyStatsUpdater 作为 MongoAPI 的 change listener 只记录被写入文档涉及的日期（脏日期），
+flush() 时对这些日期跑一次 $group + $merge，只重算变化的日期；rebuild() 用于首次回填。
+
+PostCrawler / CommentCrawler 在 daily_stats=True（或环境变量 EM_DAILY_STATS=1）时自动挂接。
+命令行：
+    python daily_stats.py --symbols 000333 --rebuild        # 回填
+    python daily_stats.py --symbols 000333 --show --days 30 # 查看最近 30 天
+"""
+
+import os
+import logging
+import datetime
+import argparse
+import threading
+from typing import Iterable, List, Optional
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger('eastmoney_crawler.daily_stats')
+
+STATS_DB = 'post_info'
+STATS_COLLECTION = 'daily_stats'
+KINDS = ('post', 'comment')
+
+# 各 kind 的日期字段与字段计算；字符串计数用 $convert 转换，无法转换的值记为 0
+_DATE_FIELD = {'post': 'post_date', 'comment': 'comment_date'}
+
+
+def _to_long(field):
+    return {'$convert': {'input': f'${field}', 'to': 'long', 'onError': 0, 'onNull': 0}}
+
+
+_GROUP = {
+    'post': {
+        'posts': {'$sum': 1},
+        'views': {'$sum': _to_long('post_view')},
+        'comments': {'$sum': _to_long('comment_num')},
+        'authors': {'$addToSet': '$post_author'},
+    },
+    'comment': {
+        'replies': {'$sum': 1},
+        'reply_likes': {'$sum': _to_long('comment_like')},
+        'replied_posts': {'$addToSet': '$post_id'},
+    },
+}
+
+_PROJECT = {
+    'post': {'posts': 1, 'views': 1, 'comments': 1, 'authors': {'$size': '$authors'}},
+    'comment': {'replies': 1, 'reply_likes': 1, 'replied_posts': {'$size': '$replied_posts'}},
+}
+
+
+def daily_stats_enabled(flag: Optional[bool] = None) -> bool:
+    if flag is not None:
+        return flag
+    return os.environ.get('EM_DAILY_STATS', '').lower() in ('1', 'true', 'yes')
+
+
+class DailyStatsUpdater(object):
+    """维护一个 symbol 在 daily_stats 中的帖子或评论统计。mongo 为该 symbol 帖子/评论集合的 MongoAPI。"""
+
+    def __init__(self, mongo, symbol: str, kind: str = 'post'):
+        if kind not in KINDS:
+            raise ValueError(f"unknown daily stats kind {kind!r}, expected one of {KINDS}")
+        self.mongo = mongo
+        self.symbol = symbol
+        self.kind = kind
+        self.date_field = _DATE_FIELD[kind]
+        self.stats = mongo.client[STATS_DB][STATS_COLLECTION]
+        self._dirty = set()
+        self._lock = threading.Lock()
+        try:
+            self.stats.create_index([('symbol', ASCENDING), ('date', DESCENDING)])
+            # 按日期 $match 时需要索引：unified 布局已有 (symbol, post_date)，per_symbol 集合单独建
+            if not mongo.scope:
+                mongo.coll.create_index(self.date_field)
+        except PyMongoError:
+            logger.debug("[DailyStats] create index failed", exc_info=True)
+
+    def record(self, docs) -> int:
+        """change listener：记录文档涉及的日期，返回新增的脏日期数。"""
+        dates = {d.get(self.date_field) for d in docs}
+        dates.discard(None)
+        dates.discard('')
+        with self._lock:
+            before = len(self._dirty)
+            self._dirty.update(dates)
+            return len(self._dirty) - before
+
+    @property
+    def dirty(self):
+        return len(self._dirty)
+
+    def _pipeline(self, dates: Optional[List[str]]):
+        match = dict(self.mongo.scope)
+        if dates is None:
+            match[self.date_field] = {'$type': 'string', '$ne': ''}
+        else:
+            match[self.date_field] = {'$in': dates}
+        project = {'_id': {'$concat': [{'$literal': self.symbol}, ':', '$_id']},
+                   'symbol': {'$literal': self.symbol}, 'date': '$_id', 'updated_at': '$$NOW'}
+        project.update(_PROJECT[self.kind])
+        return [
+            {'$match': match},
+            {'$group': dict({'_id': f'${self.date_field}'}, **_GROUP[self.kind])},
+            {'$project': project},
+            # whenMatched=merge：帖子与评论两侧各写自己的字段，互不覆盖
+            {'$merge': {'into': {'db': STATS_DB, 'coll': STATS_COLLECTION}, 'on': '_id',
+                        'whenMatched': 'merge', 'whenNotMatched': 'insert'}},
+        ]
+
+    def flush(self) -> int:
+        """重算全部脏日期，返回重算的日期数；失败时日期保留到下次。"""
+        with self._lock:
+            dates = sorted(self._dirty)
+            self._dirty.clear()
+        if not dates:
+            return 0
+        try:
+            self.mongo.coll.aggregate(self._pipeline(dates), allowDiskUse=True)
+        except Exception:
+            logger.exception("[DailyStats %s] $merge %s days 错误", self.symbol, len(dates))
+            with self._lock:
+                self._dirty.update(dates)
+            return 0
+        logger.info("[DailyStats %s] refreshed %d %s days", self.symbol, len(dates), self.kind)
+        return len(dates)
+
+    def rebuild(self):
+        """全量重算该 symbol 的所有日期（首次启用或修复时使用）。"""
+        with self._lock:
+            self._dirty.clear()
+        self.mongo.coll.aggregate(self._pipeline(None), allowDiskUse=True)
+        logger.info("[DailyStats %s] rebuilt %s stats", self.symbol, self.kind)
+
+
+# 同一进程内按 (db, 集合范围, kind) 共享 updater，每页新建 crawler 时脏日期不会丢失
+_updaters = {}
+_updaters_lock = threading.Lock()
+
+
+def get_daily_stats(mongo, symbol: str, kind: str = 'post') -> DailyStatsUpdater:
+    key = (mongo.db_name, mongo.scope_name, kind)
+    with _updaters_lock:
+        upd = _updaters.get(key)
+        if upd is None:
+            upd = DailyStatsUpdater(mongo, symbol, kind=kind)
+            _updaters[key] = upd
+    return upd
+
+
+def read_daily_stats(db, symbol: str, start: Optional[str] = None, end: Optional[str] = None) -> List[dict]:
+    """读取预计算的日统计（按日期升序）；start/end 为 'YYYY-MM-DD'，包含端点。db 为 post_info 库。"""
+    query = {'symbol': symbol}
+    if start or end:
+        query['date'] = {}
+        if start:
+            query['date']['$gte'] = start
+        if end:
+            query['date']['$lte'] = end
+    return list(db[STATS_COLLECTION].find(query, {'_id': 0}).sort('date', ASCENDING))
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="daily_stats 回填 / 查看")
+    ap.add_argument("--symbols", nargs="+", required=True)
+    ap.add_argument("--rebuild", action="store_true", help="全量重算帖子与评论日统计")
+    ap.add_argument("--show", action="store_true", help="打印最近 --days 天的统计")
+    ap.add_argument("--days", type=int, default=30)
+    args = ap.parse_args(argv)
+
+    from mongodb import MongoAPI
+    for symbol in args.symbols:
+        posts = MongoAPI.for_symbol("post", symbol)
+        if args.rebuild:
+            DailyStatsUpdater(posts, symbol, kind='post').rebuild()
+            DailyStatsUpdater(MongoAPI.for_symbol("comment", symbol, client=posts.client), symbol,
+                              kind='comment').rebuild()
+        if args.show:
+            start = (datetime.date.today() - datetime.timedelta(days=args.days)).isoformat()
+            for row in read_daily_stats(posts.client[STATS_DB], symbol, start=start):
+                row.pop('updated_at', None)
+                print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,22 @@
-﻿# 用途：备份 post_000333 -> 去重（按 date/time/latest _id 保留）-> 创建 post_url 唯一索引
+﻿# 用途：备份 post_000333（backups/ 下的 .bson.gz 文件）-> 去重（按 date/time/latest _id 保留）-> 创建 post_url 唯一索引
 # 运行：python .\dedupe_and_create_index_post_000333.py
 from pymongo import MongoClient
 from bson.objectid import ObjectId
 from datetime import datetime
 import sys
 
+from backup import backup_collection as backup_collection_to_file, backup_path
+
 COL = "post_000333"
 DB = "post_info"
 
 def backup_collection(db, src_name):
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    bak_name = f"{src_name}_backup_{ts}"
-    print(f"[1/4] 备份集合 {src_name} -> {bak_name} ...")
-    count = 0
-    src = db[src_name]
-    bak = db[bak_name]
-    docs = list(src.find({}))
-    if docs:
-        bak.insert_many(docs)
-        count = bak.count_documents({})
-    print(f"  备份完成，备份集合 {bak_name} 文档数: {count}")
-    return bak_name
+    path = backup_path("backups", db.name, src_name, "bson.gz")
+    print(f"[1/4] 备份集合 {src_name} -> {path} ...")
+    # 流式写入压缩文件，不再把整个集合读入内存再复制到备份集合
+    meta = backup_collection_to_file(db[src_name], path)
+    print(f"  备份完成，备份文件 {path} 文档数: {meta['count']}（恢复：python backup.py restore {path}）")
+    return path
 
 def parse_dt(d, t):
     try:
@@ -35,7 +31,7 @@ def parse_dt(d, t):
 def find_duplicate_groups(coll):
     pipeline = [
         {"$match": {"post_url": {"$exists": True, "$ne": ""}}},
-        {"$group": {"_id": "$post_url", "ids": {"$push": {"_id": "$_id", "post_date": "$post_date", "post_time": "$post_time"}}}},
+        {"$group": {"_id": "$post_url", "ids": {"$push": {"_id": "$_id", "post_ts": "$post_ts", "post_date": "$post_date", "post_time": "$post_time"}}}},
         {"$project": {"_id": 1, "count": {"$size": "$ids"}, "ids": 1}},
         {"$match": {"count": {"$gt": 1}}}
     ]
@@ -43,7 +39,8 @@ def find_duplicate_groups(coll):
 
 def choose_keep_id(doc_list):
     def key_fn(item):
-        dt = parse_dt(item.get("post_date"), item.get("post_time"))
+        # 有 post_ts（新数据或 backfill_ts.py 补写过）时直接比较，不再逐条 strptime
+        dt = item.get("post_ts") or parse_dt(item.get("post_date"), item.get("post_time"))
         if dt:
             return dt
         oid = item.get("_id")
@@ -101,7 +98,7 @@ def main(dry_run=False):
     coll = db[COL]
 
     # 1) 备份
-    bak_name = backup_collection(db, COL)
+    bak_path = backup_collection(db, COL)
 
     # 2) 去重（默认执行删除，除非 dry_run True）
     deleted = dedupe_collection(coll, dry_run=dry_run)
@@ -10,7 +10,7 @@ coll = db["post_000333"]
 # 聚合获取每个 post_url 的所有 _id 与 date/time
 pipeline = [
     {"$match": {"post_url": {"$exists": True, "$ne": ""}}},
-    {"$group": {"_id": "$post_url", "docs": {"$push": {"_id": "$_id", "post_date": "$post_date", "post_time": "$post_time"}}}}
+    {"$group": {"_id": "$post_url", "docs": {"$push": {"_id": "$_id", "post_ts": "$post_ts", "post_date": "$post_date", "post_time": "$post_time"}}}}
 ]
 
 to_delete = []
@@ -35,7 +35,8 @@ for g in groups:
         continue
     # 为每 doc 计算优先级：先按 date/time（越新越好），再按 ObjectId 时间
     def key_fn(item):
-        dt = parse_dt(item.get("post_date"), item.get("post_time"))
+        # 有 post_ts（新数据或 backfill_ts.py 补写过）时直接比较，不再逐条 strptime
+        dt = item.get("post_ts") or parse_dt(item.get("post_date"), item.get("post_time"))
         if dt:
             return (dt, None)
         # fallback to ObjectId generation time if available
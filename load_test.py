@@ -0,0 +1,307 @@
+"""
+load_test.py
+
+端到端吞吐压测：启动本地 mock 股吧（mock_guba.py，也可用 --base-url 指向已有实例），
+设置 GUBA_BASE_URL 后用 --concurrency 个线程驱动某个抓取引擎，报告 pages/sec、p50/p90/p99 延迟、重试次数与错误数。
+
+内置引擎：
+- posts：PostCrawler.crawl_page（浏览器 + MongoDB，BROWSER_BACKEND 决定 selenium / cdp）；
+  只写入 --db 指定的独立库（默认 loadtest_post_info，不允许是爬虫正式使用的库），结束后整库删除，--keep-data 保留
+- comments：CommentCrawler 打开帖子页解析回复树（浏览器 + MongoDB）
+- comments-api：CommentAPIClient.fetch_comments（纯 HTTP，不需要浏览器与 MongoDB）
+- tail：TailMonitor.poll 第 1 页（纯 HTTP，不写 Mongo）
+新引擎可写成带 tasks(args) / run(task) / retries() / close() 的类（可选 cleanup(args)：全部线程结束后调用一次），
+用 --engine module:ClassName 加载。
+
+示例：
+    python load_test.py --engine comments-api --posts 200 --concurrency 8 --latency-ms 30 --error-rate 0.05
+    python load_test.py --engine posts --symbols MOCK1 MOCK2 --pages 20 --concurrency 2 --headless
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import queue
+import logging
+import argparse
+import importlib
+import threading
+from typing import List
+
+from mock_guba import start_mock_server, add_fault_args, build_from_args, POSTS_PER_PAGE
+from mongodb import KIND_COLLECTIONS
+
+logger = logging.getLogger("load_test")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩百分位数。"""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = max(int(math.ceil(pct / 100.0 * len(s))) - 1, 0)
+    return s[min(k, len(s) - 1)]
+
+
+def _post_urls(args) -> list:
+    """mock 中各股票最新的 --posts 个帖子 URL（与 MockGubaData 的编号规则一致）。"""
+    newest = args.pages * POSTS_PER_PAGE
+    base = os.environ["GUBA_BASE_URL"]
+    return [f"{base}/news,{s},{1000000 + newest - i}.html" for i in range(args.posts) for s in args.symbols]
+
+
+class PostsEngine(object):
+
+    def __init__(self, args):
+        from crawler import WebDriverManager
+        self.args = args
+        self.wdm = WebDriverManager(headless=args.headless)
+        self.crawlers = {}
+
+    @staticmethod
+    def tasks(args) -> list:
+        return [(s, p) for p in range(1, args.pages + 1) for s in args.symbols]
+
+    def run(self, task) -> dict:
+        from crawler import PostCrawler
+        symbol, page = task
+        crawler = self.crawlers.get(symbol)
+        if crawler is None:
+            crawler = PostCrawler(symbol, headless=self.args.headless, wdm=self.wdm, mongo=self._mongo(symbol))
+            crawler._page_sleep = 0.0
+            self.crawlers[symbol] = crawler
+        crawler.driver = self.wdm.driver or crawler.driver
+        res = crawler.crawl_page(page)
+        return {'ok': res['rows'] > 0, 'items': res['docs']}
+
+    def _mongo(self, symbol):
+        """与 MongoAPI.for_symbol('post', symbol) 相同的集合名与布局，只是库换成 --db。"""
+        from mongodb import MongoAPI, symbol_collection
+        _, coll_name, scope_symbol = symbol_collection("post", symbol)
+        api = MongoAPI(self.args.db, coll_name, uri=os.environ.get("MONGO_URI"), symbol=scope_symbol)
+        api.ensure_indexes()
+        return api
+
+    def retries(self) -> int:
+        return 0  # retry_on_driver_error 的重试由 crawler.retry_counts 统一统计
+
+    def close(self):
+        self.wdm.quit_driver()
+
+    @staticmethod
+    def cleanup(args):
+        """删除压测库（帖子、快照、daily_stats 都写在同一个库里）；--keep-data 时保留以便检查。"""
+        if args.keep_data:
+            logger.warning("[PostsEngine] keeping load test data in database %s", args.db)
+            return
+        from pymongo import MongoClient
+        client = MongoClient(os.environ.get("MONGO_URI") or "mongodb://localhost:27017", serverSelectionTimeoutMS=3000)
+        try:
+            client.drop_database(args.db)
+        finally:
+            client.close()
+
+
+class CommentsEngine(object):
+
+    def __init__(self, args):
+        from crawler import CommentCrawler
+        self.crawler = CommentCrawler(args.symbols[0], headless=args.headless)
+
+    @staticmethod
+    def tasks(args) -> list:
+        return _post_urls(args)
+
+    def run(self, url) -> dict:
+        docs = self.crawler._collect_comments(url)
+        return {'ok': bool(docs), 'items': len(docs)}
+
+    def retries(self) -> int:
+        return 0
+
+    def close(self):
+        self.crawler.wdm.quit_driver()
+
+
+class CommentsApiEngine(object):
+
+    def __init__(self, args):
+        from comment_api import CommentAPIClient
+        self.client = CommentAPIClient(page_sleep=0.0, timeout=args.timeout)
+
+    @staticmethod
+    def tasks(args) -> list:
+        return _post_urls(args)
+
+    def run(self, url) -> dict:
+        docs = self.client.fetch_comments(url)
+        return {'ok': bool(docs), 'items': len(docs)}
+
+    def retries(self) -> int:
+        return self.client.retries
+
+    def close(self):
+        self.client.close()
+
+
+class TailEngine(object):
+
+    def __init__(self, args):
+        from tail import TailMonitor
+        self.monitor = TailMonitor(args.symbols, store=False, timeout=args.timeout)
+
+    @staticmethod
+    def tasks(args) -> list:
+        return [s for _ in range(args.pages) for s in args.symbols]
+
+    def run(self, symbol) -> dict:
+        errors = self.monitor.stats['errors']
+        new = self.monitor.poll(symbol)
+        return {'ok': self.monitor.stats['errors'] == errors, 'items': len(new)}
+
+    def retries(self) -> int:
+        return 0
+
+    def close(self):
+        self.monitor.close()
+
+
+ENGINES = {
+    'posts': PostsEngine,
+    'comments': CommentsEngine,
+    'comments-api': CommentsApiEngine,
+    'tail': TailEngine,
+}
+
+
+def load_engine(name: str):
+    if name in ENGINES:
+        return ENGINES[name]
+    module, _, cls = name.partition(':')
+    if not cls:
+        raise ValueError(f"unknown engine {name!r}; built-in: {sorted(ENGINES)} or module:ClassName")
+    return getattr(importlib.import_module(module), cls)
+
+
+def run_load(engine_cls, args) -> dict:
+    """用 args.concurrency 个线程（每个线程一个引擎实例）跑完全部任务，返回指标。"""
+    from crawler import retry_counts, reset_retry_counts
+    reset_retry_counts()
+    tasks = engine_cls.tasks(args)
+    q = queue.Queue()
+    for t in tasks:
+        q.put(t)
+    latencies, errors, items = [], [], [0]
+    engine_retries = [0]
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            engine = engine_cls(args)
+        except Exception as e:
+            logger.exception("engine setup failed")
+            with lock:
+                errors.append(f"setup: {e}")
+            return
+        try:
+            while True:
+                try:
+                    task = q.get_nowait()
+                except queue.Empty:
+                    break
+                t0 = time.perf_counter()
+                try:
+                    res = engine.run(task)
+                    error = None if res.get('ok', True) else f"{task}: empty result"
+                except Exception as e:
+                    res, error = {}, f"{task}: {type(e).__name__}: {e}"
+                    logger.debug("task %s failed", task, exc_info=True)
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    latencies.append(elapsed)
+                    items[0] += res.get('items', 0)
+                    if error:
+                        errors.append(error)
+        finally:
+            with lock:
+                engine_retries[0] += engine.retries()
+            try:
+                engine.close()
+            except Exception:
+                pass
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f"load-{i}") for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    cleanup = getattr(engine_cls, 'cleanup', None)
+    if cleanup is not None:
+        try:
+            cleanup(args)
+        except Exception:
+            logger.exception("engine cleanup failed")
+
+    return {
+        'engine': args.engine,
+        'tasks': len(tasks),
+        'completed': len(latencies),
+        'errors': len(errors),
+        'items': items[0],
+        'wall_seconds': round(wall, 3),
+        'pages_per_sec': round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'retries': engine_retries[0] + sum(retry_counts.values()),
+        'error_samples': errors[:5],
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s")
+    ap = argparse.ArgumentParser(description="Throughput load test against a local mock guba server")
+    ap.add_argument("--engine", default="comments-api", help=f"{sorted(ENGINES)} 或 module:ClassName")
+    ap.add_argument("--symbols", nargs="+", default=["MOCK1"])
+    ap.add_argument("--posts", type=int, default=100, help="comments* 引擎：每个股票抓取的帖子数")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--timeout", type=float, default=10.0)
+    ap.add_argument("--headless", action="store_true")
+    ap.add_argument("--base-url", default=None, help="使用已运行的 mock/录制站点，而不是自动启动")
+    ap.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    ap.add_argument("--db", default="loadtest_post_info", help="posts 引擎写入的库，结束后删除（不能是爬虫正式使用的库）")
+    ap.add_argument("--keep-data", action="store_true", help="结束后保留 --db 中的压测数据")
+    add_fault_args(ap)
+    args = ap.parse_args()
+    production_dbs = sorted({db for db, _, _ in KIND_COLLECTIONS.values()})
+    if args.db in production_dbs:
+        ap.error(f"--db must not be a crawler database {production_dbs}")
+
+    server = None
+    if args.base_url:
+        os.environ["GUBA_BASE_URL"] = args.base_url.rstrip("/")
+    else:
+        data, config = build_from_args(args)
+        server, base = start_mock_server(data=data, config=config, recorded_dir=args.recorded_dir)
+        os.environ["GUBA_BASE_URL"] = base
+    os.environ.pop("GUBA_REPLY_API", None)
+
+    report = run_load(load_engine(args.engine), args)
+    if server is not None:
+        report['server'] = dict(server.stats)
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for k, v in report.items():
+            print(f"{k:>14}: {v}")
+    return 0 if report['completed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
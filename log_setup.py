@@ -0,0 +1,139 @@
+"""
+log_setup.py
+
+非阻塞日志配置：爬虫线程只把 LogRecord 放进内存队列（QueueHandler），
+由后台 QueueListener 线程负责格式化与写盘，磁盘 I/O 不再阻塞抓取线程。
+- 文件输出为 JSON-lines，并按大小轮转（RotatingFileHandler）。
+- 对 INFO 及以下的重复消息按消息模板限流（每个模板每个时间窗口最多 burst 条），
+  被抑制的条数会附在下一条放行的记录上；WARNING 及以上始终放行。
+- 异常堆栈（exc_info）只在后台线程格式化。
+
+用法：
+    from log_setup import setup_logging
+    setup_logging()                     # 默认写 crawler.log（JSON-lines）+ 控制台
+"""
+
+import json
+import queue
+import atexit
+import logging
+import threading
+import time
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+CONSOLE_FORMAT = "%(asctime)s - %(levelname)s - %(threadName)s - %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条记录输出一行 JSON。"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'process': record.processName,
+            'msg': record.getMessage(),
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按 (logger 名, 消息模板) 限流：每 interval 秒内最多放行 burst 条；只作用于 max_level 及以下。
+    这样每页都会打印的 INFO（打开列表页、批量写入摘要等）不会淹没日志，而各类消息仍至少出现一次。
+    """
+
+    def __init__(self, interval: float = 1.0, burst: int = 5, max_level: int = logging.INFO):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.max_level = max_level
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - start >= self.interval:
+                start, count = now, 0
+            if count >= self.burst:
+                self._windows[key] = (start, count, suppressed + 1)
+                return False
+            self._windows[key] = (start, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _LocalQueueHandler(QueueHandler):
+    """
+    同进程队列：只合并 msg % args（参数可能是可变对象），保留 exc_info 交给监听线程格式化，
+    避免在抓取线程里执行 traceback 格式化。
+    """
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+def setup_logging(log_file: Optional[str] = "crawler.log", level: int = logging.INFO, console: bool = True,
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  rate_interval: float = 1.0, rate_burst: int = 5) -> QueueListener:
+    """配置 root logger 使用队列 + 后台监听线程，返回 QueueListener（进程退出时自动 stop 并 flush）。"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    handlers = []
+    if log_file:
+        fh = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        fh.setFormatter(JsonLinesFormatter())
+        handlers.append(fh)
+    if console:
+        ch = logging.StreamHandler()
+        ch.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(ch)
+
+    q = queue.SimpleQueue()
+    qh = _LocalQueueHandler(q)
+    qh.addFilter(RateLimitFilter(interval=rate_interval, burst=rate_burst))
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(qh)
+    root.setLevel(level)
+
+    _listener = QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """停止后台线程并写出队列中剩余的记录。"""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        finally:
+            _listener = None
@@ -1,19 +1,15 @@
 ﻿import logging
 import logging.config
 try:
-    logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+    # 队列 + 后台线程写 JSON-lines（按大小轮转），抓取线程不再同步写盘
+    from log_setup import setup_logging
+    setup_logging("crawler.log")
 except Exception:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
-        handlers=[
-            logging.FileHandler("crawler.log", encoding="utf-8"),
-            logging.StreamHandler()
-        ]
-    )
+    logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 from crawler import PostCrawler
 from crawler import CommentCrawler
+from crawler import sweep_leaked_resources
 import threading
 
 
@@ -35,6 +31,8 @@ def comment_thread_id(stock_symbol, start_id, end_id):  # stock_symbol涓鸿偂
 
 
 if __name__ == "__main__":
+    # 清理上次被强杀遗留的 chromedriver 进程与 em_crawler_profile_* 临时目录
+    sweep_leaked_resources()
 
     thread1 = threading.Thread(target=post_thread, args=('000333', 1, 10))
     thread2 = threading.Thread(target=post_thread, args=('000729', 1, 500))
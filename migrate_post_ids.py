@@ -0,0 +1,122 @@
+# 用途：把帖子集合中 _id 不是 md5(post_url) 的旧文档（早期 upsert 写入的 ObjectId）改写为稳定 _id，
+#       之后 MongoAPI.upsert_many 按 _id 匹配即可走主键索引，不再依赖 post_url 唯一索引防重。
+# _id 不能原地修改：每个文档先备份到 {集合}_backup_ids_{时间戳}，再删除旧文档、按新 _id 写回。
+# 同一 post_url 的多条旧文档只保留第一条；新 _id 的文档已存在（新代码写入过）时以已存在的为准，只删除旧文档。
+# 可重复执行：已是稳定 _id 的文档会被跳过。建议在部署按 _id upsert 的新版本前后各运行一次。
+# 运行：python migrate_post_ids.py                       # 迁移全部 post_{symbol} 集合（EM_STORAGE_LAYOUT=unified 时为 posts）
+#       python migrate_post_ids.py --symbols 000333 --dry-run
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime
+
+from pymongo import MongoClient, DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from mongodb import KIND_COLLECTIONS, post_doc_id, storage_layout
+from migrate_to_unified import source_collections
+
+logger = logging.getLogger("migrate_post_ids")
+
+
+def stale_docs(coll, query=None, batch_size=1000):
+    """遍历 post_url 非空且 _id != md5(post_url) 的文档，产出 (doc, 新 _id)。"""
+    flt = dict(query or {}, post_url={"$type": "string", "$ne": ""})
+    for doc in coll.find(flt, batch_size=batch_size):
+        new_id = post_doc_id(doc["post_url"])
+        if doc["_id"] != new_id:
+            yield doc, new_id
+
+
+def migrate_ids(coll, query=None, batch_size=500, dry_run=False, backup=True):
+    """改写 coll 中（限定 query 范围）的旧 _id，返回 {'stale', 'rewritten', 'dropped_duplicates', 'errors'}。"""
+    summary = {"stale": 0, "rewritten": 0, "dropped_duplicates": 0, "errors": 0}
+    bak = None
+    if backup and not dry_run:
+        bak = coll.database[f"{coll.name}_backup_ids_{datetime.now():%Y%m%d_%H%M%S}"]
+    # 游标可能读到本次新写入的文档，它们的 _id 已是 md5(post_url)，会被 stale_docs 跳过
+    batch = []
+    t0 = time.time()
+
+    def flush():
+        if not batch:
+            return
+        if bak is not None:
+            bak.insert_many([doc for doc, _ in batch], ordered=False)
+        ops = []
+        for doc, new_id in batch:
+            old_id = doc.pop("_id")
+            # 先删后写：旧文档与新文档的 post_url 相同，先写会触发 post_url 唯一索引冲突
+            ops.append(DeleteOne({"_id": old_id}))
+            ops.append(UpdateOne({"_id": new_id}, {"$setOnInsert": doc}, upsert=True))
+        try:
+            res = coll.bulk_write(ops, ordered=True)
+            upserted = res.upserted_count
+        except BulkWriteError as bwe:
+            det = bwe.details or {}
+            upserted = det.get("nUpserted", 0)
+            summary["errors"] += len(det.get("writeErrors", []))
+            logger.error("[%s] bulk_write 失败（旧文档已备份到 %s）: %s", coll.name,
+                         bak.name if bak is not None else "-", det.get("writeErrors", [])[:1])
+        summary["rewritten"] += upserted
+        summary["dropped_duplicates"] += len(batch) - upserted
+        batch.clear()
+
+    for doc, new_id in stale_docs(coll, query):
+        summary["stale"] += 1
+        if dry_run:
+            continue
+        batch.append((doc, new_id))
+        if len(batch) >= batch_size:
+            flush()
+            logger.info("[%s]   %d 条已处理 (%.0f docs/s)", coll.name, summary["stale"],
+                        summary["stale"] / max(time.time() - t0, 1e-6))
+            if summary["errors"]:
+                break
+    if not summary["errors"]:
+        flush()
+    logger.info("[%s] 完成: %s, 耗时 %.1fs", coll.name, summary, time.time() - t0)
+    return summary
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="把帖子文档的 _id 改写为 md5(post_url)")
+    ap.add_argument("--uri", default=os.environ.get("MONGO_URI") or "mongodb://localhost:27017")
+    ap.add_argument("--layout", choices=["per_symbol", "unified"], default=None,
+                    help="存储布局（默认取 EM_STORAGE_LAYOUT）")
+    ap.add_argument("--symbols", nargs="*", default=None, help="只处理这些股票（默认全部）")
+    ap.add_argument("--batch-size", type=int, default=500)
+    ap.add_argument("--dry-run", action="store_true", help="只统计需要改写的文档数")
+    ap.add_argument("--no-backup", action="store_true", help="不备份旧文档（不建议）")
+    args = ap.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    db_name, prefix, unified = KIND_COLLECTIONS["post"]
+    db = client[db_name]
+    if storage_layout(args.layout) == "unified":
+        targets = [(symbol, db[unified], {"symbol": symbol}) for symbol in args.symbols] if args.symbols \
+            else [(None, db[unified], None)]
+    else:
+        targets = [(symbol, db[name], None)
+                   for symbol, name in source_collections(db, prefix, set(args.symbols) if args.symbols else None)]
+    logger.info("%s: %d 个待检查的集合/范围", db_name, len(targets))
+
+    failed = []
+    for symbol, coll, query in targets:
+        res = migrate_ids(coll, query, batch_size=args.batch_size, dry_run=args.dry_run, backup=not args.no_backup)
+        if args.dry_run:
+            logger.info("[%s] 需要改写 %d 条", symbol or coll.name, res["stale"])
+        if res["errors"]:
+            failed.append(symbol or coll.name)
+
+    client.close()
+    if failed:
+        logger.error("以下集合存在写入错误，请检查备份集合后重新运行: %s", failed)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
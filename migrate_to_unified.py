@@ -0,0 +1,144 @@
+# 用途：把按股票分集合的数据（post_info.post_{symbol} / comment_info.comment_{symbol}）
+#       合并到 unified 布局的 post_info.posts / comment_info.comments，文档加上 symbol 字段。
+# 可重复执行：帖子按 md5(post_url) 的 _id upsert，评论按原 _id upsert，已迁移的文档不会重复写入。
+# 运行：python migrate_to_unified.py                      # 迁移全部股票的帖子与评论
+#       python migrate_to_unified.py --symbols 000333 --kind post --dry-run
+#       python migrate_to_unified.py --drop-source          # 校验条数一致后删除旧集合
+# 迁移完成后设置 EM_STORAGE_LAYOUT=unified 让爬虫读写新集合。
+import re
+import os
+import sys
+import time
+import logging
+import argparse
+
+from pymongo import MongoClient, UpdateOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from mongodb import UNIFIED_INDEXES, KIND_COLLECTIONS, post_doc_id
+
+logger = logging.getLogger("migrate_to_unified")
+
+# 与 post_{symbol} 同前缀但不是股票集合的派生集合
+DERIVED_COLLECTIONS = ("post_snapshots", "post_snapshots_hourly")
+
+
+def source_collections(db, prefix, symbols=None):
+    """列出 db 中形如 {prefix}{symbol} 的集合（跳过 *_backup_* 等派生集合），返回 [(symbol, name)]。"""
+    pat = re.compile(rf"^{re.escape(prefix)}(\w+?)$")
+    found = []
+    for name in sorted(db.list_collection_names()):
+        m = pat.match(name)
+        if not m or "_backup" in name or name in DERIVED_COLLECTIONS:
+            continue
+        symbol = m.group(1)
+        if symbols and symbol not in symbols:
+            continue
+        found.append((symbol, name))
+    return found
+
+
+def ensure_unified_indexes(coll):
+    for keys, opts in UNIFIED_INDEXES.get(coll.name, []):
+        coll.create_index(keys, **opts)
+        logger.info("  索引就绪: %s.%s", coll.name, opts.get("name"))
+
+
+def _op_for(kind, symbol, doc):
+    doc["symbol"] = symbol
+    if kind == "post" and doc.get("post_url"):
+        # 帖子统一改用稳定 _id（md5(post_url)，与 upsert_many 的匹配键一致）；源集合中的重复 URL 只保留第一条
+        doc.pop("_id", None)
+        return UpdateOne({"_id": post_doc_id(doc["post_url"])}, {"$setOnInsert": doc}, upsert=True)
+    return ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+
+
+def migrate_collection(src, dst, kind, symbol, batch_size=1000, dry_run=False):
+    """把 src 中的全部文档写入 dst，返回 (读取数, upsert 数)。"""
+    total = src.estimated_document_count()
+    logger.info("[%s] %s.%s -> %s.%s (约 %d 条)", symbol, src.database.name, src.name,
+                dst.database.name, dst.name, total)
+    if dry_run:
+        return total, 0
+
+    read = upserted = 0
+    ops = []
+    t0 = time.time()
+
+    def flush():
+        nonlocal upserted
+        if not ops:
+            return
+        try:
+            res = dst.bulk_write(ops, ordered=False)
+            upserted += res.upserted_count
+        except BulkWriteError as bwe:
+            det = bwe.details or {}
+            upserted += det.get("nUpserted", 0)
+            logger.warning("[%s] bulk_write 部分失败: %d errors", symbol, len(det.get("writeErrors", [])))
+        ops.clear()
+
+    for doc in src.find({}, batch_size=batch_size):
+        ops.append(_op_for(kind, symbol, doc))
+        read += 1
+        if len(ops) >= batch_size:
+            flush()
+            logger.info("[%s]   %d / %d (%.0f docs/s)", symbol, read, total, read / max(time.time() - t0, 1e-6))
+    flush()
+    logger.info("[%s] 完成: 读取 %d, 新写入 %d, 耗时 %.1fs", symbol, read, upserted, time.time() - t0)
+    return read, upserted
+
+
+def verify(src, dst, kind, symbol):
+    """迁移后校验：目标中该 symbol 的条数应不少于源集合（帖子按 post_url 去重，允许少于源的重复数）。"""
+    n_dst = dst.count_documents({"symbol": symbol})
+    if kind == "post":
+        n_src = len(src.distinct("post_url")) + src.count_documents({"post_url": {"$exists": False}})
+    else:
+        n_src = src.count_documents({})
+    ok = n_dst >= n_src
+    logger.info("[%s] 校验 %s: 源 %d, 目标 %d -> %s", symbol, kind, n_src, n_dst, "OK" if ok else "MISMATCH")
+    return ok
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="迁移 per-symbol 集合到 unified posts/comments 集合")
+    ap.add_argument("--uri", default=os.environ.get("MONGO_URI") or "mongodb://localhost:27017")
+    ap.add_argument("--kind", choices=["post", "comment", "all"], default="all")
+    ap.add_argument("--symbols", nargs="*", default=None, help="只迁移这些股票（默认全部）")
+    ap.add_argument("--batch-size", type=int, default=1000)
+    ap.add_argument("--dry-run", action="store_true", help="只列出将迁移的集合与条数")
+    ap.add_argument("--drop-source", action="store_true", help="校验通过后删除旧的 per-symbol 集合")
+    args = ap.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    kinds = ["post", "comment"] if args.kind == "all" else [args.kind]
+    failed = []
+    for kind in kinds:
+        db_name, prefix, unified = KIND_COLLECTIONS[kind]
+        db = client[db_name]
+        dst = db[unified]
+        sources = source_collections(db, prefix, set(args.symbols) if args.symbols else None)
+        logger.info("%s: 找到 %d 个源集合", db_name, len(sources))
+        if not args.dry_run:
+            ensure_unified_indexes(dst)
+        for symbol, name in sources:
+            src = db[name]
+            migrate_collection(src, dst, kind, symbol, batch_size=args.batch_size, dry_run=args.dry_run)
+            if args.dry_run:
+                continue
+            if not verify(src, dst, kind, symbol):
+                failed.append(name)
+            elif args.drop_source:
+                src.drop()
+                logger.info("[%s] 已删除源集合 %s", symbol, name)
+
+    client.close()
+    if failed:
+        logger.error("以下集合校验未通过（未删除）: %s", failed)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
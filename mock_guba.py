@@ -0,0 +1,268 @@
+"""
+mock_guba.py
+
+本地模拟股吧站点，用于离线压测与重试行为测试（不再依赖线上站点）：
+- /list,{symbol},{page}.html：帖子列表页（tr.listitem 行 + 内嵌 article_list JSON + span.pagernums 分页信息）
+- /news,{symbol},{postid}.html：帖子页（div.replyList 一级回复 + ul.replyListL2 子回复）
+- POST /api/getData：回复 JSON 接口（与 comment_api_stub.py 相同的数据）
+故障注入（按请求随机）：固定延迟 + 抖动、HTTP 500、截断响应（HTML 少一半行 / JSON 被截断）、慢响应。
+给出 recorded_dir 时，目录中存在的同名文件（如 list,000333,1.html）优先原样返回，可用于回放录制的真实页面。
+
+运行：python mock_guba.py --port 8800 --latency-ms 50 --error-rate 0.02 --truncate-rate 0.01
+然后：GUBA_BASE_URL=http://127.0.0.1:8800 python run_pages.py ...（或用 load_test.py 自动启动）
+"""
+
+import os
+import json
+import time
+import html
+import random
+import argparse
+import datetime
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse, unquote
+from typing import Optional
+
+from comment_api_stub import StubReplyData, make_handler
+
+POSTS_PER_PAGE = 80
+_EPOCH = datetime.datetime(2025, 11, 1, 9, 0)
+
+
+class MockGubaConfig(object):
+    """故障注入参数；各 *_rate 为每个请求触发的概率。"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 truncate_rate: float = 0.0, slow_rate: float = 0.0, slow_ms: float = 2000.0,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """返回本次请求的 (delay 秒, fault)，fault 为 None / 'error' / 'truncate'。"""
+        with self._lock:
+            delay = max(self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms), 0.0) / 1000.0
+            if self.slow_rate and self.rng.random() < self.slow_rate:
+                delay += self.slow_ms / 1000.0
+            r = self.rng.random()
+        if r < self.error_rate:
+            return delay, 'error'
+        if r < self.error_rate + self.truncate_rate:
+            return delay, 'truncate'
+        return delay, None
+
+
+class MockGubaData(object):
+    """
+    确定性生成的列表与帖子。每个 symbol 有 pages * POSTS_PER_PAGE 个帖子，按序号 seq 从新到旧排列；
+    arrival_rate > 0 时每秒新增这么多帖子（出现在第 1 页顶部），用于测试 tail / 增量抓取。
+    """
+
+    def __init__(self, pages: int = 50, replies: int = 30, subs: int = 4, arrival_rate: float = 0.0):
+        self.pages = pages
+        self.replies = StubReplyData(replies=replies, subs=subs, inline_subs=subs)
+        self.arrival_rate = arrival_rate
+        self.started = time.time()
+
+    def newest_seq(self) -> int:
+        return self.pages * POSTS_PER_PAGE + int((time.time() - self.started) * self.arrival_rate)
+
+    def _post(self, symbol: str, seq: int) -> dict:
+        rnd = random.Random(f"{symbol}:{seq}")
+        published = _EPOCH + datetime.timedelta(minutes=3 * seq)
+        return {
+            'post_id': 1000000 + seq,
+            'stockbar_code': symbol,
+            'post_title': f"{symbol} mock post {seq}",
+            'post_click_count': rnd.randint(10, 50000),
+            'post_comment_count': rnd.randint(0, 300),
+            'post_publish_time': published.strftime("%Y-%m-%d %H:%M:%S"),
+            'user_nickname': f"user{rnd.randint(1, 500)}",
+        }
+
+    def list_posts(self, symbol: str, page: int) -> list:
+        newest = self.newest_seq()
+        start = newest - (page - 1) * POSTS_PER_PAGE
+        return [self._post(symbol, seq) for seq in range(start, max(start - POSTS_PER_PAGE, 0), -1)]
+
+    def list_page(self, symbol: str, page: int, truncate: bool = False) -> str:
+        posts = self.list_posts(symbol, page)
+        if truncate:
+            posts = posts[:len(posts) // 2]
+        total = self.newest_seq()
+        rows = []
+        for p in posts:
+            t = p['post_publish_time']
+            rows.append(
+                '<tr class="listitem">'
+                f'<td><div class="read">{p["post_click_count"]}</div></td>'
+                f'<td><div class="reply">{p["post_comment_count"]}</div></td>'
+                f'<td><div class="title"><a href="/news,{symbol},{p["post_id"]}.html">{html.escape(p["post_title"])}</a></div></td>'
+                f'<td><div class="author"><a class="nametext" href="#">{html.escape(p["user_nickname"])}</a></div></td>'
+                f'<td><div class="update">{t[5:16]}</div></td>'
+                '</tr>')
+        article_list = json.dumps({'re': posts, 'count': total}, ensure_ascii=False)
+        return (
+            '<!DOCTYPE html><html><head><meta charset="utf-8">'
+            f'<script>var article_list = {article_list};</script></head><body>'
+            '<div class="table_list"><table><tbody>' + "".join(rows) + '</tbody></table></div>'
+            f'<span class="pagernums" data-pager="list,{symbol}_|{total}|{POSTS_PER_PAGE}|{page}"></span>'
+            '</body></html>')
+
+    def post_page(self, symbol: str, postid: str, truncate: bool = False) -> str:
+        items = self.replies.reply_page(postid, 1, self.replies.replies)['re']
+        if truncate:
+            items = items[:len(items) // 2]
+        blocks = []
+        for r in items:
+            subs = "".join(
+                f'<li data-replyid="{s["reply_id"]}"><div class="reply_title"><span>{html.escape(s["reply_text"])}</span></div>'
+                f'<span class="likemodule">{s["reply_like_count"] or "点赞"}</span>'
+                f'<span class="pubtime">{s["reply_publish_time"]}</span></li>'
+                for s in self.replies.sub_replies(postid, r['reply_id']))
+            blocks.append(
+                f'<div class="replyList" data-replyid="{r["reply_id"]}">'
+                f'<div class="recont_right fl"><div class="reply_title"><span>{html.escape(r["reply_text"])}</span></div></div>'
+                f'<div class="publishtime"><span class="pubtime">{r["reply_publish_time"]}</span></div>'
+                f'<ul class="bottomright"><li></li><li></li><li></li><li><span>{r["reply_like_count"] or "点赞"}</span></li></ul>'
+                + (f'<ul class="replyListL2">{subs}</ul>' if subs else '') +
+                '</div>')
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>'
+                f'<div id="post_content">{symbol} post {postid}</div>' + "".join(blocks) + '</body></html>')
+
+
+def make_mock_handler(data: MockGubaData, config: MockGubaConfig, stats: dict, recorded_dir: Optional[str] = None):
+    api_handler = make_handler(data.replies)
+    stats_lock = threading.Lock()
+
+    def count(key):
+        with stats_lock:
+            stats[key] = stats.get(key, 0) + 1
+
+    class Handler(api_handler):
+
+        def _fault(self):
+            delay, fault = config.draw()
+            count('requests')
+            if delay:
+                time.sleep(delay)
+            if fault == 'error':
+                count('errors')
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return True, False
+            if fault == 'truncate':
+                count('truncated')
+            return False, fault == 'truncate'
+
+        def _send_html(self, body: str):
+            raw = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _send_json(self, obj, status=200):
+            if getattr(self, '_truncate', False):
+                # 截断的 JSON：客户端解析失败后应重试
+                raw = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+                raw = raw[:len(raw) // 2]
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+                return
+            super()._send_json(obj, status)
+
+        def do_GET(self):
+            failed, truncate = self._fault()
+            if failed:
+                return
+            name = unquote(urlparse(self.path).path).lstrip('/')
+            if recorded_dir and name and os.path.isfile(os.path.join(recorded_dir, name)):
+                with open(os.path.join(recorded_dir, name), encoding='utf-8') as f:
+                    return self._send_html(f.read())
+            parts = name[:-5].split(',') if name.endswith('.html') else []
+            try:
+                if len(parts) == 3 and parts[0] == 'list':
+                    count('list_pages')
+                    return self._send_html(data.list_page(parts[1], int(parts[2]), truncate=truncate))
+                if len(parts) == 3 and parts[0] == 'news':
+                    count('post_pages')
+                    return self._send_html(data.post_page(parts[1], parts[2], truncate=truncate))
+            except ValueError:
+                pass
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            failed, truncate = self._fault()
+            if failed:
+                return
+            count('api_calls')
+            self._truncate = truncate
+            super().do_POST()
+
+    return Handler
+
+
+def start_mock_server(host: str = '127.0.0.1', port: int = 0, data: Optional[MockGubaData] = None,
+                      config: Optional[MockGubaConfig] = None, recorded_dir: Optional[str] = None):
+    """在后台线程启动 mock，返回 (server, base_url)；server.stats 为请求/故障计数。"""
+    stats = {}
+    server = ThreadingHTTPServer((host, port), make_mock_handler(data or MockGubaData(), config or MockGubaConfig(),
+                                                                 stats, recorded_dir))
+    server.daemon_threads = True
+    server.stats = stats
+    t = threading.Thread(target=server.serve_forever, name="mock-guba", daemon=True)
+    t.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_fault_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--pages", type=int, default=50, help="每个股票的列表页数")
+    ap.add_argument("--replies", type=int, default=30, help="每个帖子的一级回复数")
+    ap.add_argument("--arrival-rate", type=float, default=0.0, help="每秒新增帖子数（模拟新帖）")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="返回 HTTP 500 的概率")
+    ap.add_argument("--truncate-rate", type=float, default=0.0, help="返回截断内容的概率")
+    ap.add_argument("--slow-rate", type=float, default=0.0, help="额外延迟 --slow-ms 的概率")
+    ap.add_argument("--slow-ms", type=float, default=2000.0)
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--recorded-dir", default=None, help="录制页面目录（同名文件优先返回）")
+
+
+def build_from_args(args):
+    data = MockGubaData(pages=args.pages, replies=args.replies, arrival_rate=args.arrival_rate)
+    config = MockGubaConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                            truncate_rate=args.truncate_rate, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+                            seed=args.seed)
+    return data, config
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local mock of the guba site for load tests")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8800)
+    add_fault_args(ap)
+    args = ap.parse_args()
+    data, config = build_from_args(args)
+    srv, base = start_mock_server(args.host, args.port, data, config, args.recorded_dir)
+    print(f"mock guba listening on {base}  (export GUBA_BASE_URL={base})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -1,26 +1,198 @@
 ﻿from pymongo import MongoClient, UpdateOne
-from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+from collections import OrderedDict
 import datetime
 import logging
+import threading
+import time
 import json, os
+import hashlib
+
+from records import as_dict
 
 # 使用明确的 logger 名称，便于在 logging.conf 中单独控制
 logger = logging.getLogger('eastmoney_crawler.mongodb')
 
+# 每页一条"最后看到"记录的集合（与帖子集合同库）
+TOUCH_COLLECTION = 'crawl_touch'
+# 确认没有评论的帖子（与评论集合同库）：评论集合里没有它们的文档，"已抓过评论的帖子"无法从 post_id 重建
+EMPTY_POSTS_COLLECTION = 'empty_comment_posts'
+# ChangeStreamConsumer 保存 resume token 的集合（与被监听的集合同库，_id 为消费者名称）
+RESUME_TOKEN_COLLECTION = 'change_stream_tokens'
+# 与 post_{symbol} 同前缀、但不属于爬虫数据的集合，change stream 不监听（snapshots.py 的快照集合）
+NON_DATA_COLLECTIONS = ('post_snapshots', 'post_snapshots_hourly')
+
+# 存储布局：
+# - per_symbol（默认）：post_info.post_{symbol} / comment_info.comment_{symbol}，每个股票一组集合
+# - unified：post_info.posts / comment_info.comments，文档带 symbol 字段，所有读写都按 symbol 限定范围
+# 可通过环境变量 EM_STORAGE_LAYOUT 切换
+LAYOUTS = ('per_symbol', 'unified')
+STORAGE_LAYOUT_ENV = 'EM_STORAGE_LAYOUT'
+
+# kind -> (数据库, per_symbol 集合名前缀, unified 集合名)
+KIND_COLLECTIONS = {
+    'post': ('post_info', 'post_', 'posts'),
+    'comment': ('comment_info', 'comment_', 'comments'),
+}
+
+# unified 布局下各集合的复合索引：(symbol, 业务键) 使按股票的查询与跨股票查询都走索引
+UNIFIED_INDEXES = {
+    'posts': [
+        ([('symbol', 1), ('post_url', 1)], {'name': 'symbol_post_url', 'unique': True}),
+        ([('symbol', 1), ('post_date', -1)], {'name': 'symbol_post_date'}),
+        ([('symbol', 1), ('post_ts', -1)], {'name': 'symbol_post_ts'}),
+        ([('symbol', 1), ('post_view', -1)], {'name': 'symbol_post_view'}),
+    ],
+    'comments': [
+        ([('symbol', 1), ('post_id', 1)], {'name': 'symbol_post_id'}),
+        ([('symbol', 1), ('comment_date', -1)], {'name': 'symbol_comment_date'}),
+        ([('symbol', 1), ('comment_ts', -1)], {'name': 'symbol_comment_ts'}),
+    ],
+}
+
+# per_symbol 布局下各 kind 集合的索引：post_ts / comment_ts 让时间窗口查询成为一次索引范围扫描，
+# post_view（int）让按阅读数排名成为索引排序
+PER_SYMBOL_INDEXES = {
+    'post_': [([('post_ts', -1)], {'name': 'post_ts'}), ([('post_view', -1)], {'name': 'post_view'})],
+    'comment_': [([('comment_ts', -1)], {'name': 'comment_ts'})],
+}
+
+# 本进程内已确保过索引的 (db, collection)，避免每次新建 MongoAPI 都发送 createIndexes
+_indexed = set()
+_indexed_lock = threading.Lock()
+
+
+def storage_layout(layout=None) -> str:
+    """返回生效的存储布局：显式参数 > EM_STORAGE_LAYOUT > per_symbol。"""
+    layout = (layout or os.environ.get(STORAGE_LAYOUT_ENV) or 'per_symbol').lower()
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown storage layout {layout!r}, expected one of {LAYOUTS}")
+    return layout
+
+
+def symbol_collection(kind: str, symbol: str, layout=None):
+    """返回 (db_name, collection_name, scope_symbol)；per_symbol 布局下 scope_symbol 为 None。"""
+    db_name, prefix, unified = KIND_COLLECTIONS[kind]
+    if storage_layout(layout) == 'unified':
+        return db_name, unified, symbol
+    return db_name, f"{prefix}{symbol}", None
+
+
+def post_doc_id(post_url: str) -> str:
+    """帖子文档的稳定 _id：md5(post_url)。upsert 以它为匹配键，migrate_post_ids.py 用它改写旧文档。"""
+    return hashlib.md5(post_url.strip().encode('utf-8')).hexdigest()
+
+
+class ChangeCache(object):
+    """
+    post_url -> (post_view, comment_num) 的 LRU 缓存，用于在 bulk_write 之前丢弃未变化的帖子。
+    以 post_url/post_view/comment_num 投影从 Mongo 预热；只有写入成功的文档才会更新缓存。
+    缓存看不到其它进程的删除（archive.py 归档、恢复、手工清理），被删除且计数未变的帖子会一直被当作"未变化"而不再写回，
+    因此缓存只在一次抓取内使用：enable_change_cache 对超过 max_age_s 的共享缓存重新预热，
+    upsert 时缓存中已有的帖子被当作新文档插入（说明已被删除）则整体清空。
+    """
+
+    def __init__(self, max_size: int = 50000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.warmed = False
+        self.created_at = time.monotonic()
+
+    @staticmethod
+    def _value(doc):
+        return doc.get('post_view'), doc.get('comment_num')
+
+    def warm(self, coll, query=None):
+        """query 用于限定预热范围（unified 布局下传入 {'symbol': ...}），总会附加 post_url 存在的条件。"""
+        projection = {'_id': 0, 'post_url': 1, 'post_view': 1, 'comment_num': 1}
+        n = 0
+        try:
+            cursor = coll.find(dict(query or {}, post_url={'$exists': True}), projection,
+                               batch_size=5000).limit(self.max_size)
+            for d in cursor:
+                url = d.get('post_url')
+                if url:
+                    self.put(url, self._value(d))
+                    n += 1
+        except PyMongoError:
+            logger.exception("[ChangeCache] warm 失败，缓存从空开始")
+        self.warmed = True
+        return n
+
+    def put(self, url, value):
+        with self._lock:
+            self._data[url] = value
+            self._data.move_to_end(url)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def is_unchanged(self, doc) -> bool:
+        url = doc.get('post_url')
+        if not url:
+            return False
+        with self._lock:
+            cached = self._data.get(url)
+            if cached is None:
+                return False
+            self._data.move_to_end(url)
+            return cached == self._value(doc)
+
+    def update(self, docs):
+        for d in docs:
+            url = d.get('post_url')
+            if url:
+                self.put(url, self._value(d))
+
+    def clear(self):
+        """清空缓存；下一次 enable_change_cache 会重新预热。"""
+        with self._lock:
+            self._data.clear()
+            self.warmed = False
+
+    def __contains__(self, url):
+        return url in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+# 同一进程内按 (db, collection) 共享缓存：run_pages.py 每页新建 PostCrawler 时无需重复预热；
+# 超过 CHANGE_CACHE_MAX_AGE_S 后下一个 PostCrawler 重新预热，常驻进程（scheduler、process_runner）不会一直沿用旧缓存
+CHANGE_CACHE_MAX_AGE_S = 1800
+_change_caches = {}
+_change_caches_lock = threading.Lock()
+
+
+def clear_change_caches():
+    """清空本进程所有的变化检测缓存（同进程内删除了帖子后调用，如 archive.py）。"""
+    with _change_caches_lock:
+        caches = list(_change_caches.values())
+    for cache in caches:
+        cache.clear()
+
 class MongoAPI(object):
 
-    def __init__(self, db_name: str, collection_name: str, host='localhost', port=27017, uri=None):
+    def __init__(self, db_name: str, collection_name: str, host='localhost', port=27017, uri=None, client=None,
+                 symbol=None):
         """
         如果提供 uri，则优先使用 uri（支持认证或非默认端口）。
         调用签名与 crawler.py 的使用一致： MongoAPI("post_info", "post_000333")
+        client: 可选，复用已有的 MongoClient（同一进程内多个集合共享连接池）。
+        symbol: 可选，给出时本实例只读写 symbol 字段等于它的文档（unified 布局的共享集合），
+                写入时自动带上 symbol 字段。一般通过 MongoAPI.for_symbol 构造。
         """
         self.host = host
         self.port = port
         self.db_name = db_name
         self.collection = collection_name
+        self.symbol = symbol
+        self.scope = {'symbol': symbol} if symbol is not None else {}
 
         try:
-            if uri:
+            if client is not None:
+                self.client = client
+            elif uri:
                 self.client = MongoClient(uri, serverSelectionTimeoutMS=3000)
             else:
                 self.client = MongoClient(host=self.host, port=self.port, serverSelectionTimeoutMS=3000)
@@ -31,8 +203,125 @@ class MongoAPI(object):
 
         self.db = self.client[self.db_name]
         self.coll = self.db[self.collection]
+        self.change_cache = None
+        self.change_listeners = []
+
+    @classmethod
+    def for_symbol(cls, kind: str, symbol: str, layout=None, **kwargs):
+        """
+        按存储布局返回某只股票的帖子（kind='post'）或评论（kind='comment'）集合：
+        MongoAPI.for_symbol('post', '000333') -> per_symbol 下为 post_info.post_000333，
+        unified 下为 post_info.posts 并限定 symbol='000333'（同时确保复合索引存在）。
+        """
+        db_name, coll_name, scope_symbol = symbol_collection(kind, symbol, layout)
+        api = cls(db_name, coll_name, symbol=scope_symbol, **kwargs)
+        api.ensure_indexes()
+        return api
+
+    @property
+    def scope_name(self) -> str:
+        """集合名 + symbol 范围，用于缓存键与 touch 记录的 _id。"""
+        return f"{self.collection}:{self.symbol}" if self.symbol is not None else self.collection
+
+    def _scoped(self, query=None):
+        if not self.scope:
+            return query or {}
+        return dict(query or {}, **self.scope)
+
+    def ensure_indexes(self):
+        """创建本集合的索引（unified 的复合索引或 per_symbol 的时间索引；已存在时为空操作），返回索引名列表。"""
+        key = (self.db_name, self.collection)
+        with _indexed_lock:
+            if key in _indexed:
+                return []
+            _indexed.add(key)
+        specs = UNIFIED_INDEXES.get(self.collection)
+        if specs is None:
+            specs = next((v for prefix, v in PER_SYMBOL_INDEXES.items() if self.collection.startswith(prefix)), [])
+        names = []
+        for keys, opts in specs:
+            try:
+                names.append(self.coll.create_index(keys, **opts))
+            except PyMongoError:
+                logger.exception("[MongoAPI] create index %s on %s 失败", opts.get('name'), self.collection)
+        return names
+
+    def add_change_listener(self, fn):
+        """
+        注册回调 fn(docs)：每次 upsert_many 成功写入后，以实际写入（新增或有变化）的文档列表调用；
+        insert_many 写入后以本批文档调用（部分失败时也会调用）。
+        """
+        self.change_listeners.append(fn)
+
+    def _notify(self, docs):
+        for fn in self.change_listeners:
+            try:
+                fn(docs)
+            except Exception:
+                logger.exception("[MongoAPI] change listener %r 错误", fn)
+
+    def enable_change_cache(self, max_size: int = 50000, max_age_s: float = CHANGE_CACHE_MAX_AGE_S) -> ChangeCache:
+        """启用（并按需预热）本集合的变化检测缓存；同进程同集合共享一个实例，超过 max_age_s 时换新的并重新预热。"""
+        key = (self.db_name, self.scope_name)
+        with _change_caches_lock:
+            cache = _change_caches.get(key)
+            if cache is None or time.monotonic() - cache.created_at > max_age_s:
+                cache = ChangeCache(max_size=max_size)
+                _change_caches[key] = cache
+        if not cache.warmed:
+            n = cache.warm(self.coll, self.scope)
+            logger.info("[MongoAPI] change cache for %s warmed with %d posts", self.scope_name, n)
+            try:
+                self.db[TOUCH_COLLECTION].create_index('post_urls')
+            except PyMongoError:
+                logger.debug("[MongoAPI] create crawl_touch index failed", exc_info=True)
+        self.change_cache = cache
+        return cache
+
+    def touch(self, touch_key, post_urls):
+        """
+        记录一批帖子"最后看到"的时间：每个 touch_key（如某一列表页）只写一条文档，
+        而不是给每一行都 $set last_crawled。查询某帖最后被看到的时间：
+        db.crawl_touch.find({'post_urls': url}).sort('last_seen', -1).limit(1)
+        """
+        if not post_urls:
+            return
+        try:
+            self.db[TOUCH_COLLECTION].update_one(
+                {'_id': f'{self.scope_name}:{touch_key}'},
+                {'$set': {'collection': self.collection, **self.scope, 'post_urls': list(post_urls),
+                          'last_seen': datetime.datetime.utcnow()}},
+                upsert=True)
+        except PyMongoError:
+            logger.exception("[MongoAPI] touch 错误")
+
+    def mark_no_comments(self, post_urls):
+        """记录一批已抓取、确认没有评论的帖子（评论集合的 MongoAPI 上调用），_id 为 '{scope_name}:{post_url}'。"""
+        now = datetime.datetime.utcnow()
+        for url in post_urls:
+            if not url:
+                continue
+            try:
+                self.db[EMPTY_POSTS_COLLECTION].update_one(
+                    {'_id': f'{self.scope_name}:{url}'},
+                    {'$set': {'scope': self.scope_name, 'post_url': url, 'checked_at': now}},
+                    upsert=True)
+            except PyMongoError:
+                logger.exception("[MongoAPI] mark_no_comments 错误")
+
+    def no_comment_posts(self) -> list:
+        """返回本范围内记录为没有评论的帖子 URL。"""
+        try:
+            cursor = self.db[EMPTY_POSTS_COLLECTION].find({'scope': self.scope_name}, {'_id': 0, 'post_url': 1})
+            return [d['post_url'] for d in cursor if d.get('post_url')]
+        except PyMongoError:
+            logger.exception("[MongoAPI] no_comment_posts 错误")
+            return []
 
     def insert_one(self, kv_dict):
+        kv_dict = as_dict(kv_dict)
+        if self.scope:
+            kv_dict = dict(kv_dict, **self.scope)
         try:
             res = self.coll.insert_one(kv_dict)
             return res.inserted_id
@@ -47,10 +336,16 @@ class MongoAPI(object):
         """
         if not li_dict:
             return {'inserted_count': 0, 'errors': 0}
+        # 记录（records.Record）在这里才转成 dict 交给 pymongo
+        if self.scope:
+            li_dict = [dict(as_dict(d), **self.scope) for d in li_dict]
+        else:
+            li_dict = [as_dict(d) for d in li_dict]
 
         try:
             res = self.coll.insert_many(li_dict, ordered=False)
             inserted = len(res.inserted_ids) if getattr(res, 'inserted_ids', None) is not None else 0
+            self._notify(li_dict)
             return {'inserted_count': inserted, 'errors': 0}
         except BulkWriteError as bwe:
             det = getattr(bwe, 'details', {}) or {}
@@ -60,6 +355,8 @@ class MongoAPI(object):
                 inserted = 0
             write_errors = det.get('writeErrors', []) if isinstance(det, dict) else []
             logger.exception("[MongoAPI] insert_many 部分失败")
+            if inserted:
+                self._notify(li_dict)
             return {
                 'inserted_count': inserted,
                 'errors': len(write_errors),
@@ -69,56 +366,70 @@ class MongoAPI(object):
             logger.exception("[MongoAPI] insert_many 错误")
             return {'inserted_count': 0, 'errors': 1, 'error': str(e)}
 
-    def upsert_many(self, docs, id_field='_id', update_fields=None, insert_on_new=None):
+    def upsert_many(self, docs, id_field='_id', update_fields=None, insert_on_new=None, touch_key=None):
         """
         批量 upsert（更安全的白名单策略）：
         - docs: 文档列表（每个为 dict）
-        - id_field: 默认用于回退匹配的字段（当 post_url 不存在时）
+        - id_field: 首选匹配字段（默认 _id，即 PostCrawler 生成的 md5(post_url)）；
+          文档没有该字段时回退到 post_url。以 _id 匹配走主键索引，即使缺少 post_url 唯一索引也不会产生重复文档
         - update_fields: 可选列表，仅这些字段会被放入 $set（动态字段）
           默认: ['post_view', 'comment_num', 'last_crawled', 'post_time']
         - insert_on_new: 可选列表，首次插入时会把这些字段放入 $setOnInsert（静态元数据）
-          默认: ['post_title', 'post_url', 'author', 'post_date', 'post_time']
+          默认: ['post_title', 'post_url', 'post_author', 'post_date', 'post_time', 'post_ts']
+        - touch_key: 可选，给出时把整批 post_url 记为一条"最后看到"记录（见 touch）
+        限定了 symbol 时，匹配条件与 $setOnInsert 都会带上 symbol。
+        启用 change_cache 后，post_view/comment_num 与缓存一致的文档不会进入 bulk_write，
+        其数量记在 summary 的 'skipped_unchanged' 中。
         返回 summary dict（与之前一致），并在异常时包含 'error' 字段。
         """
         if not docs:
             return {'upserted_count': 0, 'matched_count': 0, 'modified_count': 0}
 
+        if touch_key is not None:
+            self.touch(touch_key, [d.get('post_url') for d in docs if d.get('post_url')])
+
+        skipped = 0
+        cached_urls = set()
+        if self.change_cache is not None:
+            changed = [d for d in docs if not self.change_cache.is_unchanged(d)]
+            cached_urls = {d.get('post_url') for d in changed if d.get('post_url') in self.change_cache}
+            skipped = len(docs) - len(changed)
+            docs = changed
+            if not docs:
+                return {'upserted_count': 0, 'matched_count': 0, 'modified_count': 0, 'skipped_unchanged': skipped}
+
         # 默认白名单
         if update_fields is None:
             # 不把 'post_time' 放到 $set，避免与已存在不同类型冲突
             update_fields = ['post_view', 'comment_num', 'last_crawled']
         if insert_on_new is None:
             # 使用 parser 输出的字段名 'post_author'
-            insert_on_new = ['post_title', 'post_url', 'post_author', 'post_date', 'post_time']
+            insert_on_new = ['post_title', 'post_url', 'post_author', 'post_date', 'post_time', 'post_ts']
+        update_fields = [k for k in update_fields if k != '_id']
+        insert_on_new = [k for k in insert_on_new if k != '_id']
+        set_last_crawled = 'last_crawled' in update_fields
+        update_fields = [k for k in update_fields if k != 'last_crawled']
 
         ops = []
+        op_docs = []
         for d in docs:
-            post_url = d.get('post_url')
-            if post_url:
-                filt = {'post_url': post_url}
+            if d.get(id_field) is not None:
+                # 匹配条件中的 _id 在 upsert 插入时会原样写入新文档
+                filt = self._scoped({id_field: d[id_field]})
+            elif d.get('post_url'):
+                filt = self._scoped({'post_url': d['post_url']})
             else:
-                if id_field in d:
-                    filt = {id_field: d[id_field]}
-                else:
-                    logger.warning("[MongoAPI] upsert_many: skipping doc with no match key")
-                    continue
+                logger.warning("[MongoAPI] upsert_many: skipping doc with no match key")
+                continue
 
-            # 构建 $set（只包含白名单里的字段且不包含 _id）
-            set_doc = {}
-            for k in update_fields:
-                if k == '_id':
-                    continue
-                if k == 'last_crawled':
-                    # 始终更新/写入为当前 UTC datetime
-                    set_doc['last_crawled'] = datetime.datetime.utcnow()
-                elif k in d:
-                    set_doc[k] = d[k]
+            # 构建 $set（只包含白名单里的字段且不包含 _id）；last_crawled 始终写入为当前 UTC datetime
+            set_doc = as_dict(d, update_fields)
+            if set_last_crawled:
+                set_doc['last_crawled'] = datetime.datetime.utcnow()
 
             # 构建 $setOnInsert（仅在首次插入写入静态字段）
-            set_on_insert = {}
-            for k in insert_on_new:
-                if k != '_id' and k in d:
-                    set_on_insert[k] = d[k]
+            set_on_insert = as_dict(d, insert_on_new)
+            set_on_insert.update(self.scope)
 
             update_op = {}
             if set_doc:
@@ -132,16 +443,27 @@ class MongoAPI(object):
                 continue
 
             ops.append(UpdateOne(filt, update_op, upsert=True))
+            op_docs.append(d)
 
         if not ops:
-            return {'upserted_count': 0, 'matched_count': 0, 'modified_count': 0}
+            return {'upserted_count': 0, 'matched_count': 0, 'modified_count': 0, 'skipped_unchanged': skipped}
 
         try:
             res = self.coll.bulk_write(ops, ordered=False)
+            if self.change_cache is not None:
+                upserted = getattr(res, 'upserted_ids', None) or {}
+                if cached_urls and any(op_docs[i].get('post_url') in cached_urls for i in upserted):
+                    # 缓存中有的帖子在集合里已不存在：有其它进程删除过文档，缓存里其它条目也不可信
+                    logger.info("[MongoAPI] change cache for %s is stale (cached posts were deleted), clearing",
+                                self.scope_name)
+                    self.change_cache.clear()
+                self.change_cache.update(docs)
+            self._notify(docs)
             return {
                 'upserted_count': getattr(res, 'upserted_count', 0),
                 'matched_count': getattr(res, 'matched_count', 0),
                 'modified_count': getattr(res, 'modified_count', 0),
+                'skipped_unchanged': skipped,
             }
         except BulkWriteError as bwe:
             det = getattr(bwe, 'details', {}) or {}
@@ -184,14 +506,14 @@ class MongoAPI(object):
 
     def find_one(self, query1=None, query2=None):
         try:
-            return self.coll.find_one(filter=(query1 or {}), projection=(query2 or None))
+            return self.coll.find_one(filter=self._scoped(query1), projection=(query2 or None))
         except PyMongoError:
             logger.exception("[MongoAPI] find_one 错误")
             return None
 
     def find(self, query1=None, query2=None):
         try:
-            cursor = self.coll.find(filter=(query1 or {}), projection=(query2 or None))
+            cursor = self.coll.find(filter=self._scoped(query1), projection=(query2 or None))
             return list(cursor)
         except PyMongoError:
             logger.exception("[MongoAPI] find 错误")
@@ -199,21 +521,21 @@ class MongoAPI(object):
 
     def find_first(self):
         try:
-            return self.coll.find_one(sort=[('_id', 1)])
+            return self.coll.find_one(self._scoped(), sort=[('_id', 1)])
         except PyMongoError:
             logger.exception("[MongoAPI] find_first 错误")
             return None
 
     def find_last(self):
         try:
-            return self.coll.find_one(sort=[('_id', -1)])
+            return self.coll.find_one(self._scoped(), sort=[('_id', -1)])
         except PyMongoError:
             logger.exception("[MongoAPI] find_last 错误")
             return None
 
     def count_documents(self):
         try:
-            return self.coll.count_documents({})
+            return self.coll.count_documents(self._scoped())
         except PyMongoError:
             logger.exception("[MongoAPI] count_documents 错误")
             return 0
@@ -226,16 +548,220 @@ class MongoAPI(object):
         data = dict(kv_dict)
         data.pop('_id', None)
         try:
-            res = self.coll.update_one({'_id': _id}, {'$set': data}, upsert=False)
+            res = self.coll.update_one(self._scoped({'_id': _id}), {'$set': data}, upsert=False)
             return res.modified_count
         except PyMongoError:
             logger.exception("[MongoAPI] update_one 错误")
             return None
 
     def drop(self):
+        """删除本集合；限定了 symbol 时只删除该 symbol 的文档，不影响共享集合中的其它股票。"""
         try:
-            self.coll.drop()
+            if self.scope:
+                self.coll.delete_many(self.scope)
+            else:
+                self.coll.drop()
             return True
         except PyMongoError:
             logger.exception("[MongoAPI] drop 错误")
             return False
+
+
+class ChangeStreamConsumer(object):
+    """
+    监听爬虫集合（post_* / comment_*，unified 布局下为 posts / comments）的插入与更新，按批交给已注册的 handler，
+    下游任务不再需要定期全表扫描找出"上次之后变化的文档"。
+    - 每批最多 batch_size 个事件，或距批内第一个事件 max_wait 秒后提交，空闲时延迟也在 max_wait 以内；
+    - 每批 handler 全部执行成功后把 resume token 写入同库的 change_stream_tokens（_id=name），重启后从上次位置继续；
+      handler 抛出异常时不保存 token，按退避间隔只重试失败的 handler，直到成功或 stop()（期间进程退出则重启后整批重放），
+      即至少一次投递，handler 应按 _id 幂等处理；skip_failed=True 时只记录日志并继续（至多一次，与 MongoAPI 的 change listener 相同）；
+    - token 已超出 oplog 范围（长时间停机）时记录错误并从当前时刻重新开始，下游应自行补一次全量扫描。
+    change stream 需要副本集（单节点副本集即可，见 README）；独立 mongod 上 run() 会抛出 RuntimeError。
+
+    handler(events) 中每个事件为 dict：
+        op          'insert' / 'update' / 'replace'
+        collection  集合名
+        symbol      股票代码（per_symbol 取自集合名，unified 取自文档的 symbol 字段）
+        _id         文档 _id
+        doc         完整文档（更新事件为提交时查回的当前版本，文档已被删除时为 None）
+        updated     更新事件中被修改的字段 dict，其它事件为 None
+        cluster_time 事件的 oplog 时间（bson.Timestamp）
+
+    示例：
+        consumer = ChangeStreamConsumer(client, 'daily_rollup', kind='post', symbols=['000333'])
+        consumer.add_handler(lambda events: print(len(events)))
+        consumer.run()          # 阻塞，另一线程调用 consumer.stop() 结束
+    """
+
+    def __init__(self, client, name: str, kind: str = 'post', symbols=None, layout=None,
+                 operation_types=('insert', 'update', 'replace'), batch_size: int = 500, max_wait: float = 0.5,
+                 full_document: str = 'updateLookup', token_save_interval: float = 10.0, skip_failed: bool = False):
+        self.client = client
+        self.name = name
+        self.kind = kind
+        self.symbols = list(symbols) if symbols else None
+        self.layout = storage_layout(layout)
+        self.operation_types = list(operation_types)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.full_document = full_document
+        self.token_save_interval = token_save_interval
+        self.skip_failed = skip_failed
+        db_name, self.prefix, self.unified = KIND_COLLECTIONS[kind]
+        self.db = client[db_name]
+        self.tokens = self.db[RESUME_TOKEN_COLLECTION]
+        self.handlers = []
+        self.stats = {'events': 0, 'batches': 0, 'handler_errors': 0}
+        self._stop = threading.Event()
+
+    def add_handler(self, fn, operation_types=None):
+        """注册 fn(events)；给出 operation_types 时只把这些类型的事件交给 fn（本批没有时不调用）。"""
+        self.handlers.append((fn, set(operation_types) if operation_types else None))
+
+    def pipeline(self) -> list:
+        """change stream 的 $match：只保留本 kind 的数据集合与所需的操作类型，按 symbols 限定范围。"""
+        match = {'operationType': {'$in': self.operation_types}}
+        if self.layout == 'unified':
+            match['ns.coll'] = self.unified
+            if self.symbols:
+                match['fullDocument.symbol'] = {'$in': self.symbols}
+        elif self.symbols:
+            match['ns.coll'] = {'$in': [f"{self.prefix}{s}" for s in self.symbols]}
+        else:
+            match['$and'] = [
+                {'ns.coll': {'$regex': rf"^{self.prefix}\w+$"}},
+                {'ns.coll': {'$not': {'$regex': '_backup'}}},
+                {'ns.coll': {'$nin': list(NON_DATA_COLLECTIONS)}},
+            ]
+        return [{'$match': match}]
+
+    # ---- resume token ----
+
+    def load_token(self):
+        doc = self.tokens.find_one({'_id': self.name})
+        return doc.get('token') if doc else None
+
+    def save_token(self, token, events: int = 0):
+        if token is None:
+            return
+        self.tokens.update_one(
+            {'_id': self.name},
+            {'$set': {'token': token, 'kind': self.kind, 'updated_at': datetime.datetime.utcnow()},
+             '$inc': {'events': events}},
+            upsert=True)
+
+    def reset_token(self):
+        """丢弃已保存的位置，下次 run() 从当前时刻开始。"""
+        self.tokens.delete_one({'_id': self.name})
+
+    # ---- 事件处理 ----
+
+    def _event(self, change) -> dict:
+        coll = change.get('ns', {}).get('coll')
+        doc = change.get('fullDocument')
+        if self.layout == 'unified':
+            symbol = (doc or {}).get('symbol')
+        else:
+            symbol = coll[len(self.prefix):] if coll else None
+        update = change.get('updateDescription')
+        return {
+            'op': change.get('operationType'),
+            'collection': coll,
+            'symbol': symbol,
+            '_id': change.get('documentKey', {}).get('_id'),
+            'doc': doc,
+            'updated': update.get('updatedFields') if update else None,
+            'cluster_time': change.get('clusterTime'),
+        }
+
+    def _dispatch(self, events, handlers=None) -> list:
+        """把一批事件交给 handlers（默认全部已注册的），返回抛出异常的 (fn, ops) 列表。"""
+        failed = []
+        for entry in (self.handlers if handlers is None else handlers):
+            fn, ops = entry
+            selected = events if ops is None else [e for e in events if e['op'] in ops]
+            if not selected:
+                continue
+            try:
+                fn(selected)
+            except Exception:
+                self.stats['handler_errors'] += 1
+                failed.append(entry)
+                logger.exception("[ChangeStreamConsumer %s] handler %r 错误", self.name, fn)
+        return failed
+
+    def _deliver(self, events) -> bool:
+        """投递一批事件；skip_failed=False 时重试失败的 handler 直到成功，stop() 打断时返回 False（不保存 token）。"""
+        failed = self._dispatch(events)
+        wait = 1.0
+        while failed and not self.skip_failed:
+            logger.warning("[ChangeStreamConsumer %s] %d handler(s) failed, retrying batch of %d in %.0fs",
+                           self.name, len(failed), len(events), wait)
+            if self._stop.wait(wait):
+                return False
+            wait = min(wait * 2, 60.0)
+            failed = self._dispatch(events, failed)
+        self.stats['events'] += len(events)
+        self.stats['batches'] += 1
+        return True
+
+    def _watch(self, token):
+        kwargs = {'full_document': self.full_document, 'batch_size': self.batch_size,
+                  'max_await_time_ms': max(int(self.max_wait * 1000), 1)}
+        if token is not None:
+            kwargs['resume_after'] = token
+        return self.db.watch(self.pipeline(), **kwargs)
+
+    def run(self, max_batches=None):
+        """阻塞消费直到 stop() 被调用（或已提交 max_batches 批，用于测试）。"""
+        self._stop.clear()
+        token = self.load_token()
+        logger.info("[ChangeStreamConsumer %s] watching %s (%s) from %s", self.name, self.db.name, self.layout,
+                    "saved token" if token is not None else "now")
+        batches = 0
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                with self._watch(token) as stream:
+                    backoff = 1.0
+                    events, first_at, saved_at = [], None, time.time()
+                    while not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            events.append(self._event(change))
+                            first_at = first_at or time.time()
+                        due = events and (len(events) >= self.batch_size or change is None
+                                          or time.time() - first_at >= self.max_wait)
+                        if due:
+                            if not self._deliver(events):
+                                return
+                            token = stream.resume_token
+                            self.save_token(token, len(events))
+                            events, first_at = [], None
+                            saved_at = time.time()
+                            batches += 1
+                            if max_batches is not None and batches >= max_batches:
+                                return
+                        elif change is None and time.time() - saved_at >= self.token_save_interval:
+                            # 空闲时也推进 token（postBatchResumeToken），避免重启时从很旧的位置重放被过滤掉的事件
+                            if stream.resume_token is not None and stream.resume_token != token:
+                                token = stream.resume_token
+                                self.save_token(token)
+                            saved_at = time.time()
+            except OperationFailure as e:
+                if e.code == 40573:
+                    raise RuntimeError("change stream 需要副本集（单节点副本集即可），见 README") from e
+                if e.code in (260, 280, 286):
+                    # InvalidResumeToken / ChangeStreamFatalError / ChangeStreamHistoryLost
+                    logger.error("[ChangeStreamConsumer %s] resume token 已失效，从当前时刻重新开始: %s", self.name, e)
+                    self.reset_token()
+                    token = None
+                    continue
+                logger.exception("[ChangeStreamConsumer %s] change stream 错误，%.0fs 后重试", self.name, backoff)
+            except PyMongoError:
+                logger.exception("[ChangeStreamConsumer %s] change stream 错误，%.0fs 后重试", self.name, backoff)
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def stop(self):
+        self._stop.set()
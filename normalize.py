@@ -0,0 +1,150 @@
+"""
+normalize.py
+
+计数字段的数值化：新抓取的帖子在解析时已把 post_view / comment_num 转成 int（PostParser.parse_count_text），
+这里提供同样规则的 pandas 向量化版本，用于把历史数据中仍是显示文本（"1213"、"1.1万"）的文档批量回填为 int，
+之后按阅读数排序/过滤可以直接走 post_view 索引：
+    db.post_000333.find().sort({post_view: -1}).limit(20)
+
+回填只读取 {字段: {$type: 'string'}} 的文档（_id + 该字段），每批在内存中向量化转换后用无序 bulk_write 写回；
+更新条件带上原值，转换期间爬虫已写入新值的文档不会被覆盖。可重复执行。
+
+运行：python normalize.py                       # 全部股票帖子集合的 post_view 与 comment_num（按 EM_STORAGE_LAYOUT）
+      python normalize.py --symbols 000333 --fields post_view --dry-run
+"""
+
+import os
+import re
+import time
+import logging
+import argparse
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger("normalize")
+
+COUNT_FIELDS = ("post_view", "comment_num")
+_UNITS = (("万", 1e4), ("亿", 1e8))
+# NumPy 2 的 np.strings 是真正逐元素在 C 中执行的字符串 ufunc；旧版本回退到 np.char（接口相同）
+_nps = getattr(np, "strings", np.char)
+_FALLBACK_NUMBER = re.compile(r"(\d[\d,\.]*)")
+
+
+def _fallback_count(text: str) -> int:
+    """与 parse_count_text 的退路相同：取文本中第一个数字（"12次" -> 12），无法解析为 0。"""
+    m = _FALLBACK_NUMBER.search(text)
+    if not m:
+        return 0
+    try:
+        return int(float(m.group(1).replace(",", "")))
+    except ValueError:
+        return 0
+
+
+def normalize_counts(values) -> pd.Series:
+    """
+    把计数序列转换为 int64，规则同 PostParser.parse_count_text：去掉千位分隔符，
+    "1213" / "1.1万" / "3.5亿" 这类规整文本在 NumPy 中整体转换（乘以倍数后截断小数），
+    其余少数不规整的文本（"12次"）逐个按退路规则取第一个数字；已是数值的元素取整，无法解析的为 0。
+    """
+    s = pd.Series(values, copy=False)
+    obj = s.to_numpy(dtype=object)
+    is_text = np.fromiter((type(v) is str for v in obj), dtype=bool, count=len(obj))
+    out = np.zeros(len(obj), dtype="float64")
+    if not is_text.all():
+        out[~is_text] = pd.to_numeric(pd.Series(obj[~is_text]), errors="coerce").to_numpy(dtype="float64",
+                                                                                          na_value=np.nan)
+    if is_text.any():
+        raw = obj[is_text]
+        text = _nps.replace(_nps.strip(np.asarray(raw, dtype=str)), ",", "")
+        mult = np.ones(len(text))
+        for unit, factor in _UNITS:
+            mult[_nps.endswith(text, unit)] = factor
+        text = _nps.strip(_nps.rstrip(text, "".join(u for u, _ in _UNITS)))
+        # 至多一个小数点的纯数字才走整体转换
+        regular = _nps.isdecimal(_nps.replace(text, ".", "", 1))
+        num = np.zeros(len(text))
+        # 逐元素 float() 比 NumPy 的 U -> float64 astype 更快
+        num[regular] = np.fromiter(map(float, text[regular].tolist()), dtype="float64", count=int(regular.sum()))
+        irregular = np.flatnonzero(~regular)
+        mult[irregular] = 1.0
+        for i in irregular:
+            num[i] = _fallback_count(raw[i].replace(",", ""))
+        out[is_text] = num * mult
+    return pd.Series(np.trunc(np.nan_to_num(out, nan=0.0)).astype("int64"), index=s.index)
+
+
+def normalize_collection(coll, fields: Iterable[str] = COUNT_FIELDS, query: Optional[dict] = None,
+                         batch_size: int = 5000, dry_run: bool = False) -> dict:
+    """把 coll（可用 query 限定范围）中 fields 里仍为字符串的值回填为 int，返回各字段的修改条数。"""
+    summary = {}
+    for field in fields:
+        flt = dict(query or {}, **{field: {"$type": "string"}})
+        t0 = time.time()
+        modified = seen = 0
+        cursor = coll.find(flt, {"_id": 1, field: 1}, batch_size=batch_size)
+        while True:
+            batch = []
+            for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    break
+            if not batch:
+                break
+            seen += len(batch)
+            ids = [d["_id"] for d in batch]
+            raw = [d.get(field) for d in batch]
+            converted = normalize_counts(raw).tolist()
+            if not dry_run:
+                ops = [UpdateOne({"_id": _id, field: old}, {"$set": {field: new}})
+                       for _id, old, new in zip(ids, raw, converted)]
+                try:
+                    modified += coll.bulk_write(ops, ordered=False).modified_count
+                except BulkWriteError as bwe:
+                    det = bwe.details or {}
+                    modified += det.get("nModified", 0)
+                    logger.warning("[%s] %s bulk_write 部分失败: %s", coll.name, field, det.get("writeErrors", [])[:1])
+            logger.info("[%s] %s: %d 条已处理 (%.0f docs/s)", coll.name, field, seen,
+                        seen / max(time.time() - t0, 1e-6))
+        summary[field] = seen if dry_run else modified
+        logger.info("[%s] %s: %s %d 条", coll.name, field, "需要转换" if dry_run else "已转换", summary[field])
+    return summary
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="把 post_view / comment_num 的显示文本批量回填为 int")
+    ap.add_argument("--uri", default=os.environ.get("MONGO_URI") or "mongodb://localhost:27017")
+    ap.add_argument("--layout", choices=["per_symbol", "unified"], default=None,
+                    help="存储布局（默认取 EM_STORAGE_LAYOUT）")
+    ap.add_argument("--symbols", nargs="*", default=None, help="只处理这些股票（默认全部）")
+    ap.add_argument("--fields", nargs="+", default=list(COUNT_FIELDS), choices=COUNT_FIELDS)
+    ap.add_argument("--batch-size", type=int, default=5000)
+    ap.add_argument("--dry-run", action="store_true", help="只统计需要转换的文档数")
+    args = ap.parse_args()
+
+    from mongodb import KIND_COLLECTIONS, MongoAPI, storage_layout
+    from migrate_to_unified import source_collections
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    db_name, prefix, unified = KIND_COLLECTIONS["post"]
+    db = client[db_name]
+    if storage_layout(args.layout) == "unified":
+        targets = [(unified, {"symbol": {"$in": args.symbols}} if args.symbols else None)]
+    else:
+        targets = [(name, None)
+                   for _, name in source_collections(db, prefix, set(args.symbols) if args.symbols else None)]
+    for name, query in targets:
+        if not args.dry_run:
+            # 确保 post_view 排序索引存在（与 MongoAPI.for_symbol 创建的索引一致）
+            MongoAPI(db_name, name, client=client).ensure_indexes()
+        normalize_collection(db[name], args.fields, query=query, batch_size=args.batch_size, dry_run=args.dry_run)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
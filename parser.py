@@ -1,8 +1,19 @@
 ﻿from selenium.webdriver.common.by import By
 from selenium import webdriver
 from datetime import datetime
+import json
+import os
 import re
 
+from records import PostRecord, CommentRecord, to_timestamp
+
+DEFAULT_BASE_URL = "https://guba.eastmoney.com"
+
+
+def guba_base_url():
+    """股吧站点根地址；可用 GUBA_BASE_URL 指向本地 mock（见 mock_guba.py）。"""
+    return (os.environ.get("GUBA_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+
 
 class PostParser(object):
 
@@ -29,16 +40,16 @@ class PostParser(object):
 
     @staticmethod
     def parse_post_view(html):
-        # 阅读数通常在第一列的 div.read
+        # 阅读数通常在第一列的 div.read；与评论数一样解析为 int（"1.1万" -> 11000），便于在 Mongo 中排序/过滤
         try:
             view_element = html.find_element(By.CSS_SELECTOR, 'td:nth-child(1) div.read')
-            return view_element.text.strip()
+            return PostParser.parse_count_text(view_element.text)
         except Exception:
             try:
                 view_element = html.find_element(By.CSS_SELECTOR, 'td:nth-child(1) > div')
-                return view_element.text.strip()
+                return PostParser.parse_count_text(view_element.text)
             except Exception:
-                return ""
+                return 0
 
     @staticmethod
     def parse_comment_num(html):
@@ -50,7 +61,15 @@ class PostParser(object):
             text = (num_element.text or "").strip()
         except Exception:
             return 0
+        return PostParser.parse_count_text(text)
 
+    @staticmethod
+    def parse_count_text(text):
+        """
+        把页面上的计数文本（"1213"、"1,213"、"1.2万"、"1.1亿"）解析为 int，无法解析时返回 0。
+        批量回填已有数据时用 normalize.normalize_counts（同样规则的向量化版本）。
+        """
+        text = (text or "").strip()
         if not text:
             return 0
 
@@ -64,11 +83,14 @@ class PostParser(object):
             except Exception:
                 return 0
 
-        # 以 '万' 结尾的情况（如 1.2万）
+        # 以 '万' / '亿' 结尾的情况（如 1.2万）
         try:
             if cleaned.endswith("万"):
                 num_part = cleaned[:-1].strip()
                 return int(float(num_part.replace(",", "")) * 10000)
+            if cleaned.endswith("亿"):
+                num_part = cleaned[:-1].strip()
+                return int(float(num_part.replace(",", "")) * 100000000)
         except Exception:
             pass
 
@@ -97,10 +119,14 @@ class PostParser(object):
             except Exception:
                 href = ""
 
-        href = href.strip()
+        return PostParser.normalize_post_url(href)
+
+    @staticmethod
+    def normalize_post_url(href):
+        href = (href or "").strip()
         # 有些 href 是相对路径 "/news,000333,xxxx.html"
         if href.startswith("/"):
-            return "https://guba.eastmoney.com" + href
+            return guba_base_url() + href
         return href
 
     @staticmethod
@@ -144,6 +170,10 @@ class PostParser(object):
             except Exception:
                 continue
 
+        return self._date_from_text(time_str, lambda: self.judge_post_date(html))
+
+    def _date_from_text(self, time_str, judge):
+        """把 "MM-DD HH:MM" 补全年份；judge() 为 False（问董秘帖）时不参与跨年推断。"""
         if not time_str:
             return None, None
 
@@ -154,14 +184,14 @@ class PostParser(object):
         except Exception:
             return None, None
 
-        if self.judge_post_date(html):
+        if judge():
             if self.month < month == 12:
                 if self.year is not None:
                     self.year -= 1
             self.month = month
 
         if self.year is None:
-            self.get_post_year(html)
+            self.get_post_year(None)
 
         date = f'{self.year}-{month:02d}-{day:02d}'
         time_val = time_part[:5]
@@ -188,18 +218,111 @@ class PostParser(object):
         url = self.parse_post_url(html)
         date, time = self.parse_post_date(html)
         author = self.parse_post_author(html)
-        post_info = {
-            '_id': self.id,
-            'post_title': title,
-            'post_view': view,
-            'comment_num': num,
-            'post_url': url,
-            'post_date': date,
-            'post_time': time,
-            'post_author': author
-        }
+        post_info = PostRecord(
+            _id=self.id,
+            post_title=title,
+            post_view=view,
+            comment_num=num,
+            post_url=url,
+            post_date=date,
+            post_time=time,
+            post_author=author,
+            post_ts=to_timestamp(date, time),
+        )
         return post_info
 
+    def parse_post_row(self, row):
+        """
+        解析 LIST_ROWS_JS 在页面内一次性提取出的行数据（dict），输出与 parse_post_info 相同的字段。
+        用于不提供 WebElement 的 cdp 后端，也省去每个字段一次 find_element 往返。
+        """
+        self.id += 1
+        date, time = self._date_from_text((row.get('time') or "").strip(), lambda: not row.get('dongmi'))
+        post_info = PostRecord(
+            _id=self.id,
+            post_title=(row.get('title') or "").strip(),
+            post_view=self.parse_count_text(row.get('view')),
+            comment_num=self.parse_count_text(row.get('comments')),
+            post_url=self.normalize_post_url(row.get('href')),
+            post_date=date,
+            post_time=time,
+            post_author=(row.get('author') or "").strip(),
+            post_ts=to_timestamp(date, time),
+        )
+        return post_info
+
+    @staticmethod
+    def extract_article_list(html_text):
+        """从列表页 HTML 中取出内嵌的 `var article_list = {...};` JSON，找不到时返回 None。"""
+        m = re.search(r'article_list\s*=\s*\{', html_text or "")
+        if not m:
+            return None
+        try:
+            data, _ = json.JSONDecoder().raw_decode(html_text, m.end() - 1)
+            return data
+        except ValueError:
+            return None
+
+    def parse_article_list(self, data, symbol=None):
+        """
+        解析列表页内嵌的 article_list（dict，或整页 HTML 文本）中的帖子，输出与 parse_post_info 相同的字段。
+        只需一次 HTTP 请求或一次 execute_script，不依赖 DOM 行结构。
+        """
+        if isinstance(data, str):
+            data = self.extract_article_list(data)
+        docs = []
+        for item in (data or {}).get('re') or []:
+            post_id = item.get('post_id')
+            code = item.get('stockbar_code') or symbol
+            if not post_id or not code:
+                continue
+            self.id += 1
+            published = (item.get('post_publish_time') or "").strip()
+            date, _, clock = published.partition(' ')
+            docs.append(PostRecord(
+                _id=self.id,
+                post_title=(item.get('post_title') or "").strip(),
+                post_view=self.parse_count_text(str(item.get('post_click_count') or 0)),
+                comment_num=self.parse_count_text(str(item.get('post_comment_count') or 0)),
+                post_url=f"{guba_base_url()}/news,{code},{post_id}.html",
+                post_date=date or None,
+                post_time=clock[:5] or None,
+                post_author=(item.get('user_nickname') or "").strip(),
+                post_ts=to_timestamp(date, clock),
+            ))
+        return docs
+
+
+# 在页面内一次提取全部帖子行，字段与 PostParser 各 parse_* 使用的选择器一一对应
+LIST_ROWS_JS = """
+function txt(root, sel) {
+    var el = root.querySelector(sel);
+    return el ? (el.innerText || el.textContent || '').trim() : '';
+}
+var rows = Array.from(document.querySelectorAll('tr.listitem'));
+if (!rows.length) {
+    rows = Array.from(document.querySelectorAll('div.table_list tr'))
+        .filter(function (tr) { return tr.querySelector('td:nth-child(3) a'); });
+}
+var timeSelectors = ['td:nth-child(5) > div', 'td:nth-child(5) > div.update',
+                     'td:nth-child(5) > div.update.mod_time', 'div.update.pub_time', 'div.update.mod_time'];
+return rows.map(function (tr) {
+    var a = tr.querySelector('td:nth-child(3) > div > a') || tr.querySelector('td:nth-child(3) a');
+    var time = '';
+    for (var i = 0; i < timeSelectors.length && !time; i++) { time = txt(tr, timeSelectors[i]); }
+    var author = tr.querySelector('td:nth-child(4) > div a.nametext');
+    return {
+        title: txt(tr, 'td:nth-child(3) a') || txt(tr, 'td:nth-child(3) > div'),
+        href: a ? a.href : '',
+        view: txt(tr, 'td:nth-child(1) div.read') || txt(tr, 'td:nth-child(1) > div'),
+        comments: txt(tr, 'td:nth-child(2) > div'),
+        time: time,
+        author: author ? (author.innerText || '').trim() : txt(tr, 'td:nth-child(4) > div'),
+        dongmi: txt(tr, 'td:nth-child(3) > div > span') === '问董秘'
+    };
+});
+"""
+
 
 class CommentParser(object):
 
@@ -242,17 +365,98 @@ class CommentParser(object):
         time = date_str.split(' ')[1][:5]
         return date, time
 
+    @staticmethod
+    def _split_pubtime(date_str):
+        parts = (date_str or "").strip().split(' ')
+        date = parts[0] if parts and parts[0] else None
+        time = parts[1][:5] if len(parts) > 1 else None
+        return date, time
+
+    @staticmethod
+    def _like_from_text(text):
+        text = (text or "").strip()
+        if not text or text == '点赞':  # website display text instead of '0'
+            return 0
+        try:
+            return int(text)
+        except Exception:
+            return 0
+
+    def parse_comment_tree(self, driver, post_id):
+        """
+        一次 execute_script 取回整页回复树（一级回复 + ul.replyListL2 子回复），展开为评论字典列表。
+        在 parse_comment_info 的字段之外增加 comment_id 与 parent_id（一级回复的 parent_id 为 None）。
+        """
+        tree = driver.execute_script(COMMENT_TREE_JS) or []
+        return self.flatten_comment_tree(tree, post_id)
+
+    def flatten_comment_tree(self, tree, post_id):
+        docs = []
+        for i, node in enumerate(tree):
+            cid = node.get('id') or f"p{i}"
+            docs.append(self._tree_node_doc(node, post_id, cid, None))
+            for j, sub in enumerate(node.get('subs') or []):
+                docs.append(self._tree_node_doc(sub, post_id, sub.get('id') or f"{cid}-{j}", cid))
+        return docs
+
+    def _tree_node_doc(self, node, post_id, comment_id, parent_id):
+        date, time = self._split_pubtime(node.get('time'))
+        return CommentRecord(
+            post_id=post_id,
+            comment_id=str(comment_id),
+            parent_id=str(parent_id) if parent_id is not None else None,
+            comment_content=node.get('content') or "",
+            comment_like=self._like_from_text(node.get('like')),
+            comment_date=date,
+            comment_time=time,
+            sub_comment=int(parent_id is not None),
+            comment_ts=to_timestamp(date, time),
+        )
+
     def parse_comment_info(self, html, post_id, sub_bool: bool = False):  # sub_pool is used to distinguish sub-comments
         content = self.parse_comment_content(html, sub_bool)
         like = self.parse_comment_like(html, sub_bool)
         date, time = self.parse_comment_date(html, sub_bool)
         whether_subcomment = int(sub_bool)  # '1' means it is sub-comment, '0' means it is not
-        comment_info = {
-            'post_id': post_id,
-            'comment_content': content,
-            'comment_like': like,
-            'comment_date': date,
-            'comment_time': time,
-            'sub_comment': whether_subcomment,
-        }
+        comment_info = CommentRecord(
+            post_id=post_id,
+            comment_content=content,
+            comment_like=like,
+            comment_date=date,
+            comment_time=time,
+            sub_comment=whether_subcomment,
+            comment_ts=to_timestamp(date, time),
+        )
         return comment_info
+
+
+# 在帖子页内一次性提取回复树：选择器与 CommentParser 的 parse_* 方法一致，
+# 子回复取自各一级回复下的 ul.replyListL2 > li
+COMMENT_TREE_JS = """
+function txt(root, sel) {
+    var el = root.querySelector(sel);
+    return el ? (el.innerText || el.textContent || '').trim() : '';
+}
+function rid(el) {
+    var holder = el.matches('[data-replyid]') ? el : el.querySelector('[data-replyid]');
+    return holder ? holder.getAttribute('data-replyid') : null;
+}
+return Array.from(document.querySelectorAll('div.replyList')).map(function (item) {
+    var subs = Array.from(item.querySelectorAll('ul.replyListL2 > li')).map(function (li) {
+        return {
+            id: rid(li),
+            content: txt(li, 'div.reply_title > span'),
+            like: txt(li, 'span.likemodule'),
+            time: txt(li, 'span.pubtime')
+        };
+    });
+    var main = item.querySelector('div.recont_right.fl') || item;
+    return {
+        id: main.getAttribute('data-replyid') || item.getAttribute('data-replyid'),
+        content: txt(item, 'div.recont_right.fl > div.reply_title > span'),
+        like: txt(item, 'ul.bottomright > li:nth-child(4) > span'),
+        time: txt(item, 'div.publishtime > span.pubtime'),
+        subs: subs
+    };
+});
+"""
@@ -0,0 +1,257 @@
+"""
+process_runner.py
+
+多进程抓取调度：每个 worker 进程拥有自己的 WebDriverManager 与 MongoClient/MongoAPI，
+从父进程维护的任务队列依次领取 (symbol, page) 任务，解析、JSON/BSON 编解码与日志都在各自进程里执行，不再共享一个 GIL。
+父进程负责汇总结果与指标；worker 异常退出时自动补起新进程，并把其未完成的任务放回队列。
+父进程逐个把任务投递到空闲 worker 的 inbox，因此总能知道崩溃的 worker 手上是哪个任务。
+
+示例：python process_runner.py --symbols 000333 000729 --start 1 --end 20 --workers 4 --headless
+"""
+
+import os
+import time
+import queue
+import collections
+import logging
+import argparse
+import multiprocessing as mp
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("process_runner")
+
+Task = Tuple[str, int]
+
+# 父进程检查 worker 存活的间隔（秒）
+REAP_INTERVAL_S = 1.0
+
+
+def _worker_main(worker_id: int, inbox, result_q, headless: bool):
+    """worker 进程入口：复用一个浏览器与一个 MongoClient 处理任务，直到收到 None。"""
+    # 每个进程写自己的轮转文件，避免多进程同时轮转同一个 crawler.log
+    from log_setup import setup_logging
+    setup_logging(f"crawler.worker{worker_id}.log")
+    # 在子进程内导入，避免父进程加载 selenium 等重依赖
+    from pymongo import MongoClient
+    from crawler import WebDriverManager, PostCrawler
+    from mongodb import MongoAPI
+
+    wdm = WebDriverManager(headless=headless)
+    client = None
+    crawlers: Dict[str, PostCrawler] = {}
+    try:
+        while True:
+            task = inbox.get()
+            if task is None:
+                break
+            symbol, page = task
+            t0 = time.time()
+            try:
+                if client is None:
+                    client = MongoClient(os.environ.get("MONGO_URI") or "mongodb://localhost:27017",
+                                         serverSelectionTimeoutMS=3000)
+                crawler = crawlers.get(symbol)
+                if crawler is None:
+                    mongo = MongoAPI.for_symbol("post", symbol, client=client)
+                    crawler = PostCrawler(symbol, headless=headless, wdm=wdm, mongo=mongo)
+                    crawlers[symbol] = crawler
+                # 同一 worker 的各 crawler 共享 wdm，其它 crawler 可能已重启过 driver
+                crawler.driver = wdm.driver or crawler.driver
+                if crawler.driver is None:
+                    crawler.driver, crawler.profile = wdm.create_driver()
+                res = crawler.crawl_page(page)
+                res.update(ok=True, elapsed=time.time() - t0)
+            except Exception as e:
+                logger.exception("[worker %d] %s page %d failed", worker_id, symbol, page)
+                res = {'page': page, 'ok': False, 'error': str(e), 'elapsed': time.time() - t0}
+            result_q.put((worker_id, task, res))
+    finally:
+        try:
+            wdm.quit_driver()
+        except Exception:
+            pass
+        if client is not None:
+            client.close()
+
+
+class ProcessPoolRunner:
+    """父进程侧：分发任务、汇总指标、监控并重启崩溃的 worker。"""
+
+    def __init__(self, workers: Optional[int] = None, headless: bool = True, max_task_attempts: int = 2):
+        self.workers = workers or os.cpu_count() or 1
+        self.headless = headless
+        self.max_task_attempts = max_task_attempts
+        self._ctx = mp.get_context("spawn")
+        self._result_q = None
+        self._pending = collections.deque()
+        self._procs: Dict[int, mp.Process] = {}
+        self._inboxes: Dict[int, object] = {}
+        self._in_flight: Dict[int, Task] = {}
+        self._attempts: Dict[Task, int] = {}
+        # 已计入结果的任务：worker 写出结果后崩溃时任务会被重新入队，之后再到达的同一任务结果只计一次
+        self._completed = set()
+
+    def _spawn(self, worker_id: int):
+        inbox = self._ctx.Queue()
+        p = self._ctx.Process(target=_worker_main, name=f"crawl-worker-{worker_id}",
+                              args=(worker_id, inbox, self._result_q, self.headless), daemon=True)
+        p.start()
+        self._procs[worker_id] = p
+        self._inboxes[worker_id] = inbox
+        logger.info("[runner] started worker %d (pid=%s)", worker_id, p.pid)
+
+    def _dispatch(self):
+        for wid in self._procs:
+            if wid in self._in_flight or not self._pending:
+                continue
+            task = self._pending.popleft()
+            self._in_flight[wid] = task
+            self._inboxes[wid].put(task)
+
+    def _reap_dead_workers(self, metrics: dict) -> int:
+        """检查 worker 存活情况：死掉的 worker 补起新进程，其在途任务重新入队或记为失败。返回记为失败的任务数。"""
+        failed = 0
+        for wid, p in list(self._procs.items()):
+            if p.is_alive():
+                continue
+            logger.warning("[runner] worker %d exited unexpectedly (exitcode=%s), restarting", wid, p.exitcode)
+            metrics['worker_restarts'] += 1
+            task = self._in_flight.pop(wid, None)
+            if task is not None:
+                self._attempts[task] = self._attempts.get(task, 0) + 1
+                if self._attempts[task] < self.max_task_attempts:
+                    self._pending.appendleft(task)
+                else:
+                    logger.error("[runner] task %s abandoned after %d crashes", task, self._attempts[task])
+                    self._record(metrics, task, {'ok': False, 'error': 'worker crashed', 'elapsed': 0.0})
+                    self._completed.add(task)
+                    failed += 1
+            self._spawn(wid)
+        return failed
+
+    def _prune_past_end(self, task: Task, res: dict, metrics: dict) -> int:
+        """根据 worker 报告的总页数/空页，丢弃该 symbol 中超出列表末尾的待办任务。返回丢弃数。"""
+        symbol, page = task
+        if not res.get('ok'):
+            return 0
+        if res.get('rows') == 0:
+            last = page - 1
+        elif res.get('total_pages'):
+            last = res['total_pages']
+        else:
+            return 0
+        keep = [t for t in self._pending if not (t[0] == symbol and t[1] > last)]
+        dropped = len(self._pending) - len(keep)
+        if dropped:
+            self._pending = collections.deque(keep)
+            metrics['skipped_past_end'] += dropped
+            logger.info("[runner] %s ends at page %d, skipped %d pending pages", symbol, last, dropped)
+        return dropped
+
+    @staticmethod
+    def _record(metrics: dict, task: Task, res: dict):
+        symbol = task[0]
+        sym = metrics['symbols'].setdefault(symbol, {'pages': 0, 'errors': 0, 'docs': 0, 'upserted': 0, 'modified': 0})
+        if res.get('ok'):
+            sym['pages'] += 1
+            for k in ('docs', 'upserted', 'modified'):
+                sym[k] += res.get(k, 0)
+        else:
+            sym['errors'] += 1
+            metrics['errors'].append({'symbol': symbol, 'page': task[1], 'error': res.get('error')})
+        metrics['task_seconds'] += res.get('elapsed', 0.0)
+
+    def run(self, tasks: Iterable[Task]) -> dict:
+        tasks = list(tasks)
+        metrics = {'tasks': len(tasks), 'workers': self.workers, 'worker_restarts': 0, 'skipped_past_end': 0,
+                   'task_seconds': 0.0, 'symbols': {}, 'errors': []}
+        if not tasks:
+            return metrics
+
+        self._result_q = self._ctx.Queue()
+        self._pending.extend(tasks)
+
+        t0 = time.time()
+        for wid in range(min(self.workers, len(tasks))):
+            self._spawn(wid)
+
+        remaining = len(tasks)
+        # 每秒检查一次 worker 存活（不论结果队列是否空闲），崩溃 worker 的在途任务及时重新入队
+        next_reap = time.monotonic() + REAP_INTERVAL_S
+        try:
+            while remaining > 0:
+                if time.monotonic() >= next_reap:
+                    remaining -= self._reap_dead_workers(metrics)
+                    next_reap = time.monotonic() + REAP_INTERVAL_S
+                    if remaining <= 0:
+                        break
+                self._dispatch()
+                try:
+                    wid, task, res = self._result_q.get(timeout=REAP_INTERVAL_S)
+                except queue.Empty:
+                    continue
+                task = tuple(task)
+                if self._in_flight.get(wid) == task:
+                    self._in_flight.pop(wid)
+                if task in self._completed:
+                    logger.info("[runner] duplicate result for %s page %d ignored", task[0], task[1])
+                    continue
+                self._completed.add(task)
+                if task in self._pending:
+                    # 结果来自已崩溃的 worker，任务已重新入队但尚未派发
+                    self._pending.remove(task)
+                self._record(metrics, task, res)
+                remaining -= 1
+                remaining -= self._prune_past_end(task, res, metrics)
+                logger.info("[runner] %s page %d ok=%s (%.1fs), %d remaining",
+                            task[0], task[1], res.get('ok'), res.get('elapsed', 0.0), remaining)
+        finally:
+            for inbox in self._inboxes.values():
+                inbox.put(None)
+            for p in self._procs.values():
+                p.join(timeout=30)
+                if p.is_alive():
+                    p.terminate()
+
+        wall = time.time() - t0
+        metrics['wall_seconds'] = wall
+        done_pages = sum(s['pages'] for s in metrics['symbols'].values())
+        metrics['pages_per_sec'] = done_pages / wall if wall > 0 else 0.0
+        return metrics
+
+
+def build_tasks(symbols: List[str], start_page: int, end_page: int) -> List[Task]:
+    """按页交错各 symbol 的任务，使 worker 尽早覆盖所有 symbol。"""
+    return [(s, p) for p in range(start_page, end_page + 1) for s in symbols]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(processName)s - %(message)s")
+    ap = argparse.ArgumentParser(description="Multiprocess PostCrawler runner")
+    ap.add_argument("--symbols", nargs="+", default=["000333"], help="股票代码列表")
+    ap.add_argument("--start", type=int, default=1, help="起始页（包含）")
+    ap.add_argument("--end", type=int, default=10, help="结束页（包含）")
+    ap.add_argument("--workers", type=int, default=None, help="worker 进程数（默认 CPU 核数）")
+    ap.add_argument("--headless", action="store_true", help="是否使用 headless 模式")
+    ap.add_argument("--max-task-attempts", type=int, default=2, help="worker 崩溃时单个任务最多尝试次数")
+    args = ap.parse_args()
+
+    try:
+        from crawler import sweep_leaked_resources
+        sweep_leaked_resources()
+    except Exception as e:
+        logger.debug("sweep_leaked_resources 失败: %s", e)
+
+    runner = ProcessPoolRunner(workers=args.workers, headless=args.headless, max_task_attempts=args.max_task_attempts)
+    metrics = runner.run(build_tasks(args.symbols, args.start, args.end))
+    logger.info("抓取结束: %d tasks, %.1f pages/s, wall %.1fs, task time %.1fs, worker restarts %d",
+                metrics['tasks'], metrics.get('pages_per_sec', 0.0), metrics.get('wall_seconds', 0.0),
+                metrics['task_seconds'], metrics['worker_restarts'])
+    for symbol, sym in metrics['symbols'].items():
+        logger.info("  %s: %s", symbol, sym)
+    if metrics['errors']:
+        logger.info("错误样本: %s", metrics['errors'][:10])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+records.py
+
+帖子 / 评论的紧凑记录类型：用 __slots__ 代替每行一个 dict，单条记录的内存约为同字段 dict 的三分之一，
+大批量回填与写缓冲时分配的对象也少得多。
+记录提供 dict 风格的读写接口（get / [] / in / pop / keys / items），解析器、批内去重、change listener
+等代码无需区分记录与 dict；只有在写入 Mongo 的边界（MongoAPI.insert_many / upsert_many）才通过
+to_dict() / as_dict() 转成 dict 交给 pymongo 编码为 BSON。
+
+未赋值的字段视为不存在：不会出现在 keys() / to_dict() 中，`'comment_id' in rec` 为 False，
+与 dict 中缺少该键的行为一致。只能读写类中声明的字段，写入未声明的字段会抛出 KeyError。
+"""
+
+from datetime import datetime
+from typing import Iterable, Optional
+
+_UNSET = object()
+
+
+class Record(object):
+    """记录基类；子类在 __slots__ 中声明字段（顺序即 to_dict 的键顺序）。"""
+
+    __slots__ = ()
+    _fields = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(cls.__slots__)
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, _UNSET))
+        if fields:
+            raise TypeError(f"{type(self).__name__} got unknown fields: {sorted(fields)}")
+
+    @classmethod
+    def from_dict(cls, doc: dict):
+        """从 dict 构造记录；未声明的键被忽略。"""
+        rec = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(rec, name, doc.get(name, _UNSET))
+        return rec
+
+    # ---- dict 风格接口 ----
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            value = getattr(self, key)
+            if value is not _UNSET:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(f"{type(self).__name__} has no field {key!r}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        self[key]  # 不存在时抛出 KeyError
+        setattr(self, key, _UNSET)
+
+    def __contains__(self, key):
+        return key in self._fields and getattr(self, key) is not _UNSET
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            value = getattr(self, key)
+            if value is not _UNSET:
+                return value
+        return default
+
+    def pop(self, key, default=_UNSET):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            if default is _UNSET:
+                raise KeyError(key)
+            return default
+        setattr(self, key, _UNSET)
+        return value
+
+    def keys(self):
+        return [name for name in self.__slots__ if getattr(self, name) is not _UNSET]
+
+    def items(self):
+        return [(name, value) for name, value in ((n, getattr(self, n)) for n in self.__slots__)
+                if value is not _UNSET]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def update(self, other=(), **kwargs):
+        for key, value in (other.items() if hasattr(other, 'items') else other):
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    # ---- 写入边界 ----
+
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> dict:
+        """转成 dict（交给 pymongo）；给出 fields 时只取其中已赋值的字段。"""
+        if fields is None:
+            return dict(self.items())
+        out = {}
+        for name in fields:
+            if name in self._fields:
+                value = getattr(self, name)
+                if value is not _UNSET:
+                    out[name] = value
+        return out
+
+    def copy(self):
+        return type(self).from_dict(self.to_dict())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # _UNSET 不能跨进程保持同一性，按已赋值字段序列化（multiprocessing 传递记录时使用）
+        return type(self).from_dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class PostRecord(Record):
+    """帖子列表中的一行；字段与 PostParser.parse_post_info 一致，post_ts 为 post_date + post_time 合成的 datetime。"""
+
+    __slots__ = ('_id', 'post_title', 'post_view', 'comment_num', 'post_url', 'post_date', 'post_time',
+                 'post_author', 'post_ts')
+
+
+class CommentRecord(Record):
+    """一条评论或子回复；comment_id / parent_id 只有回复树与接口路径会赋值，comment_ts 同 post_ts。"""
+
+    __slots__ = ('post_id', 'comment_id', 'parent_id', 'comment_content', 'comment_like', 'comment_date',
+                 'comment_time', 'sub_comment', 'comment_ts')
+
+
+def as_dict(doc, fields: Optional[Iterable[str]] = None) -> dict:
+    """把记录或 dict 转成 dict；dict 且未给出 fields 时原样返回（不复制）。"""
+    if isinstance(doc, Record):
+        return doc.to_dict(fields)
+    if fields is None:
+        return doc
+    return {k: doc[k] for k in fields if k in doc}
+
+
+def to_timestamp(date, time=None):
+    """
+    把解析出的日期/时间字符串合成 datetime（post_ts / comment_ts），按页面显示的北京时间存为 naive datetime。
+    date 为 'YYYY-MM-DD'（也接受无年份的 'MM-DD'，取不晚于今天的最近一年），time 为 'HH:MM' 或 'HH:MM:SS'；
+    无法解析时返回 None。
+    """
+    if not date:
+        return None
+    try:
+        parts = [int(p) for p in date.strip().split('-')]
+        if len(parts) == 2:
+            today = datetime.now()
+            year = today.year if (parts[0], parts[1]) <= (today.month, today.day) else today.year - 1
+            parts = [year] + parts
+        clock = [int(p) for p in (time or "").strip().split(':') if p][:3]
+        return datetime(*parts, *clock)
+    except (ValueError, TypeError):
+        return None
@@ -70,33 +70,62 @@ def try_call_comment_method(crawler, post):
             # 优先用 list 形式传入单个 URL 或 id（方法通常期望 iterable/list）
             if url:
                 try:
-                    meth([url])
+                    ret = meth([url])
                 except TypeError:
                     # 如果方法接受单个字符串作为参数，也尝试传入字符串
-                    meth(url)
+                    ret = meth(url)
             elif pid is not None:
                 try:
-                    meth([pid])
+                    ret = meth([pid])
                 except TypeError:
-                    meth(pid)
+                    ret = meth(pid)
             else:
                 # 无参数调用
-                meth()
-            return True
+                ret = meth()
+            return _task_result(ret, url or pid)
         except Exception as e:
             logger.exception("调用 %s 失败: %s", name, e)
             # 继续尝试下一个候选
     logger.warning("没有找到或成功调用兼容的评论抓取方法")
-    return False
+    return None
+
+def _task_result(ret, key):
+    """
+    取出 crawl_comment_info 返回的该帖子结果 {'ok', 'fetched', 'inserted'}；
+    方法没有返回逐帖结果时 ok 视为 True，fetched 未知（None）。
+    """
+    if isinstance(ret, dict) and isinstance(ret.get(key), dict):
+        return ret[key]
+    return {'ok': True, 'fetched': None, 'inserted': None}
+
+def run_task(crawler, post, start_page=1, end_page=None):
+    """
+    抓取一个帖子，返回 {'ok', 'fetched', 'inserted'}（没有可调用的抓取方法时为 None）；
+    页区间子任务（comment_planner 拆分的大帖）直接调用 crawl_comment_info 的页参数。
+    """
+    if start_page == 1 and end_page is None:
+        return try_call_comment_method(crawler, post)
+    url = post.get('post_url')
+    return _task_result(crawler.crawl_comment_info([url], start_page=start_page, end_page=end_page), url)
 
 def main():
     parser = argparse.ArgumentParser(description="Run comment crawler on posts from Mongo")
     parser.add_argument("--symbol", default="000333")
     parser.add_argument("--start", type=int, default=0, help="从第 n 条(post 排序) 开始，0 表示第 1 条")
-    parser.add_argument("--limit", type=int, default=5, help="抓取多少条帖子用于测试")
+    parser.add_argument("--limit", type=int, default=5, help="抓取多少条帖子用于测试（<= 0 表示全部）")
     parser.add_argument("--headless", action="store_true")
     parser.add_argument("--state-file", default="run_comments_state.json")
     parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--use-api", action="store_true", help="通过回复 JSON 接口抓取评论（不启动浏览器，含翻页与子回复）")
+    parser.add_argument("--skip-done", action="store_true", help="跳过评论集合中已有评论的帖子（已见集合持久化在 seen_comment_<symbol>.bin）")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="总 worker 数；大于 1 时按估计成本（comment_planner）分配，本进程只处理 --worker-index 那一份")
+    parser.add_argument("--worker-index", type=int, default=0, help="本进程的 worker 序号（0 起）")
+    parser.add_argument("--plan", default=None,
+                        help="计划文件（默认 comment_plan_<symbol>.json）：不存在时按 --workers 生成，存在时各 worker 共用")
+    parser.add_argument("--replan", action="store_true",
+                        help="重新生成并覆盖计划（开始新一轮），进度从头计算；只在一个 worker 上使用，其余在它写完后启动")
+    parser.add_argument("--split-pages", type=int, default=20, help="接口模式下超过此页数的帖子拆分为页区间子任务")
     args = parser.parse_args()
 
     state_path = Path(args.state_file)
@@ -107,42 +136,116 @@ def main():
     logger.info("开始抓取评论 symbol=%s start_index=%d limit=%d headless=%s (resume from %d)",
                 args.symbol, start_index, args.limit, args.headless, last_done)
 
+    # 清理上次被强杀遗留的 chromedriver 进程与临时 profile（API 模式不启动浏览器，无需清理）
+    if not args.use_api:
+        try:
+            from crawler import sweep_leaked_resources
+            sweep_leaked_resources()
+        except Exception as e:
+            logger.debug("sweep_leaked_resources 失败: %s", e)
+
     # connect to Mongo posts
     try:
         from mongodb import MongoAPI
-        m_posts = MongoAPI("post_info", f"post_{args.symbol}")
+        m_posts = MongoAPI.for_symbol("post", args.symbol)
     except Exception as e:
         logger.exception("无法连接到 posts 集合: %s", e)
         return
 
+    planned = args.plan is not None or args.workers > 1
+    from comment_planner import (CostHistory, cost_history_path, estimate_pages, load_plan, make_tasks, pack_tasks,
+                                 plan_path, save_plan)
+    plan_file = args.plan or plan_path(args.symbol)
+    reuse_plan = planned and not args.replan and Path(plan_file).exists()
+
     # fetch target posts
-    posts = m_posts.find({}, projection=None)
-    if not posts:
+    posts = m_posts.find({}) if not reuse_plan else []
+    if not posts and not reuse_plan:
         logger.info("没有找到任何帖子，退出")
         return
 
-    # slice to work set
-    work_posts = posts[start_index:start_index + args.limit]
-    logger.info("将处理 %d 条帖子 (index %d..%d)", len(work_posts), start_index, start_index + len(work_posts) - 1)
+    # 已抓过评论的帖子集合：从评论集合只投影 post_id 加载（或读持久化文件），查询为内存操作
+    done = None
+    m_comments = None
+    done_path = f"seen_comment_{args.symbol}.bin"
+    if args.skip_done:
+        try:
+            from seen_urls import load_comment_done
+            m_comments = MongoAPI.for_symbol("comment", args.symbol)
+            done = load_comment_done(m_comments, args.symbol, path=done_path)
+        except Exception as e:
+            logger.exception("加载已处理帖子集合失败，不跳过: %s", e)
 
-    for idx, post in enumerate(work_posts, start=start_index):
+    # 各帖子的实测耗时，供 comment_planner 拟合成本模型
+    mode = "api" if args.use_api else "browser"
+    history = CostHistory(cost_history_path(args.symbol))
+
+    if planned:
+        # 按成本分配：各 worker 共用同一份计划文件（成本历史会随抓取变化，不能在每个进程里各自重算），
+        # 进度按 "symbol:计划id:w{序号}/{总数}" 单独保存
+        if reuse_plan:
+            bins, meta = load_plan(plan_file)
+            logger.info("使用已有计划 %s (plan_id=%s)", plan_file, meta.get("plan_id"))
+        else:
+            candidates = posts if args.limit <= 0 else posts[args.start:args.start + args.limit]
+            if done is not None:
+                candidates = [p for p in candidates if p.get("post_url") not in done]
+            bins = pack_tasks(make_tasks(candidates, mode, history, split_pages=args.split_pages), args.workers)
+            # 同时启动的 worker 各自算出计划，只有第一个写入成功，其余改用它（--replan 时直接覆盖）
+            meta = save_plan(plan_file, bins, {"symbol": args.symbol, "mode": mode}, exclusive=not args.replan)
+            if meta is None:
+                bins, meta = load_plan(plan_file)
+                logger.info("其它 worker 已写入计划 %s (plan_id=%s)，改用该计划", plan_file, meta.get("plan_id"))
+            else:
+                logger.info("计划已写入 %s (plan_id=%s)", plan_file, meta["plan_id"])
+        if not 0 <= args.worker_index < len(bins):
+            parser.error(f"计划共有 {len(bins)} 个 worker，--worker-index 应在 0..{len(bins) - 1} 之间")
+        state_key = f"{args.symbol}:{meta.get('plan_id')}:w{args.worker_index}/{len(bins)}"
+        start_index = state.get(state_key, -1) + 1
+        work = [({"post_url": t["post_url"], "comment_num": t.get("comment_num")}, t["start_page"], t["end_page"])
+                for t in bins[args.worker_index]][start_index:]
+        logger.info("worker %d/%d: %d 个任务（估计 %.0fs），从第 %d 个开始", args.worker_index, len(bins),
+                    len(bins[args.worker_index]), sum(t["cost"] for t in bins[args.worker_index]), start_index)
+    else:
+        state_key = args.symbol
+        # slice to work set
+        end_index = len(posts) if args.limit <= 0 else start_index + args.limit
+        work = [(post, 1, None) for post in posts[start_index:end_index]]
+        logger.info("将处理 %d 条帖子 (index %d..%d)", len(work), start_index, start_index + len(work) - 1)
+
+    # 进度只推进到连续成功的最后一个任务：之前有任务失败时后续任务的成功不写入进度，重跑时从失败处开始
+    failed = []
+    for idx, (post, start_page, end_page) in enumerate(work, start=start_index):
         page_index = idx
-        logger.info("处理帖子 index=%d, _id=%s, url=%s", page_index, post.get("_id"), post.get("post_url"))
+        whole_post = start_page == 1 and end_page is None
+        if whole_post and done is not None and post.get("post_url") in done:
+            logger.info("跳过已抓过评论的帖子 index=%d, url=%s", page_index, post.get("post_url"))
+            continue
+        logger.info("处理帖子 index=%d, _id=%s, url=%s%s", page_index, post.get("_id"), post.get("post_url"),
+                    "" if whole_post else f" (pages {start_page}..{end_page or 'end'})")
         attempt = 0
         success = False
+        result = None
+        elapsed = None
         while attempt <= args.max_retries and not success:
             attempt += 1
             crawler = None
+            t0 = time.time()
             try:
                 # 动态导入 CommentCrawler
                 from crawler import CommentCrawler
-                crawler = CommentCrawler(args.symbol, headless=args.headless)
-                ok = try_call_comment_method(crawler, post)
-                if not ok:
+                crawler = CommentCrawler(args.symbol, headless=args.headless, use_api=args.use_api)
+                result = run_task(crawler, post, start_page, end_page)
+                if result is None:
                     logger.error("无法调用 CommentCrawler 的兼容方法，跳过此帖子")
                     success = False
                     break
+                if not result.get('ok'):
+                    # crawl_comment_info 内部吞掉了异常（超时、5xx、写入失败），按失败重试
+                    raise RuntimeError(f"comments not stored (fetched={result.get('fetched')}, "
+                                       f"inserted={result.get('inserted')})")
                 success = True
+                elapsed = time.time() - t0
             except Exception as e:
                 logger.exception("page index %d 抓取评论出错 attempt %d: %s", page_index, attempt, e)
                 if attempt <= args.max_retries:
@@ -157,15 +260,47 @@ def main():
                 except Exception:
                     pass
 
+        if not success:
+            failed.append(page_index)
         # 保存进度（若成功）
-        if success:
-            state[args.symbol] = page_index
+        if success and not failed:
+            state[state_key] = page_index
             save_state(state_path, state)
+        # 耗时样本只取成功（抓取与写入都 ok）的那次尝试；fetched 为 None 表示抓取方法没有报告结果，不记录。
+        # 没有评论的帖子也是一次真实的单页请求，照常记录
+        if success and result.get('fetched') is not None:
+            pages = estimate_pages(post.get("comment_num"))
+            if end_page is not None or start_page > 1:
+                pages = (end_page or pages) - start_page + 1
+            history.record(mode, max(pages, 1), elapsed)
+            try:
+                history.save()
+            except OSError as e:
+                logger.warning("保存耗时记录失败: %s", e)
+        # 只有抓取与写入都成功（ok）的帖子才记为已处理：失败时 crawl_comment_info 只记录日志，
+        # 若也记入 seen 文件，--skip-done 会永远跳过它。确认没有评论的帖子另外记录到 Mongo，
+        # 因为 seen 文件从评论集合的 post_id 重建时不会包含它们
+        if success and whole_post and result.get('fetched') == 0:
+            try:
+                if m_comments is None:
+                    m_comments = MongoAPI.for_symbol("comment", args.symbol)
+                m_comments.mark_no_comments([post.get("post_url")])
+            except Exception as e:
+                logger.warning("记录无评论帖子失败: %s", e)
+        if success and whole_post and done is not None:
+            done.add(post.get("post_url"))
+            try:
+                done.save(done_path)
+            except OSError as e:
+                logger.warning("保存 %s 失败: %s", done_path, e)
 
         delay = random.uniform(MIN_DELAY, MAX_DELAY)
         logger.info("帖子 index=%d 处理完 success=%s, 睡眠 %.1fs", page_index, success, delay)
         time.sleep(delay)
 
+    if failed:
+        logger.error("%d 个任务失败 (index %s)，进度停在 %d，重新运行会从 index %d 开始", len(failed),
+                     failed[:20], failed[0] - 1, failed[0])
     logger.info("评论抓取任务完成")
 
 if __name__ == "__main__":
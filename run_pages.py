@@ -71,6 +71,13 @@ def main():
     parser.add_argument("--headless", action="store_true", help="是否使用 headless 模式")
     parser.add_argument("--state-file", default="run_pages_state.json", help="保存进度的文件")
     parser.add_argument("--max-retries", type=int, default=2, help="每页失败后重试次数（不含首次尝试）")
+    parser.add_argument("--no-standby", action="store_true",
+                        help="不预启动备用浏览器（省一个 Chrome 的内存，但每页都要等待浏览器启动）")
+    parser.add_argument("--disk-cache-dir", default=None,
+                        help="浏览器共享磁盘缓存目录（默认取 CHROME_DISK_CACHE_DIR）；每页的新浏览器复用已缓存的 JS/CSS/字体")
+    parser.add_argument("--disk-cache-size", type=float, default=None, help="每个缓存槽位的上限（MB，默认 256）")
+    parser.add_argument("--profile-template", default=None,
+                        help="模板 profile 目录（默认取 CHROME_PROFILE_TEMPLATE），每个新浏览器先复制一份")
     args = parser.parse_args()
 
     state_path = Path(args.state_file)
@@ -83,28 +90,38 @@ def main():
 
     # 运行 crawler
     try:
-        from crawler import PostCrawler
+        from crawler import PostCrawler, WebDriverManager, sweep_leaked_resources
     except Exception as e:
         logger.exception("无法导入 PostCrawler: %s", e)
         return
 
-    # 初始 prev_total 通过一次临时连接获取（安全）
+    # 清理上次被强杀遗留的 chromedriver 进程与临时 profile
+    sweep_leaked_resources()
+
+    # 所有页共用一个 WebDriverManager：每次尝试换一个全新的浏览器，
+    # standby 模式下新浏览器在上一页抓取期间已于后台启动好，换用几乎不耗时
+    wdm = WebDriverManager(headless=args.headless, standby=False if args.no_standby else True,
+                           disk_cache_dir=args.disk_cache_dir, disk_cache_size_mb=args.disk_cache_size,
+                           profile_template=args.profile_template)
+
+    # 初始 prev_total 直接用 MongoAPI 读取：不构建 PostCrawler，不会为此启动浏览器
     prev_total = None
+    m_posts = None
     try:
-        tmp = PostCrawler(args.symbol, headless=args.headless)
-        try:
-            prev_total = tmp.mongo.count_documents()
-        except Exception:
-            prev_total = None
-        safe_quit_crawler(tmp)
+        from mongodb import MongoAPI
+        m_posts = MongoAPI.for_symbol("post", args.symbol)
+        prev_total = m_posts.count_documents()
     except Exception:
-        prev_total = None
+        logger.exception("读取 Mongo 总量失败")
 
     inserted_total = 0
     modified_total = 0
     errors = []
 
-    for page in range(start_page, args.end + 1):
+    end_page = args.end
+    reached_end = False
+    page = start_page
+    while page <= end_page:
         logger.info("开始抓取 page %d ...", page)
         attempt = 0
         success = False
@@ -113,10 +130,21 @@ def main():
             crawler = None
             t0 = time.time()
             try:
-                crawler = PostCrawler(args.symbol, headless=args.headless)
-                # 单页抓取
-                crawler.crawl_post_info(start_page=page, end_page=page)
+                # 换上新浏览器（首次则直接启动）；crawler 不拥有 wdm，不会在结束时退出它
+                if wdm.driver is None:
+                    wdm.create_driver()
+                else:
+                    wdm.restart_driver()
+                crawler = PostCrawler(args.symbol, headless=args.headless, wdm=wdm)
+                # 单页抓取（异常向上抛出，由本循环重试）
+                res = crawler.crawl_page(page)
                 success = True
+                if res['rows'] == 0:
+                    logger.info("page %d 为空页，已到列表末尾", page)
+                    reached_end = True
+                elif res.get('total_pages') and end_page > res['total_pages']:
+                    logger.info("总页数 %d，结束页 %d -> %d", res['total_pages'], end_page, res['total_pages'])
+                    end_page = res['total_pages']
             except Exception as e:
                 # 记录并决定是否重试
                 logger.exception("[retry] page %d attempt %d 发生异常: %s", page, attempt, e)
@@ -128,11 +156,16 @@ def main():
                     logger.error("[PostCrawler %s] page %d 最终失败: %s", args.symbol, page, e)
                     errors.append({"page": page, "error": str(e)})
             finally:
-                # 尝试关闭该次创建的 crawler，释放 chromedriver
-                try:
-                    safe_quit_crawler(crawler)
-                except Exception:
-                    pass
+                # 浏览器由 wdm 统一管理，下一次尝试会换新的；这里只在出错时释放当前浏览器
+                if not success:
+                    try:
+                        wdm.quit_driver(include_standby=False)
+                    except Exception:
+                        pass
+
+        # 空页说明已越过列表末尾：不推进进度，也无需再等待
+        if reached_end:
+            break
 
         # 每页结束后的固定短延迟，避免请求节奏太规律
         delay = random.uniform(MIN_DELAY, MAX_DELAY)
@@ -141,11 +174,11 @@ def main():
 
         # 更新并记录 Mongo 总数，用于估算本页写入
         try:
-            # 重新创建一个轻量 PostCrawler 仅用于 mongo 访问，或直接用一个 MongoAPI 实例
-            # 这里直接导入 mongodb 并创建 MongoAPI 保证不启动 webdriver
-            from mongodb import MongoAPI
-            m = MongoAPI("post_info", f"post_{args.symbol}")
-            cur_total = m.count_documents()
+            # 复用开始时创建的 MongoAPI（不启动 webdriver）；开始时连接失败则在这里重试创建
+            if m_posts is None:
+                from mongodb import MongoAPI
+                m_posts = MongoAPI.for_symbol("post", args.symbol)
+            cur_total = m_posts.count_documents()
             if prev_total is not None:
                 delta = cur_total - prev_total
                 logger.info("Mongo 总量: %d (本页增量 %d)", cur_total, delta)
@@ -161,6 +194,13 @@ def main():
             state[args.symbol] = page
             save_state(state_path, state)
 
+        page += 1
+
+    try:
+        wdm.quit_driver()
+    except Exception:
+        pass
+
     logger.info("抓取结束: pages %d..%d, inserted_estimate=%d, errors=%d",
                 args.start, args.end, inserted_total, len(errors))
     if errors:
@@ -0,0 +1,285 @@
+"""
+scheduler.py
+
+按活跃度分配抓取资源的多股票调度器：
+- 每个 symbol 用 EWMA 估计发帖速率 rate（帖/小时）：有上次抓取时间时用"新帖数 / 间隔"，
+  首次抓取时用本次新帖 post_date/post_time 的时间跨度估计；抓满页数仍有新帖时观测值只是下界。
+- 在全局页预算 budget（页/小时）下用平方根法则分配刷新间隔：
+  最小化按速率加权的平均陈旧度 sum(rate_i * T_i) / 2，约束 sum(depth_i / T_i) <= budget，
+  解为 T_i ∝ sqrt(depth_i / rate_i)；每次抓取的页深 depth_i = ceil(rate_i * T_i * safety / posts_per_page)。
+- 状态（速率、上次抓取时间）保存在 JSON 文件中，重启后继续。
+
+示例：
+    python scheduler.py --symbols 000333 000729 600519 --budget 120 --plan   # 打印计划与预期陈旧度
+    python scheduler.py --symbols 000333 000729 600519 --budget 120 --run --headless
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import datetime
+import argparse
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger("scheduler")
+
+DEFAULT_STATE_PATH = "scheduler_state.json"
+
+
+def _parse_post_time(text: str) -> Optional[float]:
+    try:
+        return datetime.datetime.strptime(text, "%Y-%m-%d %H:%M").timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ActivityScheduler(object):
+
+    def __init__(self, symbols: Iterable[str], budget: float, state_path: Optional[str] = DEFAULT_STATE_PATH,
+                 alpha: float = 0.3, posts_per_page: int = 80, safety: float = 1.5,
+                 min_interval_h: float = 0.25, max_interval_h: float = 72.0, max_depth: int = 50,
+                 default_rate: float = 1.0, min_rate: float = 0.01):
+        """budget: 全局页预算（页/小时）；其余为速率估计与计划的参数。"""
+        self.symbols = list(dict.fromkeys(symbols))
+        self.budget = float(budget)
+        self.state_path = state_path
+        self.alpha = alpha
+        self.posts_per_page = posts_per_page
+        self.safety = safety
+        self.min_interval_h = min_interval_h
+        self.max_interval_h = max_interval_h
+        self.max_depth = max_depth
+        self.default_rate = default_rate
+        self.min_rate = min_rate
+        self.state: Dict[str, dict] = {}
+        self.load()
+        for s in self.symbols:
+            self.state.setdefault(s, {'rate': None, 'last_crawl': None, 'samples': 0})
+
+    # ---- 状态持久化 ----
+
+    def load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        except Exception:
+            logger.exception("[scheduler] load state %s failed, starting fresh", self.state_path)
+            self.state = {}
+
+    def save(self):
+        if not self.state_path:
+            return
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_path)
+
+    # ---- 速率估计 ----
+
+    def rate(self, symbol: str) -> float:
+        r = self.state[symbol].get('rate')
+        return max(r if r is not None else self.default_rate, self.min_rate)
+
+    def observe(self, symbol: str, new_posts: int, post_times: Iterable[str] = (), truncated: bool = False,
+                now: Optional[float] = None) -> float:
+        """
+        记录一次抓取结果并更新速率估计，返回新的速率（帖/小时）。
+        new_posts: 本次新帖数（crawl_post_info 的 'new'，没有时可用 'upserted'）；
+        post_times: 新帖的 "YYYY-MM-DD HH:MM"；truncated: 是否抓满页数仍有新帖（观测值偏低）。
+        """
+        now = now or time.time()
+        st = self.state.setdefault(symbol, {'rate': None, 'last_crawl': None, 'samples': 0})
+        obs = None
+        if st.get('last_crawl'):
+            hours = max((now - st['last_crawl']) / 3600.0, 1.0 / 60)
+            obs = new_posts / hours
+        else:
+            ts = sorted(t for t in (_parse_post_time(p) for p in post_times) if t is not None)
+            if len(ts) >= 2 and ts[-1] > ts[0]:
+                obs = (len(ts) - 1) / ((ts[-1] - ts[0]) / 3600.0)
+
+        if obs is not None:
+            prev = st.get('rate')
+            if prev is None:
+                rate = obs
+            else:
+                rate = self.alpha * obs + (1 - self.alpha) * prev
+            if truncated:
+                rate = max(rate, obs)
+            st['rate'] = max(rate, self.min_rate)
+            st['samples'] = st.get('samples', 0) + 1
+        st['last_crawl'] = now
+        st['last_new'] = new_posts
+        return self.rate(symbol)
+
+    def observe_totals(self, symbol: str, totals: dict, depth: int, now: Optional[float] = None) -> float:
+        """用 PostCrawler.crawl_post_info 的返回值更新速率。"""
+        new_posts = totals.get('new')
+        if new_posts is None:
+            new_posts = totals.get('upserted', 0)
+        truncated = totals.get('stop') == 'depth' and totals.get('pages', 0) >= depth
+        return self.observe(symbol, new_posts, totals.get('new_post_times') or (), truncated=truncated, now=now)
+
+    # ---- 计划 ----
+
+    def _depth_for(self, rate: float, interval_h: float) -> int:
+        return int(min(max(math.ceil(rate * interval_h * self.safety / self.posts_per_page), 1), self.max_depth))
+
+    def _sqrt_intervals(self, rates: Dict[str, float], depth: Dict[str, int]) -> Dict[str, float]:
+        """
+        平方根法则 T_i = sqrt(depth_i / rate_i) * sum_j sqrt(depth_j * rate_j) / budget。
+        被 min/max 间隔截断的 symbol 固定在边界上，剩余预算在其它 symbol 间重新分配。
+        """
+        interval = {}
+        free = set(self.symbols)
+        budget = self.budget
+        while free:
+            norm = sum(math.sqrt(depth[s] * rates[s]) for s in free)
+            if budget <= 0:
+                for s in free:
+                    interval[s] = self.max_interval_h
+                break
+            clamped = {}
+            for s in free:
+                t = math.sqrt(depth[s] / rates[s]) * norm / budget
+                if t < self.min_interval_h:
+                    clamped[s] = self.min_interval_h
+                elif t > self.max_interval_h:
+                    clamped[s] = self.max_interval_h
+                else:
+                    interval[s] = t
+            if not clamped:
+                break
+            for s, t in clamped.items():
+                interval[s] = t
+                free.discard(s)
+                budget -= depth[s] / t
+        return interval
+
+    def plan(self) -> Dict[str, dict]:
+        """返回 {symbol: {'rate', 'interval_h', 'depth', 'next_due'}}，总页速率不超过 budget（受上下限约束时除外）。"""
+        rates = {s: self.rate(s) for s in self.symbols}
+        depth = {s: 1 for s in self.symbols}
+        interval = {}
+        # depth 与 interval 互相依赖，迭代几次即可收敛
+        for _ in range(5):
+            interval = self._sqrt_intervals(rates, depth)
+            depth = {s: self._depth_for(rates[s], interval[s]) for s in self.symbols}
+        interval = self._sqrt_intervals(rates, depth)
+
+        out = {}
+        for s in self.symbols:
+            last = self.state[s].get('last_crawl')
+            out[s] = {
+                'rate': rates[s],
+                'interval_h': interval[s],
+                'depth': depth[s],
+                'next_due': (last + interval[s] * 3600.0) if last else 0.0,
+            }
+        return out
+
+    def uniform_plan(self) -> Dict[str, dict]:
+        """对照：所有 symbol 相同间隔、相同页深，消耗同样的预算。"""
+        rates = {s: self.rate(s) for s in self.symbols}
+        n = len(self.symbols)
+        d = 1
+        for _ in range(5):
+            t = min(max(n * d / self.budget, self.min_interval_h), self.max_interval_h)
+            d = max(self._depth_for(r, t) for r in rates.values())
+        return {s: {'rate': rates[s], 'interval_h': t, 'depth': d, 'next_due': 0.0} for s in self.symbols}
+
+    @staticmethod
+    def expected_staleness(plan: Dict[str, dict]) -> float:
+        """按发帖速率加权的平均陈旧度（小时）：新帖平均要等 T/2 才被抓到。"""
+        total_rate = sum(p['rate'] for p in plan.values())
+        if total_rate <= 0:
+            return 0.0
+        return sum(p['rate'] * p['interval_h'] / 2.0 for p in plan.values()) / total_rate
+
+    @staticmethod
+    def page_rate(plan: Dict[str, dict]) -> float:
+        return sum(p['depth'] / p['interval_h'] for p in plan.values())
+
+    def due(self, now: Optional[float] = None) -> List[tuple]:
+        """返回已到期的 [(symbol, depth)]，按逾期程度（逾期时长 × 速率）从高到低排序。"""
+        now = now or time.time()
+        plan = self.plan()
+        ready = [(s, p) for s, p in plan.items() if p['next_due'] <= now]
+        ready.sort(key=lambda sp: (now - sp[1]['next_due']) * sp[1]['rate'], reverse=True)
+        return [(s, p['depth']) for s, p in ready]
+
+    def seconds_until_next(self, now: Optional[float] = None) -> float:
+        now = now or time.time()
+        return max(min(p['next_due'] for p in self.plan().values()) - now, 0.0)
+
+
+def run_loop(scheduler: ActivityScheduler, headless: bool = True, max_rounds: Optional[int] = None):
+    """按计划循环抓取：每次取最该抓的 symbol，crawl_post_info(1, depth, incremental=True)，更新速率并保存状态。"""
+    from crawler import WebDriverManager, PostCrawler
+
+    wdm = WebDriverManager(headless=headless)
+    crawlers: Dict[str, PostCrawler] = {}
+    rounds = 0
+    try:
+        while max_rounds is None or rounds < max_rounds:
+            ready = scheduler.due()
+            if not ready:
+                wait = scheduler.seconds_until_next()
+                logger.info("[scheduler] nothing due, sleeping %.0fs", wait)
+                time.sleep(min(max(wait, 1.0), 300.0))
+                continue
+            symbol, depth = ready[0]
+            crawler = crawlers.get(symbol)
+            if crawler is None:
+                crawler = PostCrawler(symbol, headless=headless, wdm=wdm)
+                crawlers[symbol] = crawler
+            crawler.driver = wdm.driver or crawler.driver
+            if crawler.driver is None:
+                crawler.driver, crawler.profile = wdm.create_driver()
+            t0 = time.time()
+            totals = crawler.crawl_post_info(1, depth, incremental=True)
+            rate = scheduler.observe_totals(symbol, totals, depth)
+            scheduler.save()
+            rounds += 1
+            logger.info("[scheduler] %s depth %d: %d new posts in %.1fs (stop=%s), rate now %.2f posts/h",
+                        symbol, depth, totals.get('new', 0), time.time() - t0, totals.get('stop'), rate)
+    finally:
+        try:
+            wdm.quit_driver()
+        except Exception:
+            pass
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ap = argparse.ArgumentParser(description="Activity-weighted recrawl scheduler")
+    ap.add_argument("--symbols", nargs="+", required=True, help="股票代码列表")
+    ap.add_argument("--budget", type=float, default=60.0, help="全局页预算（页/小时）")
+    ap.add_argument("--state", default=DEFAULT_STATE_PATH, help="状态文件")
+    ap.add_argument("--max-depth", type=int, default=50, help="单次抓取最大页数")
+    ap.add_argument("--plan", action="store_true", help="打印计划并与均匀调度对比")
+    ap.add_argument("--run", action="store_true", help="按计划循环抓取")
+    ap.add_argument("--rounds", type=int, default=None, help="--run 时最多抓取的次数")
+    ap.add_argument("--headless", action="store_true", help="是否使用 headless 模式")
+    args = ap.parse_args()
+
+    sched = ActivityScheduler(args.symbols, args.budget, state_path=args.state, max_depth=args.max_depth)
+    if args.plan or not args.run:
+        plan = sched.plan()
+        for s, p in sorted(plan.items(), key=lambda kv: kv[1]['interval_h']):
+            logger.info("%s: rate %.2f/h, every %.2fh, depth %d", s, p['rate'], p['interval_h'], p['depth'])
+        uniform = sched.uniform_plan()
+        logger.info("activity plan: %.1f pages/h, expected staleness %.2fh",
+                    sched.page_rate(plan), sched.expected_staleness(plan))
+        logger.info("uniform plan:  %.1f pages/h, expected staleness %.2fh",
+                    sched.page_rate(uniform), sched.expected_staleness(uniform))
+    if args.run:
+        run_loop(sched, headless=args.headless, max_rounds=args.rounds)
+
+
+if __name__ == "__main__":
+    main()
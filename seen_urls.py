@@ -0,0 +1,269 @@
+"""
+seen_urls.py
+
+按 symbol 维护"已见过的帖子 URL"集合，用于微秒级判断帖子是否为新帖，免去一次 Mongo 往返：
+- 帖子数较少时使用精确 set；超过 exact_limit 时改用 Bloom 过滤器（有极低误判率，不会漏判已见 URL）。
+- 启动时从帖子集合仅投影 post_url 加载，爬虫写入成功后增量 add。
+- 可持久化到磁盘（save/load），重启时直接读文件，无需再扫集合。文件记录上次与 Mongo 同步的时间与文档数，
+  load_seen_urls 读取后若集合文档数已变化（其它脚本写入了新帖），只补查同步之后写入的文档（last_crawled 或 ObjectId 时间较新），
+  补查不能解释文档数的增长时整体从 Mongo 重新加载。
+
+PostCrawler 的增量停止（整页都是已见帖子时停止翻页）与 run_comments.py 的跳过已处理帖子都基于它。
+"""
+
+import os
+import gzip
+import json
+import math
+import struct
+import hashlib
+import logging
+import datetime
+import threading
+from typing import Iterable, Optional
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"EMSEEN1\n"
+
+
+class BloomFilter(object):
+    """基于 bytearray 的 Bloom 过滤器，使用 blake2b 的两个 64 位哈希做双重哈希。"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001, num_bits: Optional[int] = None,
+                 num_hashes: Optional[int] = None):
+        capacity = max(1, capacity)
+        if num_bits is None:
+            num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        if num_hashes is None:
+            num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        self.capacity = capacity
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> bool:
+        """加入 key，返回加入前是否"可能已存在"。"""
+        present = True
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        if not present:
+            self.count += 1
+        return present
+
+    def __contains__(self, key: str) -> bool:
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+
+class SeenURLSet(object):
+    """精确 set / Bloom 过滤器二选一的已见 URL 集合，线程安全。"""
+
+    def __init__(self, symbol: str, expected: int = 0, exact_limit: int = 200000, error_rate: float = 0.001):
+        self.symbol = symbol
+        self.exact_limit = exact_limit
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        # 上次与 Mongo 同步（from_mongo / top_up）时的 UTC 时间与集合文档数，随文件保存
+        self.synced_at: Optional[datetime.datetime] = None
+        self.synced_count: Optional[int] = None
+        if expected > exact_limit:
+            # 为后续增长留出余量，避免 Bloom 过满导致误判率上升
+            self._store = BloomFilter(capacity=expected * 2, error_rate=error_rate)
+        else:
+            self._store = set()
+
+    @property
+    def is_exact(self) -> bool:
+        return isinstance(self._store, set)
+
+    def add(self, url: str) -> bool:
+        """加入 URL，返回加入前是否已见过。"""
+        if not url:
+            return False
+        with self._lock:
+            if self.is_exact:
+                if url in self._store:
+                    return True
+                self._store.add(url)
+                if len(self._store) > self.exact_limit:
+                    self._to_bloom()
+                return False
+            return self._store.add(url)
+
+    def update(self, urls: Iterable[str]):
+        for u in urls:
+            self.add(u)
+
+    def _to_bloom(self):
+        urls = self._store
+        bloom = BloomFilter(capacity=len(urls) * 2, error_rate=self.error_rate)
+        for u in urls:
+            bloom.add(u)
+        self._store = bloom
+        logger.info("[SeenURLSet %s] switched to Bloom filter at %d urls", self.symbol, len(urls))
+
+    def __contains__(self, url: str) -> bool:
+        return bool(url) and url in self._store
+
+    def __len__(self):
+        return len(self._store)
+
+    # ---- 加载 / 持久化 ----
+
+    @classmethod
+    def from_mongo(cls, coll, symbol: str, field: str = 'post_url', exact_limit: int = 200000,
+                   error_rate: float = 0.001, query: Optional[dict] = None):
+        """
+        从集合只投影 field 加载（帖子集合用 post_url；评论集合可用 post_id 得到"已抓过评论的帖子"）。
+        query 用于在共享集合中限定范围，如 unified 布局下的 {'symbol': symbol}。
+        """
+        synced_at = datetime.datetime.utcnow()
+        try:
+            expected = _doc_count(coll, query)
+        except Exception:
+            expected = None
+        seen = cls(symbol, expected=expected or 0, exact_limit=exact_limit, error_rate=error_rate)
+        flt = dict(query or {}, **{field: {'$exists': True}})
+        for d in coll.find(flt, {'_id': 0, field: 1}, batch_size=10000):
+            seen.add(d.get(field))
+        # 先取时间与计数再扫描：扫描期间写入的文档下次会被补查到
+        seen.synced_at, seen.synced_count = synced_at, expected
+        logger.info("[SeenURLSet %s] loaded %d urls from %s (%s)", symbol, len(seen), coll.name,
+                    "exact" if seen.is_exact else "bloom")
+        return seen
+
+    def top_up(self, coll, field: str = 'post_url', query: Optional[dict] = None,
+               count: Optional[int] = None) -> int:
+        """
+        补查上次同步之后写入或更新的文档（last_crawled 不早于 synced_at，或 ObjectId 生成时间不早于 synced_at），
+        返回匹配的文档数；同步时间与文档数更新为本次（count 为调用方刚取得的文档数）。
+        """
+        now = datetime.datetime.utcnow()
+        since = self.synced_at
+        # ObjectId 只精确到秒：向上取整，宁可少匹配（导致整体重新加载）也不把同步前的文档算进来
+        oid_since = ObjectId.from_datetime(since.replace(microsecond=0) + datetime.timedelta(seconds=1))
+        newer = {'$or': [{'last_crawled': {'$gte': since}}, {'_id': {'$gte': oid_since}}]}
+        flt = {'$and': [dict(query or {}, **{field: {'$exists': True}}), newer]}
+        matched = 0
+        for d in coll.find(flt, {'_id': 0, field: 1}, batch_size=10000):
+            self.add(d.get(field))
+            matched += 1
+        self.synced_at, self.synced_count = now, count
+        return matched
+
+    def save(self, path: str):
+        """写入 gzip 文件：头部一行 JSON 元数据，之后是 URL 列表（精确）或位数组（Bloom）。先写临时文件再替换。"""
+        tmp = f"{path}.tmp"
+        with self._lock:
+            if self.is_exact:
+                meta = {'symbol': self.symbol, 'kind': 'exact', 'count': len(self._store)}
+                payload = "\n".join(self._store).encode('utf-8')
+            else:
+                b = self._store
+                meta = {'symbol': self.symbol, 'kind': 'bloom', 'count': b.count, 'capacity': b.capacity,
+                        'num_bits': b.num_bits, 'num_hashes': b.num_hashes}
+                payload = bytes(b.bits)
+            if self.synced_at is not None:
+                meta['synced_at'] = self.synced_at.isoformat()
+                meta['synced_count'] = self.synced_count
+        with gzip.open(tmp, 'wb', compresslevel=1) as f:
+            f.write(_MAGIC)
+            f.write(json.dumps(meta).encode('utf-8') + b"\n")
+            f.write(payload)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, exact_limit: int = 200000, error_rate: float = 0.001):
+        with gzip.open(path, 'rb') as f:
+            if f.readline() != _MAGIC:
+                raise ValueError(f"{path} is not a seen-url file")
+            meta = json.loads(f.readline())
+            payload = f.read()
+        seen = cls(meta.get('symbol', ''), exact_limit=exact_limit, error_rate=error_rate)
+        if meta['kind'] == 'exact':
+            seen._store = set(u for u in payload.decode('utf-8').split("\n") if u)
+        else:
+            b = BloomFilter(meta['capacity'], num_bits=meta['num_bits'], num_hashes=meta['num_hashes'])
+            b.bits = bytearray(payload)
+            b.count = meta['count']
+            seen._store = b
+        if meta.get('synced_at'):
+            seen.synced_at = datetime.datetime.fromisoformat(meta['synced_at'])
+            seen.synced_count = meta.get('synced_count')
+        return seen
+
+
+def _doc_count(coll, query: Optional[dict] = None) -> int:
+    return coll.count_documents(query) if query else coll.estimated_document_count()
+
+
+def load_seen_urls(coll, symbol: str, path: Optional[str] = None, field: str = 'post_url',
+                   query: Optional[dict] = None, **kwargs) -> SeenURLSet:
+    """
+    优先读取持久化文件，并与 Mongo 对账：集合文档数与文件记录的一致时直接使用；
+    文档数有变化时补查同步之后写入的文档，补查到的文档数少于文档增长数（写入方没有 last_crawled 且 _id 不是 ObjectId）
+    或文件没有同步信息（旧版本写入）时从 Mongo 重新加载。失败或文件不存在时从 Mongo 加载。结果在给出 path 时写回文件。
+    """
+    if path and os.path.exists(path):
+        try:
+            seen = SeenURLSet.load(path, **kwargs)
+            logger.info("[SeenURLSet %s] loaded %d urls from %s", symbol, len(seen), path)
+            if seen.synced_at is None or seen.synced_count is None:
+                raise ValueError("file has no sync info")
+            count = _doc_count(coll, query)
+            if count == seen.synced_count:
+                return seen
+            grown = count - seen.synced_count
+            matched = seen.top_up(coll, field=field, query=query, count=count)
+            if matched >= grown:
+                logger.info("[SeenURLSet %s] topped up %d docs written since last sync", symbol, matched)
+                _save_quietly(seen, symbol, path)
+                return seen
+            logger.info("[SeenURLSet %s] %d new docs but only %d found by top-up, reloading from Mongo",
+                        symbol, grown, matched)
+        except Exception as e:
+            logger.warning("[SeenURLSet %s] load %s failed (%s), reloading from Mongo", symbol, path, e)
+    seen = SeenURLSet.from_mongo(coll, symbol, field=field, query=query, **kwargs)
+    if path:
+        _save_quietly(seen, symbol, path)
+    return seen
+
+
+def _save_quietly(seen: SeenURLSet, symbol: str, path: str):
+    try:
+        seen.save(path)
+    except OSError as e:
+        logger.warning("[SeenURLSet %s] save %s failed: %s", symbol, path, e)
+
+
+def load_comment_done(m_comments, symbol: str, path: Optional[str] = None) -> SeenURLSet:
+    """
+    "已抓过评论的帖子"集合：评论集合中的 post_id（经 load_seen_urls 读文件并对账）加上
+    m_comments.no_comment_posts() 记录的确认没有评论的帖子（它们在评论集合里没有文档，重新加载时会丢失）。
+    m_comments 为评论集合的 MongoAPI。
+    """
+    done = load_seen_urls(m_comments.coll, symbol, path=path, field='post_id', query=m_comments.scope)
+    empty = m_comments.no_comment_posts()
+    done.update(empty)
+    if empty:
+        logger.info("[SeenURLSet %s] %d posts recorded as having no comments", symbol, len(empty))
+    return done
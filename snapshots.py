@@ -0,0 +1,121 @@
+"""
+snapshots.py
+
+post_view / comment_num 的历史快照：upsert_many 会原地覆盖这两个字段，这里把每次变化追加为一条
+(post, 时间, 阅读, 评论) 观测，供分析使用，代替整库导出 JSON 备份的做法。
+- mode='timeseries'：写入 Mongo 时间序列集合 post_snapshots（MongoDB 5.0+），按 meta 自动分桶压缩。
+- mode='bucket'：写入普通集合 post_snapshots_hourly，每个帖子每小时一条文档，观测 $push 到 obs 数组。
+只有值与上次观测不同才追加（用 ChangeCache 记住每帖最后的值，启动时从帖子集合预热）。
+
+通过 MongoAPI.add_change_listener(sink.record) 挂到写入路径上；PostCrawler(snapshot_mode=...) 会自动完成。
+"""
+
+import datetime
+import logging
+import threading
+from typing import Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from mongodb import ChangeCache
+
+logger = logging.getLogger('eastmoney_crawler.snapshots')
+
+TIMESERIES_COLLECTION = 'post_snapshots'
+BUCKET_COLLECTION = 'post_snapshots_hourly'
+MODES = ('timeseries', 'bucket')
+
+
+class SnapshotSink(object):
+
+    def __init__(self, db, symbol: str, mode: str = 'timeseries', max_tracked: int = 200000):
+        if mode not in MODES:
+            raise ValueError(f"unknown snapshot mode {mode!r}, expected one of {MODES}")
+        self.db = db
+        self.symbol = symbol
+        self.mode = mode
+        self._last = ChangeCache(max_size=max_tracked)
+        if mode == 'timeseries':
+            self.coll = self._ensure_timeseries(db)
+        else:
+            self.coll = db[BUCKET_COLLECTION]
+            try:
+                self.coll.create_index([('symbol', 1), ('post', 1), ('hour', 1)])
+            except PyMongoError:
+                logger.debug("[SnapshotSink] create bucket index failed", exc_info=True)
+
+    @staticmethod
+    def _ensure_timeseries(db):
+        if TIMESERIES_COLLECTION not in db.list_collection_names():
+            try:
+                db.create_collection(TIMESERIES_COLLECTION, timeseries={
+                    'timeField': 'ts', 'metaField': 'meta', 'granularity': 'hours'})
+            except CollectionInvalid:
+                pass  # 其它进程已创建
+        return db[TIMESERIES_COLLECTION]
+
+    def warm(self, posts_coll, query=None):
+        """以帖子集合当前的 post_view/comment_num 作为"上次观测"，避免重启后为未变化的帖子重复追加。"""
+        n = self._last.warm(posts_coll, query)
+        logger.info("[SnapshotSink %s] tracking %d posts", self.symbol, n)
+        return n
+
+    @staticmethod
+    def _post_key(doc):
+        return doc.get('_id') or doc.get('post_url')
+
+    def record(self, docs, now: Optional[datetime.datetime] = None) -> int:
+        """追加有变化的观测，返回追加条数。可直接作为 MongoAPI 的 change listener。"""
+        now = now or datetime.datetime.utcnow()
+        changed = []
+        for d in docs:
+            if not d.get('post_url') or self._last.is_unchanged(d):
+                continue
+            changed.append(d)
+        if not changed:
+            return 0
+
+        try:
+            if self.mode == 'timeseries':
+                self.coll.insert_many([{
+                    'ts': now,
+                    'meta': {'symbol': self.symbol, 'post': self._post_key(d)},
+                    'view': d.get('post_view'),
+                    'comments': d.get('comment_num'),
+                } for d in changed], ordered=False)
+            else:
+                hour = now.replace(minute=0, second=0, microsecond=0)
+                ops = []
+                for d in changed:
+                    post = self._post_key(d)
+                    ops.append(UpdateOne(
+                        {'_id': f"{post}:{hour:%Y%m%d%H}"},
+                        {'$setOnInsert': {'symbol': self.symbol, 'post': post, 'hour': hour},
+                         '$push': {'obs': {'t': now, 'v': d.get('post_view'), 'c': d.get('comment_num')}},
+                         '$inc': {'n': 1}},
+                        upsert=True))
+                self.coll.bulk_write(ops, ordered=False)
+        except PyMongoError:
+            logger.exception("[SnapshotSink %s] append snapshots 错误", self.symbol)
+            return 0
+
+        self._last.update(changed)
+        return len(changed)
+
+
+# 同一进程内按 (db, symbol, mode) 共享 sink，run_pages.py 每页新建 crawler 时不必重复预热
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_snapshot_sink(mongo, symbol: str, mode: str) -> SnapshotSink:
+    """返回（必要时创建并预热）symbol 的快照 sink；mongo 为该 symbol 帖子集合的 MongoAPI。"""
+    key = (mongo.db_name, symbol, mode)
+    with _sinks_lock:
+        sink = _sinks.get(key)
+        if sink is None:
+            sink = SnapshotSink(mongo.db, symbol, mode=mode)
+            sink.warm(mongo.coll, mongo.scope)
+            _sinks[key] = sink
+    return sink
@@ -0,0 +1,233 @@
+"""
+tail.py
+
+实时跟踪（tail）模式：对一批股票的列表第 1 页做短间隔轮询，只把新出现的帖子写入 Mongo 并推送给回调/队列。
+- mode='http'（默认）：requests 直接获取列表页 HTML，解析页内嵌的 article_list JSON，无需浏览器。
+- mode='browser'：保持一个浏览器，每次 driver.get 后用一次 execute_script 读取 window.article_list。
+判断"新帖"用两层：与上一次轮询的 URL 集合求差（零成本过滤掉大部分行），
+再查已见 URL 集合（SeenURLSet）——列表默认按最后回复时间排序，老帖被回复后也会回到第 1 页，不能算新帖。
+每次轮询只 upsert 新帖，不会重写整页 80 行。
+
+示例：python tail.py --symbols 000333 600519 --interval 5
+"""
+
+import time
+import queue
+import random
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from parser import PostParser, guba_base_url
+from seen_urls import SeenURLSet, load_seen_urls
+
+logger = logging.getLogger("tail")
+
+LIST_URL = "{base}/list,{symbol},1.html"
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/120.0 Safari/537.36")
+
+ARTICLE_LIST_JS = "return window.article_list || null;"
+
+
+class TailMonitor(object):
+    """
+    callback(symbol, docs) 与 out_queue（元素为 (symbol, doc)）二选一或同时使用；
+    store=True 时新帖通过 MongoAPI.for_symbol('post', symbol).upsert_many 写入。
+    """
+
+    def __init__(self, symbols: Iterable[str], interval: float = 5.0, mode: str = "http",
+                 callback: Optional[Callable[[str, List[dict]], None]] = None, out_queue: Optional[queue.Queue] = None,
+                 store: bool = True, max_workers: int = 8, timeout: float = 5.0, headless: bool = True,
+                 client=None):
+        if mode not in ("http", "browser"):
+            raise ValueError(f"unknown tail mode: {mode}")
+        self.symbols = list(dict.fromkeys(symbols))
+        self.interval = interval
+        self.mode = mode
+        self.callback = callback
+        self.out_queue = out_queue
+        self.store = store
+        self.timeout = timeout
+        self.headless = headless
+        self.client = client
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=1 if mode == "browser" else max_workers,
+                                        thread_name_prefix="tail")
+        self._session = requests.Session()
+        self._session.headers.update({"User-Agent": USER_AGENT, "Referer": "https://guba.eastmoney.com/"})
+        self._wdm = None
+        self._parsers: Dict[str, PostParser] = {s: PostParser() for s in self.symbols}
+        self._last: Dict[str, set] = {}
+        self._seen: Dict[str, SeenURLSet] = {}
+        self._mongo = {}
+        self.stats = {'polls': 0, 'errors': 0, 'new': 0, 'poll_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+
+    # ---- 初始化 ----
+
+    def _mongo_for(self, symbol: str):
+        m = self._mongo.get(symbol)
+        if m is None:
+            from mongodb import MongoAPI
+            m = MongoAPI.for_symbol("post", symbol, client=self.client)
+            self.client = self.client or m.client
+            self._mongo[symbol] = m
+        return m
+
+    def _seen_for(self, symbol: str) -> SeenURLSet:
+        seen = self._seen.get(symbol)
+        if seen is None:
+            if self.store:
+                m = self._mongo_for(symbol)
+                seen = load_seen_urls(m.coll, symbol, path=f"seen_post_{symbol}.bin", query=m.scope)
+            else:
+                seen = SeenURLSet(symbol)
+            self._seen[symbol] = seen
+        return seen
+
+    # ---- 获取第 1 页 ----
+
+    def _fetch_http(self, symbol: str) -> List[dict]:
+        resp = self._session.get(LIST_URL.format(base=guba_base_url(), symbol=symbol), timeout=self.timeout)
+        resp.raise_for_status()
+        data = PostParser.extract_article_list(resp.text)
+        if data is None:
+            logger.warning("[tail %s] article_list not found in list page", symbol)
+            return []
+        return self._parsers[symbol].parse_article_list(data, symbol=symbol)
+
+    def _fetch_browser(self, symbol: str) -> List[dict]:
+        if self._wdm is None:
+            from crawler import WebDriverManager
+            self._wdm = WebDriverManager(headless=self.headless)
+            self._wdm.create_driver()
+        driver = self._wdm.driver
+        driver.get(LIST_URL.format(base=guba_base_url(), symbol=symbol))
+        data = driver.execute_script(ARTICLE_LIST_JS)
+        return self._parsers[symbol].parse_article_list(data, symbol=symbol)
+
+    # ---- 轮询 ----
+
+    def poll(self, symbol: str) -> List[dict]:
+        """轮询一次 symbol 的第 1 页，返回新帖（已写入并推送）。"""
+        t0 = time.time()
+        try:
+            docs = self._fetch_http(symbol) if self.mode == "http" else self._fetch_browser(symbol)
+        except Exception as e:
+            with self._stats_lock:
+                self.stats['errors'] += 1
+            logger.warning("[tail %s] poll error: %s", symbol, e)
+            return []
+
+        urls = {d['post_url'] for d in docs}
+        first = symbol not in self._last
+        prev = self._last.get(symbol, set())
+        seen = self._seen_for(symbol)
+        if first and len(seen) == 0:
+            # 没有任何历史（如 store=False）：第一次轮询只作为基线，不把整页当作新帖
+            seen.update(urls)
+        new_docs = [d for d in docs if d['post_url'] not in prev and d['post_url'] not in seen]
+
+        if new_docs:
+            from mongodb import post_doc_id
+            for d in new_docs:
+                # 与 PostCrawler._parse_and_store 相同的稳定 _id
+                d['_id'] = post_doc_id(d['post_url'])
+            if self.store:
+                res = self._mongo_for(symbol).upsert_many(new_docs, id_field='_id')
+                if 'error' in res:
+                    logger.error("[tail %s] upsert error: %s", symbol, res)
+                    # 写入失败的帖子不能进入"上一次轮询"集合，否则下一次会被差集过滤掉、永远不会再写入
+                    self._last[symbol] = urls - {d['post_url'] for d in new_docs}
+                    with self._stats_lock:
+                        self.stats['errors'] += 1
+                    return []
+            seen.update(d['post_url'] for d in new_docs)
+            self._deliver(symbol, new_docs)
+            logger.info("[tail %s] %d new posts: %s", symbol, len(new_docs),
+                        [d['post_title'][:20] for d in new_docs[:3]])
+        self._last[symbol] = urls
+
+        with self._stats_lock:
+            self.stats['polls'] += 1
+            self.stats['new'] += len(new_docs)
+            self.stats['poll_seconds'] += time.time() - t0
+        return new_docs
+
+    def _deliver(self, symbol: str, docs: List[dict]):
+        if self.callback is not None:
+            try:
+                self.callback(symbol, docs)
+            except Exception:
+                logger.exception("[tail %s] callback error", symbol)
+        if self.out_queue is not None:
+            for d in docs:
+                self.out_queue.put((symbol, d))
+
+    def run(self, max_rounds: Optional[int] = None):
+        """每 interval 秒并发轮询全部 symbol，直到 stop() 或达到 max_rounds。"""
+        logger.info("[tail] tailing %d symbols every %.1fs (%s)", len(self.symbols), self.interval, self.mode)
+        rounds = 0
+        try:
+            # 预先加载各 symbol 的 Mongo 连接与已见集合，避免在轮询线程里并发初始化
+            for symbol in self.symbols:
+                self._seen_for(symbol)
+            while not self._stop.is_set() and (max_rounds is None or rounds < max_rounds):
+                t0 = time.time()
+                list(self._pool.map(self.poll, self.symbols))
+                rounds += 1
+                # 轻微抖动，避免请求节奏完全固定
+                wait = self.interval * (0.9 + random.random() * 0.2) - (time.time() - t0)
+                if wait > 0:
+                    self._stop.wait(wait)
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self._session.close()
+        # store=False 时集合不含 Mongo 历史，不能覆盖 PostCrawler 共用的持久化文件
+        for symbol, seen in (self._seen.items() if self.store else ()):
+            try:
+                seen.save(f"seen_post_{symbol}.bin")
+            except OSError as e:
+                logger.warning("[tail %s] save seen urls error: %s", symbol, e)
+        if self._wdm is not None:
+            try:
+                self._wdm.quit_driver()
+            except Exception:
+                pass
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s")
+    ap = argparse.ArgumentParser(description="Tail page 1 of guba lists for new posts")
+    ap.add_argument("--symbols", nargs="+", required=True, help="股票代码列表")
+    ap.add_argument("--interval", type=float, default=5.0, help="轮询间隔（秒）")
+    ap.add_argument("--mode", choices=["http", "browser"], default="http")
+    ap.add_argument("--no-store", action="store_true", help="只打印新帖，不写 Mongo")
+    ap.add_argument("--rounds", type=int, default=None, help="最多轮询轮数")
+    ap.add_argument("--headless", action="store_true", help="browser 模式是否 headless")
+    args = ap.parse_args()
+
+    monitor = TailMonitor(args.symbols, interval=args.interval, mode=args.mode, store=not args.no_store,
+                          headless=args.headless,
+                          callback=lambda s, docs: [print(s, d['post_date'], d['post_time'], d['post_title'])
+                                                    for d in docs])
+    try:
+        monitor.run(max_rounds=args.rounds)
+    except KeyboardInterrupt:
+        monitor.stop()
+    logger.info("[tail] stats: %s", monitor.stats)
+
+
+if __name__ == "__main__":
+    main()
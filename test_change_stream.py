@@ -0,0 +1,129 @@
+"""
+test_change_stream.py
+
+ChangeStreamConsumer 的集成测试：分批、按操作类型过滤、重启后从保存的 token 续读、handler 失败时重试。
+change stream 需要副本集，设置 MONGO_RS_URI（如 mongodb://localhost:27017/?replicaSet=rs0）后运行，未设置时跳过：
+    python -m pytest test_change_stream.py
+    python test_change_stream.py
+测试只写入临时集合 post_zzcs{pid}（per_symbol 布局），结束后删除集合与 resume token。
+"""
+
+import os
+import threading
+import unittest
+
+from pymongo import MongoClient
+
+from mongodb import ChangeStreamConsumer, KIND_COLLECTIONS
+
+MONGO_RS_URI = os.environ.get("MONGO_RS_URI")
+
+
+@unittest.skipUnless(MONGO_RS_URI, "MONGO_RS_URI not set (change streams need a replica set)")
+class ChangeStreamConsumerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = MongoClient(MONGO_RS_URI, serverSelectionTimeoutMS=3000)
+        db_name, prefix, _ = KIND_COLLECTIONS["post"]
+        cls.symbol = f"zzcs{os.getpid()}"
+        cls.db = cls.client[db_name]
+        cls.coll = cls.db[f"{prefix}{cls.symbol}"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+
+    def setUp(self):
+        self.name = f"test_change_stream_{os.getpid()}_{self._testMethodName}"
+        self.coll.drop()
+
+    def tearDown(self):
+        self.coll.drop()
+        self.consumer().reset_token()
+
+    def consumer(self, **kwargs):
+        return ChangeStreamConsumer(self.client, self.name, kind="post", symbols=[self.symbol], layout="per_symbol",
+                                    **kwargs)
+
+    def start_from_now(self):
+        """保存"当前时刻"的 token，之后写入的事件都能被 run() 读到，不依赖线程启动时序。"""
+        c = self.consumer()
+        with c._watch(None) as stream:
+            stream.try_next()
+            c.save_token(stream.resume_token)
+
+    def drain(self, consumer, events, timeout=30):
+        """反复 run(max_batches=1) 直到累计处理 events 个事件；超时由定时器 stop()。"""
+        timer = threading.Timer(timeout, consumer.stop)
+        timer.start()
+        try:
+            while consumer.stats["events"] < events and not consumer._stop.is_set():
+                consumer.run(max_batches=1)
+        finally:
+            timer.cancel()
+        self.assertEqual(consumer.stats["events"], events)
+
+    def test_batching(self):
+        self.start_from_now()
+        self.coll.insert_many([{"_id": i, "post_view": i} for i in range(5)])
+        c = self.consumer(batch_size=2)
+        sizes = []
+        c.add_handler(lambda events: sizes.append(len(events)))
+        self.drain(c, 5)
+        self.assertEqual(sum(sizes), 5)
+        self.assertTrue(all(n <= 2 for n in sizes), sizes)
+        self.assertEqual(c.stats["handler_errors"], 0)
+
+    def test_handler_filtering(self):
+        self.start_from_now()
+        self.coll.insert_many([{"_id": 1, "post_view": 1}, {"_id": 2, "post_view": 2}])
+        self.coll.update_one({"_id": 1}, {"$set": {"post_view": 10}})
+        c = self.consumer()
+        all_ops, updates = [], []
+        c.add_handler(lambda events: all_ops.extend(e["op"] for e in events))
+        c.add_handler(lambda events: updates.extend(events), operation_types=["update"])
+        self.drain(c, 3)
+        self.assertEqual(sorted(all_ops), ["insert", "insert", "update"])
+        self.assertEqual([(e["_id"], e["updated"]) for e in updates], [(1, {"post_view": 10})])
+        self.assertEqual(updates[0]["symbol"], self.symbol)
+        self.assertEqual(updates[0]["doc"]["post_view"], 10)
+
+    def test_resume_after_restart(self):
+        self.start_from_now()
+        self.coll.insert_many([{"_id": i} for i in range(3)])
+        first = self.consumer()
+        seen = []
+        first.add_handler(lambda events: seen.extend(e["_id"] for e in events))
+        self.drain(first, 3)
+
+        self.coll.insert_many([{"_id": i} for i in range(3, 5)])
+        second = self.consumer()
+        resumed = []
+        second.add_handler(lambda events: resumed.extend(e["_id"] for e in events))
+        self.drain(second, 2)
+        self.assertEqual(sorted(seen), [0, 1, 2])
+        self.assertEqual(sorted(resumed), [3, 4])
+
+    def test_failed_handler_is_retried_before_token_advances(self):
+        self.start_from_now()
+        self.coll.insert_many([{"_id": i} for i in range(2)])
+        c = self.consumer()
+        calls, ok = [], []
+
+        def flaky(events):
+            calls.append(len(events))
+            if len(calls) == 1:
+                raise ValueError("first delivery fails")
+
+        c.add_handler(flaky)
+        c.add_handler(lambda events: ok.extend(e["_id"] for e in events))
+        self.drain(c, 2)
+        self.assertEqual(c.stats["handler_errors"], 1)
+        self.assertEqual(sum(calls[1:]), 2)
+        # 成功的 handler 不会因为别的 handler 失败而收到重复事件
+        self.assertEqual(sorted(ok), [0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
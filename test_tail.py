@@ -0,0 +1,79 @@
+"""
+test_tail.py
+
+TailMonitor.poll 的单元测试：列表页获取与 Mongo 写入都用内存替身，不需要网络与 MongoDB。
+    python -m pytest test_tail.py
+    python test_tail.py
+"""
+
+import queue
+import unittest
+
+from seen_urls import SeenURLSet
+from tail import TailMonitor
+
+SYMBOL = "000333"
+
+
+def _doc(n):
+    return {"post_url": f"/news,{SYMBOL},{n}.html", "post_title": f"post {n}", "post_view": 1, "comment_num": 0}
+
+
+class FakeMongo(object):
+    """记录 upsert_many 调用；fail 次数用完之前返回带 error 的 summary（与 MongoAPI 出错时相同）。"""
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.stored = []
+
+    def upsert_many(self, docs, id_field="_id"):
+        if self.fail > 0:
+            self.fail -= 1
+            return {"upserted_count": 0, "matched_count": 0, "modified_count": 0, "error": "connection reset"}
+        self.stored.extend(d["post_url"] for d in docs)
+        return {"upserted_count": len(docs), "matched_count": 0, "modified_count": 0}
+
+
+class TailPollTest(unittest.TestCase):
+
+    def monitor(self, pages, mongo):
+        out = queue.Queue()
+        mon = TailMonitor([SYMBOL], out_queue=out, store=True)
+        mon._mongo[SYMBOL] = mongo
+        # 已见集合里只有一个旧帖，第一次轮询不会被当作基线
+        seen = SeenURLSet(SYMBOL)
+        seen.add(_doc(0)["post_url"])
+        mon._seen[SYMBOL] = seen
+        pages = iter(pages)
+        mon._fetch_http = lambda symbol: [dict(d) for d in next(pages)]
+        self.addCleanup(mon._pool.shutdown)
+        self.addCleanup(mon._session.close)
+        return mon, out
+
+    def test_new_posts_are_stored_and_delivered(self):
+        mongo = FakeMongo()
+        mon, out = self.monitor([[_doc(0), _doc(1)], [_doc(0), _doc(1), _doc(2)]], mongo)
+        self.assertEqual([d["post_url"] for d in mon.poll(SYMBOL)], [_doc(1)["post_url"]])
+        self.assertEqual([d["post_url"] for d in mon.poll(SYMBOL)], [_doc(2)["post_url"]])
+        self.assertEqual(mongo.stored, [_doc(1)["post_url"], _doc(2)["post_url"]])
+        self.assertEqual(out.qsize(), 2)
+
+    def test_posts_from_failed_upsert_are_retried_on_next_poll(self):
+        mongo = FakeMongo(fail=1)
+        page = [_doc(0), _doc(1), _doc(2)]
+        mon, out = self.monitor([page, page], mongo)
+
+        self.assertEqual(mon.poll(SYMBOL), [])
+        self.assertEqual(mongo.stored, [])
+        self.assertTrue(out.empty())
+        self.assertEqual(mon.stats["errors"], 1)
+
+        new = mon.poll(SYMBOL)
+        expected = [_doc(1)["post_url"], _doc(2)["post_url"]]
+        self.assertEqual([d["post_url"] for d in new], expected)
+        self.assertEqual(mongo.stored, expected)
+        self.assertEqual([out.get_nowait()[1]["post_url"] for _ in range(out.qsize())], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
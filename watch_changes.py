@@ -0,0 +1,76 @@
+"""
+watch_changes.py
+
+用 mongodb.ChangeStreamConsumer 跟踪帖子 / 评论集合的插入与更新，每批打印一行汇总（或以 --jsonl 逐条输出事件），
+可作为下游增量任务的模板或用来检查 change stream 是否可用。位置保存在 change_stream_tokens（_id 为 --name），
+Ctrl+C 后重新运行会从上次的位置继续；--reset 丢弃已保存的位置、从当前时刻开始。
+需要副本集（单节点副本集即可，见 README）。
+
+示例：python watch_changes.py --kind post --symbols 000333 600519
+      python watch_changes.py --kind comment --name comment_export --jsonl > comments.jsonl
+"""
+
+import os
+import sys
+import logging
+import argparse
+from collections import Counter
+
+from bson import json_util
+from pymongo import MongoClient
+
+from mongodb import ChangeStreamConsumer
+
+logger = logging.getLogger("watch_changes")
+
+_JSON_OPTIONS = json_util.JSONOptions(json_mode=json_util.JSONMode.RELAXED, tz_aware=False)
+
+
+def print_summary(events):
+    ops = Counter(e["op"] for e in events)
+    symbols = Counter(e["symbol"] for e in events)
+    logger.info("%d events %s, symbols: %s", len(events), dict(ops), dict(symbols.most_common(5)))
+
+
+def print_jsonl(events):
+    for e in events:
+        print(json_util.dumps(e, json_options=_JSON_OPTIONS, ensure_ascii=False))
+    sys.stdout.flush()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
+                        stream=sys.stderr)
+    ap = argparse.ArgumentParser(description="Tail inserts/updates on crawler collections via change streams")
+    ap.add_argument("--uri", default=os.environ.get("MONGO_URI") or "mongodb://localhost:27017")
+    ap.add_argument("--name", default="watch_changes", help="消费者名称（resume token 的 _id）")
+    ap.add_argument("--kind", choices=["post", "comment"], default="post")
+    ap.add_argument("--symbols", nargs="*", default=None, help="只跟踪这些股票（默认全部）")
+    ap.add_argument("--layout", choices=["per_symbol", "unified"], default=None,
+                    help="存储布局（默认取 EM_STORAGE_LAYOUT）")
+    ap.add_argument("--batch-size", type=int, default=500)
+    ap.add_argument("--max-wait", type=float, default=0.5, help="一批最多等待的秒数")
+    ap.add_argument("--jsonl", action="store_true", help="逐条输出事件（Extended JSON）到 stdout")
+    ap.add_argument("--reset", action="store_true", help="丢弃已保存的位置，从当前时刻开始")
+    args = ap.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    consumer = ChangeStreamConsumer(client, args.name, kind=args.kind, symbols=args.symbols, layout=args.layout,
+                                    batch_size=args.batch_size, max_wait=args.max_wait)
+    if args.reset:
+        consumer.reset_token()
+    consumer.add_handler(print_jsonl if args.jsonl else print_summary)
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        consumer.stop()
+    except RuntimeError as e:
+        logger.error("%s", e)
+        sys.exit(1)
+    finally:
+        client.close()
+    logger.info("[watch_changes] stats: %s", consumer.stats)
+
+
+if __name__ == "__main__":
+    main()